@@ -0,0 +1,235 @@
+# background.py
+
+import json
+import os
+import queue
+import random
+import threading
+import time
+import traceback
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+from langgraph.store.base import BaseStore
+
+from ..utils.metrics import metrics
+
+load_dotenv()
+
+MAX_ATTEMPTS = int(os.getenv("MEMORY_JOB_MAX_ATTEMPTS", "3"))
+WORKER_COUNT = int(os.getenv("MEMORY_JOB_WORKERS", "2"))
+STALE_RUNNING_SECONDS = int(os.getenv("MEMORY_JOB_STALE_SECONDS", "600"))
+
+
+def deferred_memory_default() -> bool:
+    """是否默认开启"先回复、后台抽取记忆"模式"""
+    return os.getenv("AGENT_DEFERRED_MEMORY", "0") == "1"
+
+
+class MemoryJobQueue:
+    """
+    进程内的后台记忆抽取队列
+    - 任务先写入 Postgres（memory_jobs 表），再投递到内存队列由工作线程执行
+    - 幂等键去重：同一次工具调用只会生成一个任务
+    - 失败按指数退避重试，超过 MAX_ATTEMPTS 标记为 failed
+    - 进程重启时恢复未完成的任务
+    - 持久化时未完成任务数与完成事件从 memory_jobs 表读取，任何 worker 都能看到其他 worker 执行的任务
+    数据库不可用时退化为纯内存队列（不持久化）
+    """
+
+    def __init__(self, store: BaseStore, handlers: dict[str, Callable], dao=None):
+        """
+        :param store: 节点函数使用的长期记忆 store
+        :param handlers: update_type -> 节点函数（update_profile / update_todos / update_instructions）
+        :param dao: MemoryJobDao，为 None 时不持久化
+        """
+        self.store = store
+        self.handlers = handlers
+        self.dao = dao
+        self._queue: "queue.Queue[int]" = queue.Queue()
+        self._jobs: dict[int, dict] = {}  # 仅内存模式下保存任务内容
+        self._local_keys: set[str] = set()  # 仅内存模式下的幂等键
+        self._local_ids = iter(range(1, 1 << 62))
+        self._cond = threading.Condition()
+        self._pending: dict[str, int] = {}  # user_id -> 本进程未完成任务数
+        self._job_users: dict[int, str] = {}  # 本进程排队中的任务id -> user_id
+        self._events: dict[str, list[dict]] = {}  # user_id -> 已完成任务事件
+        self._event_seq = 0
+        self._workers: list[threading.Thread] = []
+
+    def start(self) -> None:
+        if self.dao is not None:
+            try:
+                for job in self.dao.recover_open_jobs(STALE_RUNNING_SECONDS):
+                    self._track(job["id"], job["user_id"])
+                    self._queue.put(job["id"])
+            except Exception as e:
+                print(f"[MemoryJobQueue] 恢复未完成任务失败: {e}")
+
+        for i in range(max(1, WORKER_COUNT)):
+            worker = threading.Thread(target=self._run, name=f"memory-job-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, idempotency_key: str, user_id: str, update_type: str,
+               messages: list[BaseMessage], thread_id: Optional[str] = None) -> Optional[int]:
+        """
+        提交一个记忆抽取任务
+        :param idempotency_key: 幂等键（如 thread_id + tool_call_id + update_type）
+        :return: 任务id；任务已存在且已完成时返回 None
+        """
+        payload = {
+            "thread_id": thread_id,
+            "messages": messages_to_dict(messages),
+        }
+
+        if self.dao is not None:
+            row = self.dao.enqueue(idempotency_key, user_id, update_type, json.dumps(payload, default=str))
+            if row is None or row["status"] != "pending":
+                metrics.incr("memory_jobs.deduplicated")
+                return None
+            job_id = row["id"]
+        else:
+            if idempotency_key in self._local_keys:
+                metrics.incr("memory_jobs.deduplicated")
+                return None
+            self._local_keys.add(idempotency_key)
+            job_id = next(self._local_ids)
+            self._jobs[job_id] = {
+                "id": job_id,
+                "idempotency_key": idempotency_key,
+                "user_id": user_id,
+                "update_type": update_type,
+                "payload": payload,
+                "attempts": 0,
+            }
+
+        self._track(job_id, user_id)
+        metrics.incr("memory_jobs.submitted")
+        self._queue.put(job_id)
+        return job_id
+
+    def pending_count(self, user_id: str) -> int:
+        """用户未完成的任务数；持久化时包括其他 worker 中的任务（查询数据库，会阻塞）"""
+        if self.dao is not None:
+            return self.dao.open_count(user_id)
+        with self._cond:
+            return self._pending.get(user_id, 0)
+
+    def events_since(self, user_id: str, cursor: int) -> list[dict]:
+        """返回用户序号大于 cursor 的任务完成事件；持久化时包括其他 worker 完成的任务（查询数据库，会阻塞）"""
+        if self.dao is not None:
+            return self.dao.finished_since(user_id, cursor)
+        with self._cond:
+            return [e for e in self._events.get(user_id, []) if e["seq"] > cursor]
+
+    def _track(self, job_id: int, user_id: str) -> None:
+        with self._cond:
+            if job_id not in self._job_users:
+                self._job_users[job_id] = user_id
+                self._pending[user_id] = self._pending.get(user_id, 0) + 1
+
+    def _untrack(self, job_id: int) -> None:
+        with self._cond:
+            user_id = self._job_users.pop(job_id, None)
+            if user_id is not None and self._pending.get(user_id, 0) > 0:
+                self._pending[user_id] -= 1
+
+    def _claim(self, job_id: int) -> Optional[dict]:
+        if self.dao is not None:
+            return self.dao.claim(job_id)
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job["attempts"] += 1
+        return job
+
+    def _run(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            try:
+                job = self._claim(job_id)
+            except Exception as e:
+                print(f"[MemoryJobQueue] 领取任务 {job_id} 失败: {e}")
+                self._retry_later(job_id, 1)
+                continue
+            if job is None:
+                self._untrack(job_id)  # 已被其他进程领取或已完成
+                continue
+            self._execute(job)
+
+    def _execute(self, job: dict) -> None:
+        user_id = job["user_id"]
+        started = time.monotonic()
+        try:
+            handler = self.handlers[job["update_type"]]
+            payload = job["payload"]
+            state = {"messages": messages_from_dict(payload["messages"])}
+            config = {"configurable": {"user_id": user_id, "thread_id": payload.get("thread_id")}}
+            handler(state, config, self.store)
+        except Exception as e:
+            traceback.print_exc()
+            retry = job["attempts"] < MAX_ATTEMPTS
+            metrics.incr("memory_jobs.retried" if retry else "memory_jobs.failed")
+            if self.dao is not None:
+                try:
+                    self.dao.mark_failed(job["id"], str(e), retry)
+                except Exception as db_error:
+                    print(f"[MemoryJobQueue] 记录任务失败状态出错: {db_error}")
+            if retry:
+                self._retry_later(job["id"], job["attempts"])
+            else:
+                self._finish(job, "failed")
+            return
+
+        if self.dao is not None:
+            try:
+                self.dao.mark_done(job["id"])
+            except Exception as e:
+                print(f"[MemoryJobQueue] 记录任务完成状态出错: {e}")
+        metrics.incr("memory_jobs.done")
+        metrics.observe("memory_jobs.run_seconds", time.monotonic() - started)
+        self._finish(job, "done")
+
+    def _retry_later(self, job_id: int, attempts: int) -> None:
+        delay = min(60.0, 2 ** attempts) + random.uniform(0, 1)
+        timer = threading.Timer(delay, self._queue.put, args=(job_id,))
+        timer.daemon = True
+        timer.start()
+
+    def _finish(self, job: dict, status: str) -> None:
+        user_id = job["user_id"]
+        self._jobs.pop(job["id"], None)
+        self._untrack(job["id"])
+        with self._cond:
+            self._event_seq += 1
+            events = self._events.setdefault(user_id, [])
+            events.append({
+                "seq": self._event_seq,
+                "job_id": job["id"],
+                "update_type": job["update_type"],
+                "status": status,
+            })
+            # 只保留最近的事件，避免无限增长
+            if len(events) > 100:
+                del events[:-100]
+            self._cond.notify_all()
+
+
+_job_queue: MemoryJobQueue | None = None
+_job_queue_lock = threading.Lock()
+
+
+def init_memory_job_queue(store: BaseStore, handlers: dict[str, Callable], dao=None) -> MemoryJobQueue:
+    """初始化进程级的后台任务队列（幂等，只有第一次调用生效）"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = MemoryJobQueue(store, handlers, dao)
+            _job_queue.start()
+            print("[MemoryJobQueue] 后台记忆抽取队列已启动")
+        return _job_queue
+
+
+def get_memory_job_queue() -> MemoryJobQueue | None:
+    return _job_queue
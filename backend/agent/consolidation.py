@@ -0,0 +1,165 @@
+# consolidation.py
+
+import os
+import re
+import unicodedata
+from typing import Optional
+
+from dotenv import load_dotenv
+from langgraph.store.base import BaseStore, Item, PutOp
+
+from .scheduler import estimate_tokens
+from .utils import write_memory_batch
+from ..utils.metrics import metrics
+from ..utils.periodic import run_periodically
+from ..utils.pg_pool import try_advisory_lock
+from ..utils.storage import is_postgres
+
+load_dotenv()
+
+# 偏好说明块的 token 上限，超出时丢弃最旧的规则
+INSTRUCTIONS_MAX_TOKENS = int(os.getenv("INSTRUCTIONS_MAX_TOKENS", "600"))
+# 周期压缩间隔（秒），0 表示不启用
+COMPACTION_INTERVAL = int(os.getenv("INSTRUCTIONS_COMPACTION_INTERVAL", "3600"))
+# 读取偏好说明的上限（store.search 默认只返回 10 条）
+INSTRUCTIONS_SEARCH_LIMIT = 1000
+
+_BULLET = re.compile(r"^\s*(?:[-*•·]|\d+[.、)）]|[（(]\d+[)）])\s*")
+
+
+def canonical_key(user_id: str, language: str) -> str:
+    """每个用户每种语言只保留一条规范偏好说明，key 与 InstructionDao.create_instruction 一致"""
+    return f"{user_id}_{language}"
+
+
+def split_rules(content: str) -> list[str]:
+    """把一段偏好说明拆成逐条规则：按行拆分并去掉项目符号 / 编号"""
+    rules = []
+    for line in (content or "").splitlines():
+        line = _BULLET.sub("", line).strip()
+        if line and not line.startswith("#"):
+            rules.append(line)
+    return rules
+
+
+def _normalize(rule: str) -> str:
+    rule = unicodedata.normalize("NFKC", rule).lower()
+    return re.sub(r"[\s，。,.;；:：!！?？]+", "", rule)
+
+
+def consolidate_rules(rules: list[str], max_tokens: int = INSTRUCTIONS_MAX_TOKENS) -> list[str]:
+    """
+    合并规则（按从旧到新的顺序传入）：
+    - 去重：规范化（忽略大小写、空白与标点）后相同的只保留较新的一条
+    - 限长：从最新往旧保留，直到达到 token 上限
+    字面相近的规则可能是不同的偏好（"周报用中文" 与 "日报用中文"），不按相似度合并
+    返回结果保持从旧到新的顺序
+    """
+    kept: list[str] = []
+    seen: set[str] = set()
+    for rule in reversed(rules):
+        normalized = _normalize(rule)
+        if not normalized or normalized in seen:
+            continue
+        seen.add(normalized)
+        kept.append(rule)
+
+    result, used = [], 0
+    for rule in kept:
+        cost = estimate_tokens(rule)
+        if used + cost > max_tokens and result:
+            break
+        result.append(rule)
+        used += cost
+    return list(reversed(result))
+
+
+def format_rules(rules: list[str]) -> str:
+    return "\n".join(f"- {rule}" for rule in consolidate_rules(rules))
+
+
+def merge_content(existing: Optional[str], new_content: str) -> str:
+    """把新增内容并入已有的偏好说明，返回规范记录的内容（供 InstructionDao.create_instruction 使用）"""
+    return format_rules(split_rules(existing or "") + split_rules(new_content))
+
+
+def _sort_key(item: Item):
+    return item.created_at, item.key
+
+
+def consolidate_instructions(store: BaseStore, user_id: str, new_content: Optional[str] = None,
+                             language: str = "zh-CN") -> bool:
+    """
+    把用户的偏好说明合并为每种语言一条规范记录，可同时并入一段新增内容
+    :param new_content: update_instructions 新生成的偏好说明，None 表示只做压缩
+    :return: 是否写入了变更
+    """
+    namespace = ("instructions", user_id)
+    items = sorted(store.search(namespace, limit=INSTRUCTIONS_SEARCH_LIMIT), key=_sort_key)
+
+    by_language: dict[str, list[Item]] = {}
+    for item in items:
+        by_language.setdefault(item.value.get("language") or language, []).append(item)
+    if new_content is not None:
+        by_language.setdefault(language, [])
+
+    ops: list[PutOp] = []
+    for lang, lang_items in by_language.items():
+        key = canonical_key(user_id, lang)
+        rules = [rule for item in lang_items for rule in split_rules(item.value.get("content", ""))]
+        if new_content is not None and lang == language:
+            rules += split_rules(new_content)
+
+        content = format_rules(rules)
+        current = next((item for item in lang_items if item.key == key), None)
+        unchanged = (
+            len(lang_items) == 1 and current is not None
+            and current.value.get("content") == content
+        )
+        if unchanged:
+            continue
+
+        ops.extend(PutOp(namespace, item.key, None) for item in lang_items if item.key != key)
+        if content:
+            ops.append(PutOp(namespace, key, {"language": lang, "content": content, "key": key}))
+        elif current is not None:
+            ops.append(PutOp(namespace, key, None))
+        metrics.incr("instructions.consolidations")
+        metrics.incr("instructions.rows_merged", len(lang_items))
+
+    if ops:
+        write_memory_batch(store, "instructions", user_id, ops)
+    return bool(ops)
+
+
+def compact_all(store: BaseStore) -> int:
+    """压缩所有用户的偏好说明，返回发生变更的用户数"""
+    changed = 0
+    for namespace in store.list_namespaces(prefix=("instructions",), max_depth=2, limit=100000):
+        if len(namespace) != 2:
+            continue
+        try:
+            changed += consolidate_instructions(store, namespace[1])
+        except Exception as e:
+            print(f"[Instructions] 压缩用户 {namespace[1]} 的偏好说明失败: {e}")
+    metrics.incr("instructions.compaction_runs")
+    return changed
+
+
+def _compact_and_report(store: BaseStore) -> None:
+    # 多个 worker 都会启动周期压缩；Postgres 模式下用 advisory lock 保证同一时间只有一个 worker 在压缩
+    if is_postgres():
+        with try_advisory_lock("instructions-compaction") as acquired:
+            if not acquired:
+                metrics.incr("instructions.compaction_skipped")
+                return
+            changed = compact_all(store)
+    else:
+        changed = compact_all(store)
+    if changed:
+        print(f"[Instructions] 周期压缩完成，{changed} 个用户的偏好说明已合并")
+
+
+def start_compaction(store: BaseStore, interval: int = COMPACTION_INTERVAL) -> None:
+    """启动周期压缩（幂等），处理历史遗留的多条记录以及绕过 agent 直接写入的记录"""
+    run_periodically("instructions-compaction", interval, lambda: _compact_and_report(store))
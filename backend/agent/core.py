@@ -2,24 +2,36 @@
 
 import uuid
 from typing import List
-from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.checkpoint.postgres import PostgresSaver
-from langgraph.constants import START
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.constants import START, END
 from langgraph.graph import StateGraph
 from langgraph.store.memory import InMemoryStore
 from langgraph.store.postgres import PostgresStore
-from .models import CustomState
+from langgraph.store.sqlite import SqliteStore
+from .state import CustomState
 from .nodes import (
     task_mAIstro, update_profile, update_todos, update_instructions,
-    route_message,
+    route_message, schedule_memory_updates,
 )
+from .fast_path import fast_path, route_fast_path
+from .background import init_memory_job_queue, deferred_memory_default
+from .similarity import todo_index_config
+from .consolidation import start_compaction
+from .serde import build_serializer
+from .tiered_store import STORE_WRITE_BEHIND, TieredStore
+from ..dao.MemoryJobDao import MemoryJobDao
 from ..utils.pg_pool import get_pg_pool
+from ..utils.sqlite_db import SQLITE_PATH, get_sqlite_conn
+from ..utils.storage import STORAGE_BACKEND, is_postgres
+from ..utils.change_feed import install_change_feed_trigger
 
 
 class ToDoAgent:
     def __init__(self, connection_pool=None):
-        self.connection_pool = connection_pool or get_pg_pool()
+        self.connection_pool = connection_pool or (get_pg_pool() if is_postgres() else None)
         self.across_thread_memory = None
         self.within_thread_memory = None
         self.graph = None
@@ -27,35 +39,125 @@ class ToDoAgent:
         self.setup()
 
     def setup(self):
-        try:
-            self.across_thread_memory = PostgresStore(self.connection_pool)
-            self.within_thread_memory = PostgresSaver(self.connection_pool)
+        # 可选的待办向量索引（本地哈希向量），用于相似待办检索与去重
+        index = todo_index_config()
+        # 检查点序列化器（msgpack / orjson，超过阈值时压缩），见 serde.py
+        serde = build_serializer()
+        if STORAGE_BACKEND == "sqlite":
+            self._setup_sqlite(index, serde)
+        elif STORAGE_BACKEND == "postgres":
+            self._setup_postgres(index, serde)
+        else:
+            self._setup_in_memory(index, serde)
+
+        self._setup_memory_jobs()
+        # 周期压缩偏好说明，处理历史遗留的多条记录
+        start_compaction(self.across_thread_memory)
+        self.graph = self._build_graph()
 
-            self.across_thread_memory.setup()
+    def _setup_postgres(self, index, serde):
+        try:
+            self.across_thread_memory = self._setup_postgres_store(index)
+            self.within_thread_memory = PostgresSaver(self.connection_pool, serde=serde)
             self.within_thread_memory.setup()
+            if STORE_WRITE_BEHIND:
+                self.across_thread_memory = TieredStore(self.across_thread_memory)
 
             print("[ToDoAgent] PostgreSQL连接成功")
         except Exception as e:
             print(f"[ToDoAgent] PostgreSQL连接失败: {e}")
+            if STORE_WRITE_BEHIND:
+                # 记忆写入先落本地日志，Postgres 恢复后由刷写线程建表并补写；对话检查点暂存内存
+                print("[ToDoAgent] 记忆写入暂存本地日志，数据库恢复后自动落库")
+                self.across_thread_memory = TieredStore(
+                    PostgresStore(self.connection_pool, index=index),
+                    setup_backend=lambda: self._setup_postgres_store(index),
+                    on_backend_ready=self._install_change_feed,
+                )
+                self.within_thread_memory = MemorySaver(serde=serde)
+                return
             print("[ToDoAgent] 回退到内存存储")
-            self.across_thread_memory = InMemoryStore()
-            self.within_thread_memory = MemorySaver()
+            self._setup_in_memory(index, serde)
+            return
 
-        self.graph = self._build_graph()
+        self._install_change_feed()
+
+    def _setup_postgres_store(self, index) -> PostgresStore:
+        """
+        创建并初始化 PostgresStore；向量索引是可选功能，初始化失败（如未安装 pgvector 扩展）时
+        不带索引重建，而不是放弃持久化。已执行的基础迁移有记录，重试不会重复执行
+        """
+        store = PostgresStore(self.connection_pool, index=index)
+        try:
+            store.setup()
+            return store
+        except Exception as e:
+            if index is None:
+                raise
+            print(f"[ToDoAgent] 待办向量索引初始化失败（需要 pgvector 扩展），不启用向量索引: {e}")
+        store = PostgresStore(self.connection_pool)
+        store.setup()
+        return store
+
+    def _install_change_feed(self):
+        """变更推送是可选功能：触发器安装失败（权限不足等）只记录日志，不影响记忆与检查点的持久化"""
+        try:
+            install_change_feed_trigger(self.connection_pool)
+        except Exception as e:
+            print(f"[ToDoAgent] 变更通知触发器安装失败，变更推送不可用: {e}")
+
+    def _setup_sqlite(self, index, serde):
+        """单机模式：检查点与 store 使用同一个 SQLite 文件（WAL），各自持有一个共享连接"""
+        self.across_thread_memory = SqliteStore(get_sqlite_conn("store"), index=index)
+        self.within_thread_memory = SqliteSaver(get_sqlite_conn("checkpointer"), serde=serde)
+
+        self.across_thread_memory.setup()
+        self.within_thread_memory.setup()
+        print(f"[ToDoAgent] 使用 SQLite 存储: {SQLITE_PATH}")
+
+    def _setup_in_memory(self, index, serde):
+        self.across_thread_memory = InMemoryStore(index=index)
+        self.within_thread_memory = MemorySaver(serde=serde)
+
+    def _setup_memory_jobs(self):
+        """启动后台记忆抽取队列；数据库不可用时使用不持久化的内存队列"""
+        dao = None
+        if isinstance(getattr(self.across_thread_memory, "backend", self.across_thread_memory), PostgresStore):
+            try:
+                dao = MemoryJobDao()
+                dao.ensure_table()
+            except Exception as e:
+                print(f"[ToDoAgent] 后台任务表初始化失败，任务将不持久化: {e}")
+                dao = None
+
+        init_memory_job_queue(
+            store=self.across_thread_memory,
+            handlers={
+                "user": update_profile,
+                "todo": update_todos,
+                "instructions": update_instructions,
+            },
+            dao=dao,
+        )
 
     def _build_graph(self):
         builder = StateGraph(CustomState)
 
+        builder.add_node(fast_path)
         builder.add_node(task_mAIstro)
         builder.add_node(update_todos)
         builder.add_node(update_profile)
         builder.add_node(update_instructions)
+        builder.add_node(schedule_memory_updates)
 
-        builder.add_edge(START, "task_mAIstro")
+        # 简单待办指令走确定性快速通道，不调用模型
+        builder.add_edge(START, "fast_path")
+        builder.add_conditional_edges("fast_path", route_fast_path, ["task_mAIstro", END])
         builder.add_conditional_edges("task_mAIstro", route_message)
         builder.add_edge("update_todos", "task_mAIstro")
         builder.add_edge("update_profile", "task_mAIstro")
         builder.add_edge("update_instructions", "task_mAIstro")
+        builder.add_edge("schedule_memory_updates", "task_mAIstro")
 
         return builder.compile(
             checkpointer=self.within_thread_memory,
@@ -68,6 +170,7 @@ class ToDoAgent:
             input: str | List[BaseMessage],
             thread_id: str = None,
             stream: bool = False,
+            deferred_memory: bool | None = None,
     ):
         """
         对话方法：传入消息并获取响应
@@ -75,6 +178,7 @@ class ToDoAgent:
         :param input: 输入信息
         :param thread_id: 对话id
         :param stream: 是否流式返回
+        :param deferred_memory: 是否先回复、后台抽取记忆；None 时取环境变量 AGENT_DEFERRED_MEMORY
         :return: if stream: 返回流式生成器; else: 返回llm invoke的响应
         """
 
@@ -86,12 +190,7 @@ class ToDoAgent:
             else:
                 input_messages = input
 
-            config = {
-                "configurable": {
-                    "thread_id": thread_id or str(uuid.uuid4()),
-                    "user_id": user_id,
-                }
-            }
+            config = self._config(user_id, thread_id, deferred_memory)
 
             input_state = {"messages": input_messages}
 
@@ -118,6 +217,44 @@ class ToDoAgent:
             traceback.print_exc()
             raise e
 
+    @staticmethod
+    def _config(user_id: str, thread_id: str | None, deferred_memory: bool | None, **extra) -> dict:
+        return {
+            "configurable": {
+                "thread_id": thread_id or str(uuid.uuid4()),
+                "user_id": user_id,
+                "deferred_memory": deferred_memory_default() if deferred_memory is None else deferred_memory,
+                **extra,
+            }
+        }
+
+    def chat_tokens(
+            self,
+            user_id: str,
+            input: str,
+            thread_id: str,
+            deferred_memory: bool | None = None,
+            memory_snapshot: dict | None = None,
+    ):
+        """
+        逐 token 流式对话（供长连接会话使用）
+        :param thread_id: 对话id，同一会话的多轮对话共享上下文
+        :param memory_snapshot: 会话持有的记忆快照（可变字典），task_mAIstro 会复用或刷新它
+        :return: 生成器，产出 ("token", 文本片段)，最后产出 ("done", 完整回复)
+        """
+        config = self._config(user_id, thread_id, deferred_memory, memory_snapshot=memory_snapshot)
+        input_state = {"messages": [HumanMessage(content=input)]}
+
+        for chunk, metadata in self.graph.stream(input_state, config, stream_mode="messages"):
+            # 只转发面向用户的回复，不转发后台记忆抽取等节点的输出
+            if metadata.get("langgraph_node") not in ("task_mAIstro", "fast_path"):
+                continue
+            if isinstance(chunk, (AIMessageChunk, AIMessage)) and isinstance(chunk.content, str) and chunk.content:
+                yield "token", chunk.content
+
+        final = self.graph.get_state(config).values["messages"][-1]
+        yield "done", final.content
+
     def _chat_stream(self, input_state, config):
         """流式聊天的内部方法"""
         for chunk in self.graph.stream(input_state, config, stream_mode="values"):
@@ -138,6 +275,11 @@ class ToDoAgent:
         memories = self.across_thread_memory.search(("instructions", user_id))
         return [memory.value for memory in memories]
 
+    def close(self):
+        """应用关闭时调用：写回式 store 把未落库的写入刷到数据库"""
+        if isinstance(self.across_thread_memory, TieredStore):
+            self.across_thread_memory.close()
+
     # def __del__(self):
     #     """清理连接池"""
     #     if hasattr(self, 'connection_pool'):
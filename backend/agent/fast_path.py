@@ -0,0 +1,345 @@
+# fast_path.py
+
+import os
+import re
+import unicodedata
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from dotenv import load_dotenv
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.constants import END
+from langgraph.store.base import BaseStore, Item, PutOp
+
+from .state import CustomState
+from .nodes import TODO_SEARCH_LIMIT
+from .similarity import embed_texts, cosine
+from .utils import write_memory_batch
+from ..utils.metrics import metrics
+
+load_dotenv()
+
+FAST_PATH_ENABLED = os.getenv("AGENT_FAST_PATH", "0") == "1"
+# 模糊匹配待办的最低相似度，以及最佳与次佳之间的最小差距；达不到就交给完整流程
+MATCH_THRESHOLD = float(os.getenv("AGENT_FAST_PATH_MATCH_THRESHOLD", "0.6"))
+MATCH_MARGIN = 0.15
+# 单条命令的最大长度，更长的消息大概率不是简单指令
+MAX_COMMAND_LENGTH = 80
+
+STATUS_WORDS = {
+    "done": "done", "complete": "done", "completed": "done", "finished": "done",
+    "in progress": "in progress", "started": "in progress", "ongoing": "in progress",
+    "not started": "not started", "todo": "not started",
+    "archived": "archived",
+    "已完成": "done", "完成": "done", "做完": "done", "搞定": "done",
+    "进行中": "in progress", "开始": "in progress",
+    "未开始": "not started", "没开始": "not started",
+    "已归档": "archived", "归档": "archived",
+}
+_STATUS_EN = "done|completed?|finished|in progress|started|ongoing|not started|todo|archived"
+_STATUS_ZH = "已完成|完成|做完|搞定|进行中|开始|未开始|没开始|已归档|归档"
+_TARGET_EN = r"(?:the )?(?P<target>.+?)(?: task| todo)?"
+_TARGET_ZH = r"(?P<target>.+?)(?:这个|这项|这件)?(?:任务|待办|事项)?"
+
+# (动作, 正则)；按顺序匹配，命中第一条即止
+_GRAMMAR = [
+    # ---- 重命名 ----
+    ("rename", rf"rename {_TARGET_EN} to (?P<value>.+)"),
+    ("rename", rf"把?{_TARGET_ZH}(?:改名为|改名成|重命名为|重命名成|名字改为|名字改成)(?P<value>.+)"),
+    # ---- 截止时间 ----
+    ("deadline", rf"set (?:the )?deadline (?:of|for) {_TARGET_EN} to (?P<value>.+)"),
+    ("deadline", rf"{_TARGET_EN} (?:is )?due (?:on |by )?(?P<value>.+)"),
+    ("deadline", rf"把?{_TARGET_ZH}的?(?:截止时间|截止日期|截止|期限|deadline)(?:设为|设置为|改为|改成|改到|定在|定为|是)(?P<value>.+)"),
+    # ---- 删除 ----
+    ("delete", rf"(?:delete|remove|drop) {_TARGET_EN}"),
+    ("delete", rf"(?:删除|删掉|移除|去掉){_TARGET_ZH}"),
+    ("delete", rf"把{_TARGET_ZH}(?:删除|删掉|移除|去掉)了?"),
+    # ---- 状态 ----
+    ("status", rf"(?:mark|set) {_TARGET_EN} (?:as |to )?(?P<value>{_STATUS_EN})"),
+    ("status", rf"(?P<value>complete|finish) {_TARGET_EN}"),
+    ("status", rf"把?{_TARGET_ZH}(?:标记为|标记成|标为|设为|设置为|改为|改成|状态改为)(?P<value>{_STATUS_ZH})"),
+]
+_GRAMMAR = [(action, re.compile(pattern, re.IGNORECASE)) for action, pattern in _GRAMMAR]
+
+_CJK = re.compile(r"[\u3400-\u9fff]")
+# 疑问句（"what is due tomorrow"、"报告完成了吗"）和批量指令（"remove all done tasks"、"删除所有已完成的任务"）
+# 不是针对单个待办的简单指令，一律交给完整流程
+_QUESTION = re.compile(
+    r"[?？]|^(?:what|when|which|who|where|why|how|is|are|do|does|did|can|could|should|will|would)\b"
+    r"|吗|呢|什么|哪|怎么|怎样|为什么|多少|是否",
+    re.IGNORECASE
+)
+_QUANTIFIER = re.compile(r"\b(?:all|every|each|any|everything)\b|所有|全部|每个|每项|一切", re.IGNORECASE)
+# 代词、限定词等不指向具体待办的目标（"delete it"、"mark this done"、"删除它"），交给完整流程结合上下文理解
+_STOP_TARGETS = {
+    "it", "this", "that", "these", "those", "them", "one", "all", "everything", "something", "anything",
+    "the", "a", "an", "my", "task", "todo", "tasks", "todos", "item", "items", "stuff",
+    "它", "它们", "这", "那", "这个", "那个", "这些", "那些", "这项", "那项", "这件", "那件",
+    "任务", "待办", "事项", "所有", "全部", "一切", "东西",
+}
+# 目标的最短长度：英文按字母数字字符计，中文按汉字计
+MIN_TARGET_CHARS = 3
+MIN_TARGET_CJK = 2
+_TOKEN = re.compile(r"[\u3400-\u9fff]+|[a-z0-9]+")
+
+
+@dataclass
+class Command:
+    action: str
+    target: str
+    value: Optional[str] = None
+
+
+def _clean(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).strip()
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" .!?。！？~～\"'“”‘’「」")
+
+
+def _normalize(text: str) -> str:
+    return _clean(text).lower()
+
+
+def parse_command(text: str) -> Optional[Command]:
+    """按固定语法解析简单待办指令，不认识时返回 None（保留原大小写，便于重命名）"""
+    # 问号在 _clean 中会被去掉，先在原文上判断疑问句
+    if _QUESTION.search(text.strip()) or _QUANTIFIER.search(text):
+        return None
+    text = _clean(text)
+    if not text or len(text) > MAX_COMMAND_LENGTH or "\n" in text:
+        return None
+    for action, pattern in _GRAMMAR:
+        match = pattern.fullmatch(text)
+        if match is None:
+            continue
+        target = match.group("target").strip(" \"'“”‘’「」")
+        value = (match.groupdict().get("value") or "").strip(" \"'“”‘’「」") or None
+        if not _is_specific(target):
+            return None
+        if action == "status":
+            value = value.lower()
+            value = {"complete": "done", "finish": "done", "start": "in progress"}.get(value, value)
+            value = STATUS_WORDS.get(value)
+            if value is None:
+                return None
+        return Command(action, target, value)
+    return None
+
+
+def _tokens(text: str) -> list[str]:
+    """规范化后的词元：英文单词 / 数字，以及连续的汉字串"""
+    return _TOKEN.findall(_normalize(text))
+
+
+def _is_specific(target: str) -> bool:
+    """目标足够具体才可能唯一地指向一条待办：不是代词 / 限定词，且达到最短长度"""
+    normalized = _normalize(target)
+    tokens = _tokens(normalized)
+    if not tokens or normalized in _STOP_TARGETS or all(token in _STOP_TARGETS for token in tokens):
+        return False
+    cjk = sum(len(token) for token in tokens if _CJK.match(token))
+    if cjk:
+        return cjk >= MIN_TARGET_CJK
+    return sum(len(token) for token in tokens) >= MIN_TARGET_CHARS
+
+
+def _contains(task_tokens: list[str], target_tokens: list[str]) -> bool:
+    """
+    按词元边界判断目标是否是待办的一部分：英文单词必须完整相同，连续的词元依次对应；
+    汉字串需整段出现在对应的汉字串中（"报告" 属于 "写季度报告"），不会因为 "write" 含有 "it" 而命中
+    """
+    n = len(target_tokens)
+    for start in range(len(task_tokens) - n + 1):
+        window = task_tokens[start:start + n]
+        if all(
+            target == task or (_CJK.match(target) and len(target) >= MIN_TARGET_CJK and target in task)
+            for target, task in zip(target_tokens, window)
+        ):
+            return True
+    return False
+
+
+def parse_deadline(text: str, now: Optional[datetime] = None) -> Optional[datetime]:
+    """解析常见日期写法：ISO 日期、M月D日、今天/明天/后天、today/tomorrow、下周X/next monday"""
+    now = now or datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    text = _normalize(text)
+
+    relative = {"今天": 0, "today": 0, "明天": 1, "tomorrow": 1, "后天": 2}
+    if text in relative:
+        return today + timedelta(days=relative[text])
+
+    match = re.fullmatch(r"(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})", text)
+    if match:
+        year, month, day = map(int, match.groups())
+        return _safe_date(year, month, day)
+
+    match = re.fullmatch(r"(?:(\d{4})年)?(\d{1,2})月(\d{1,2})[日号]?", text)
+    if match:
+        year = int(match.group(1)) if match.group(1) else now.year
+        date = _safe_date(year, int(match.group(2)), int(match.group(3)))
+        # 未写年份且日期已过，视为明年
+        if date is not None and match.group(1) is None and date < today:
+            date = _safe_date(year + 1, date.month, date.day)
+        return date
+
+    weekdays_zh = "一二三四五六日天"
+    match = re.fullmatch(r"(下)?(?:周|星期)([一二三四五六日天])", text)
+    if match:
+        weekday = min(weekdays_zh.index(match.group(2)), 6)
+        return _next_weekday(today, weekday, skip_week=bool(match.group(1)))
+
+    weekdays_en = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+    match = re.fullmatch(r"(next )?(" + "|".join(weekdays_en) + ")", text)
+    if match:
+        return _next_weekday(today, weekdays_en.index(match.group(2)), skip_week=bool(match.group(1)))
+
+    return None
+
+
+def _safe_date(year: int, month: int, day: int) -> Optional[datetime]:
+    try:
+        return datetime(year, month, day)
+    except ValueError:
+        return None
+
+
+def _next_weekday(today: datetime, weekday: int, skip_week: bool) -> datetime:
+    days = (weekday - today.weekday()) % 7 or 7
+    if skip_week and days < 7:
+        days += 7
+    return today + timedelta(days=days)
+
+
+def match_todo(target: str, items: list[Item]) -> Optional[Item]:
+    """
+    把指令中的目标匹配到唯一的待办：完全相同 > 按词元边界是唯一一条待办的一部分 > 明显领先且有共同词元的相似度
+    目标不够具体、有歧义或匹配较弱时返回 None；不反向匹配（目标包含待办名称时，多出的部分往往改变了意思）
+    """
+    if not _is_specific(target):
+        return None
+    target_tokens = _tokens(target)
+    tasks = [(_tokens(str(item.value.get("task", ""))), item) for item in items]
+
+    exact = [item for task, item in tasks if task == target_tokens]
+    if len(exact) == 1:
+        return exact[0]
+    if exact:
+        return None
+
+    contains = [item for task, item in tasks if _contains(task, target_tokens)]
+    if len(contains) == 1:
+        return contains[0]
+    if contains:
+        return None
+    # 目标比某条待办多出了内容（"learning piano next week" 与 "learning piano"），相似度再高也不代表同一件事
+    if not tasks or any(task and _contains(target_tokens, task) for task, _ in tasks):
+        return None
+
+    target_text = " ".join(target_tokens)
+    target_vector = embed_texts([target_text])[0]
+    vectors = embed_texts([" ".join(task) for task, _ in tasks])
+    scored = sorted(
+        ((cosine(target_vector, vector), task, item) for (task, item), vector in zip(tasks, vectors)),
+        key=lambda p: p[0],
+        reverse=True
+    )
+    best_score, best_task, best_item = scored[0]
+    runner_up = scored[1][0] if len(scored) > 1 else 0.0
+    # 只有字符片段相近（没有任何共同的词或双字）时不算匹配
+    if not _shares_token(target_tokens, best_task):
+        return None
+    if best_score >= MATCH_THRESHOLD and best_score - runner_up >= MATCH_MARGIN:
+        return best_item
+    return None
+
+
+def _shares_token(target_tokens: list[str], task_tokens: list[str]) -> bool:
+    words = {token for token in task_tokens if not _CJK.match(token)}
+    bigrams = {token[i:i + 2] for token in task_tokens if _CJK.match(token) for i in range(len(token) - 1)}
+    for token in target_tokens:
+        if _CJK.match(token):
+            if any(token[i:i + 2] in bigrams for i in range(len(token) - 1)):
+                return True
+        elif token in words and token not in _STOP_TARGETS:
+            return True
+    return False
+
+
+_STATUS_LABELS = {"done": "已完成", "in progress": "进行中", "not started": "未开始", "archived": "已归档"}
+
+
+def _reply(command: Command, task: str, chinese: bool, deadline: Optional[datetime] = None) -> str:
+    if command.action == "delete":
+        return f"已删除待办「{task}」。" if chinese else f'Deleted "{task}".'
+    if command.action == "rename":
+        return f"已将「{task}」重命名为「{command.value}」。" if chinese else f'Renamed "{task}" to "{command.value}".'
+    if command.action == "deadline":
+        return (f"已将「{task}」的截止时间设为 {deadline:%Y-%m-%d}。" if chinese
+                else f'Set the deadline of "{task}" to {deadline:%Y-%m-%d}.')
+    return (f"已将「{task}」标记为{_STATUS_LABELS[command.value]}。" if chinese
+            else f'Marked "{task}" as {command.value}.')
+
+
+def apply_command(command: Command, text: str, store: BaseStore, user_id: str) -> Optional[str]:
+    """执行指令并返回回复；找不到唯一目标或参数无法解析时返回 None"""
+    namespace = ("todo", user_id)
+    item = match_todo(command.target, store.search(namespace, limit=TODO_SEARCH_LIMIT))
+    if item is None:
+        return None
+
+    task = str(item.value.get("task", ""))
+    value = dict(item.value)
+    deadline = None
+    if command.action == "delete":
+        value = None
+    elif command.action == "rename":
+        value["task"] = command.value
+    elif command.action == "deadline":
+        deadline = parse_deadline(command.value)
+        if deadline is None:
+            return None
+        value["deadline"] = deadline.isoformat()
+    else:
+        value["status"] = command.value
+
+    write_memory_batch(store, "todo", user_id, [PutOp(namespace, item.key, value)])
+    return _reply(command, task, bool(_CJK.search(text)), deadline)
+
+
+def fast_path(state: CustomState, config: RunnableConfig, store: BaseStore):
+    """
+    确定性快速通道：新一轮对话若是简单的待办指令（改状态 / 删除 / 重命名 / 设截止时间），
+    直接写 store 并返回模板回复，不调用模型；拿不准时不做任何事，交给 task_mAIstro
+    """
+    last_msg = state["messages"][-1]
+    if not FAST_PATH_ENABLED or not isinstance(last_msg, HumanMessage) or not isinstance(last_msg.content, str):
+        return {"messages": []}
+
+    command = parse_command(last_msg.content)
+    if command is None:
+        return {"messages": []}
+
+    user_id = config["configurable"]["user_id"]
+    try:
+        reply = apply_command(command, last_msg.content, store, user_id)
+    except Exception as e:
+        print(f"[FastPath] 执行指令失败，回退到完整流程: {e}")
+        reply = None
+
+    if reply is None:
+        metrics.incr("fast_path.fallbacks")
+        return {"messages": []}
+
+    metrics.incr(f"fast_path.hits.{command.action}")
+    print(f"[FastPath] {command.action}: {command.target} -> {command.value}")
+    return {"messages": [AIMessage(content=reply)]}
+
+
+def route_fast_path(state: CustomState) -> str:
+    """快速通道已回复则结束本轮，否则进入 task_mAIstro"""
+    if isinstance(state["messages"][-1], AIMessage):
+        return END
+    return "task_mAIstro"
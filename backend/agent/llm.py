@@ -0,0 +1,243 @@
+# llm.py
+
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Optional
+from uuid import UUID
+
+import httpx
+import openai
+from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_openai import ChatOpenAI
+
+from ..utils.metrics import metrics
+
+load_dotenv()
+
+# 模型角色：
+# - router：task_mAIstro 中决定是否调用 UpdateMemory 的那次调用；与 responder 模型不同时其文本不返回给用户
+# - extractor：trustcall 记忆抽取与偏好说明生成，均在后台、对延迟敏感，适合小而快的模型
+# - responder：工具调用完成后生成最终回复，以及 router 单独配置时不更新记忆轮次的回复
+ROLES = ("router", "extractor", "responder")
+
+
+def role_models(role: str) -> list[str]:
+    """
+    角色的模型链：OPENAI_MODEL_<ROLE> 为主模型（默认 OPENAI_MODEL），
+    OPENAI_MODEL_<ROLE>_FALLBACKS 为逗号分隔的备用模型，主模型报错时依次尝试
+    """
+    default = os.getenv("OPENAI_MODEL", "gpt-4o")
+    primary = os.getenv(f"OPENAI_MODEL_{role.upper()}") or default
+    fallbacks = [m.strip() for m in os.getenv(f"OPENAI_MODEL_{role.upper()}_FALLBACKS", "").split(",") if m.strip()]
+    return list(dict.fromkeys([primary] + fallbacks))
+
+
+def _load_prices() -> dict[str, tuple[float, float]]:
+    """LLM_PRICES：JSON，模型 -> [输入单价, 输出单价]（美元 / 百万 token），用于估算成本"""
+    try:
+        return {model: (float(p[0]), float(p[1])) for model, p in json.loads(os.getenv("LLM_PRICES", "{}")).items()}
+    except (ValueError, TypeError, IndexError) as e:
+        print(f"[LLM] LLM_PRICES 配置无效，忽略: {e}")
+        return {}
+
+
+PRICES = _load_prices()
+
+
+class RoleMetrics(BaseCallbackHandler):
+    """按角色记录模型调用的延迟、token 用量、估算成本与失败（含备用模型接管）"""
+
+    def __init__(self, role: str):
+        self.role = role
+        self._lock = threading.Lock()
+        self._started: dict[UUID, tuple[float, str]] = {}
+
+    def on_chat_model_start(self, serialized: dict, messages: list, *, run_id: UUID,
+                            metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        model_name = (metadata or {}).get("ls_model_name") or serialized.get("kwargs", {}).get("model_name", "unknown")
+        with self._lock:
+            self._started[run_id] = (time.monotonic(), model_name)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        start, model_name = started
+        prefix = f"llm.role.{self.role}"
+        metrics.observe(f"{prefix}.latency_seconds", time.monotonic() - start)
+        metrics.incr(f"{prefix}.calls.{model_name}")
+
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+        metrics.incr(f"{prefix}.input_tokens", input_tokens)
+        metrics.incr(f"{prefix}.output_tokens", output_tokens)
+        if model_name in PRICES:
+            input_price, output_price = PRICES[model_name]
+            metrics.incr(f"{prefix}.cost_usd", (input_tokens * input_price + output_tokens * output_price) / 1_000_000)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        model_name = started[1] if started else "unknown"
+        metrics.incr(f"llm.role.{self.role}.errors.{model_name}")
+
+
+# ==================== 传输层 ====================
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "32"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "16"))
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+# 失败重试次数（不含首次），指数退避 + 抖动；只重试连接错误、超时、限流与 5xx
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # 含 APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+_TIMEOUT = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+_LIMITS = httpx.Limits(
+    max_connections=HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+    keepalive_expiry=60,
+)
+
+# 所有模型共享连接池：复用 keep-alive 连接，免去每次调用的 TCP / TLS 握手
+_http_client = httpx.Client(limits=_LIMITS, timeout=_TIMEOUT)
+_http_async_client = httpx.AsyncClient(limits=_LIMITS, timeout=_TIMEOUT)
+
+
+def prime_http_client(timeout: float = CONNECT_TIMEOUT) -> bool:
+    """
+    启动预热：向模型服务发一个不消耗 token 的请求（GET /models），
+    提前完成 DNS / TCP / TLS 握手并在共享连接池里留下 keep-alive 连接
+    """
+    base_url = (os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1").rstrip("/")
+    try:
+        _http_client.get(
+            f"{base_url}/models",
+            headers={"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY', '')}"},
+            timeout=timeout,
+        )
+        return True
+    except httpx.HTTPError as e:
+        print(f"[LLM] 预热模型服务连接失败: {e}")
+        return False
+
+
+def chat_model(model_name: str) -> ChatOpenAI:
+    return ChatOpenAI(
+        model=model_name,
+        base_url=os.getenv("OPENAI_BASE_URL"),
+        api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=_http_client,
+        http_async_client=_http_async_client,
+        timeout=_TIMEOUT,
+        # 重试交给 with_retry（带抖动，且在切换备用模型之前完成）
+        max_retries=0,
+    )
+
+
+class HedgedRunnable(Runnable):
+    """
+    对冲请求：调用超过该角色近期延迟的分位数（默认 p95）仍未返回时，再发一个相同的请求，取先返回的结果
+    未被采用的请求无法中断，会在后台跑完后丢弃；样本不足时使用 LLM_HEDGE_MIN_DELAY
+    """
+
+    _executor = ThreadPoolExecutor(max_workers=HTTP_MAX_CONNECTIONS, thread_name_prefix="llm-hedge")
+
+    def __init__(self, bound: Runnable, role: str, quantile: float, min_delay: float, window: int = 200):
+        self.bound = bound
+        self.role = role
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self._lock = threading.Lock()
+        self._latencies: deque[float] = deque(maxlen=window)
+
+    def hedge_delay(self) -> float:
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < 20:
+            return self.min_delay
+        return max(samples[min(int(len(samples) * self.quantile), len(samples) - 1)], 0.05)
+
+    def _submit(self, input: Any, config: Optional[RunnableConfig], **kwargs: Any):
+        # 带上调用方的 contextvars（回调、追踪依赖它们）
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self._timed_invoke, input, config, **kwargs)
+
+    def _timed_invoke(self, input: Any, config: Optional[RunnableConfig], **kwargs: Any) -> Any:
+        start = time.monotonic()
+        result = self.bound.invoke(input, config, **kwargs)
+        with self._lock:
+            self._latencies.append(time.monotonic() - start)
+        return result
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        prefix = f"llm.hedge.{self.role}"
+        primary = self._submit(input, config, **kwargs)
+        done, _ = wait([primary], timeout=self.hedge_delay())
+        if done:
+            return primary.result()
+
+        metrics.incr(f"{prefix}.fired")
+        hedge = self._submit(input, config, **kwargs)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    metrics.incr(f"{prefix}.won" if future is hedge else f"{prefix}.lost")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+
+def _hedge_roles() -> set[str]:
+    """LLM_HEDGE_ROLES：逗号分隔的启用对冲请求的角色，默认不启用（会增加调用量）"""
+    return {r.strip() for r in os.getenv("LLM_HEDGE_ROLES", "").split(",") if r.strip()}
+
+
+HEDGE_ROLES = _hedge_roles()
+HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "3"))
+
+_metrics_callbacks = {role: RoleMetrics(role) for role in ROLES}
+
+
+def for_role(role: str, build: Callable[[ChatOpenAI], Runnable] = lambda m: m) -> Runnable:
+    """
+    按角色构建可调用对象：对模型链中的每个模型执行 build（如 bind_tools / create_extractor）并加上重试，
+    再用 with_fallbacks 串起来（某个模型重试耗尽后才切到下一个），按配置包一层对冲请求，并挂上该角色的指标回调
+    :param role: router / extractor / responder
+    :param build: 由 ChatOpenAI 构建最终 Runnable 的函数，默认直接使用模型
+    """
+    runnables = []
+    for name in role_models(role):
+        runnable = build(chat_model(name))
+        if MAX_RETRIES > 0:
+            runnable = runnable.with_retry(
+                retry_if_exception_type=RETRYABLE_ERRORS,
+                wait_exponential_jitter=True,
+                stop_after_attempt=MAX_RETRIES + 1,
+            )
+        runnables.append(runnable)
+    runnable = runnables[0].with_fallbacks(runnables[1:]) if len(runnables) > 1 else runnables[0]
+    if role in HEDGE_ROLES:
+        runnable = HedgedRunnable(runnable, role, HEDGE_QUANTILE, HEDGE_MIN_DELAY)
+    return runnable.with_config(callbacks=[_metrics_callbacks[role]])
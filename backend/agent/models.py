@@ -1,10 +1,10 @@
 # models.py
+# 领域模型（待办、档案、偏好），不依赖 langgraph；CRUD 接口与 DAO 只导入这里，agent 状态见 state.py
 
 import json
 from datetime import datetime
 from typing import Any, Literal, Optional
 
-from langgraph.graph import MessagesState
 from pydantic import BaseModel, Field
 
 
@@ -92,7 +92,3 @@ class Instruction(BaseModel):
     @classmethod
     def from_dict(cls, data: dict[str, Any]) -> "Instruction":
         return cls.model_validate(data)
-
-class CustomState(MessagesState, total=False):
-    """继承自 MessagesState，增加 search_results 用于保存网络搜索结果。"""
-    search_results: Optional[str]
\ No newline at end of file
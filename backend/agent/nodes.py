@@ -1,16 +1,27 @@
+import functools
 import json
-import uuid
 from datetime import datetime
 from langchain_core.messages import SystemMessage, merge_message_runs, HumanMessage, AIMessage
 from langchain_core.runnables import RunnableConfig
-from langgraph.store.base import BaseStore
+from langgraph.store.base import BaseStore, Item, PutOp
 from typing import Literal, TypedDict
-from langgraph.constants import END
-from trustcall import create_extractor
-from .models import Profile, ToDo, CustomState, Instruction
-from .utils import Spy, extract_tool_info
+from langgraph.constants import END, TAG_NOSTREAM
+from langgraph.store.postgres import PostgresStore
+from psycopg import OperationalError
+from .models import Profile, ToDo
+from .state import CustomState
+from .utils import Spy, extract_tool_info, is_remove_doc, write_memory_batch
 from .constants import MODEL_SYSTEM_MESSAGE, TRUSTCALL_INSTRUCTION, CREATE_INSTRUCTIONS
-from langchain_openai import ChatOpenAI
+from .scheduler import llm_scheduler, Priority, estimate_tokens
+from .background import get_memory_job_queue
+from .response_cache import response_cache, snapshot_hash
+from .similarity import select_similar_todos, find_duplicate, merge_todo
+from .llm import for_role, role_models
+from .consolidation import consolidate_instructions, INSTRUCTIONS_SEARCH_LIMIT
+from ..utils.ids import uuid7
+from ..utils import invalidation
+from ..utils.metrics import metrics
+from ..utils.pg_pool import get_replica_pool, mark_replica_failed, use_replica
 import os
 from dotenv import load_dotenv
 from langchain_core.messages import ToolMessage
@@ -18,43 +29,112 @@ from langchain_core.messages import ToolMessage
 
 load_dotenv()
 
-model = ChatOpenAI(
-    model=os.getenv("OPENAI_MODEL", "gpt-4o"),
-    base_url=os.getenv("OPENAI_BASE_URL"),
-    api_key=os.getenv("OPENAI_API_KEY"),
-).with_config({
-    "system_message": "你是一个中文助手，请始终用简体中文回答。",
-})
+# 按角色分配模型（见 llm.py），各角色可单独配置模型与备用模型链
+# 模型与抽取器在第一次用到时才构建（trustcall 导入较慢），导入本模块不创建任何客户端
+@functools.cache
+def responder_model():
+    return for_role("responder")
+
+
+@functools.cache
+def instruction_model():
+    return for_role("extractor")
+
+
+def _create_extractor(model, **kwargs):
+    from trustcall import create_extractor
+    return create_extractor(model, **kwargs)
+
+
+@functools.cache
+def profile_extractor():
+    return for_role("extractor", lambda m: _create_extractor(
+        m,
+        tools=[Profile],
+        tool_choice="Profile",
+    ))
+
+# update_todos 读取待办的上限（store.search 默认只返回 10 条）
+TODO_SEARCH_LIMIT = 1000
+# 是否允许 trustcall 删除待办（RemoveDoc）
+TODO_ENABLE_DELETES = os.getenv("TODO_ENABLE_DELETES", "0") == "1"
 
-profile_extractor = create_extractor(
-    model,
-    tools=[Profile],
-    tool_choice="Profile",
-)
 
 class UpdateMemory(TypedDict):
     """ Decision on what memory type to update """
     update_type: Literal['user', 'todo', 'instructions']
 
 
-def task_mAIstro(state: CustomState, config: RunnableConfig, store: BaseStore):
-    """从 store 中读取记忆，个性化 chatbot 的回应，并处理工具调用后的回复"""
+@functools.cache
+def router_model():
+    return for_role("router", lambda m: m.bind_tools([UpdateMemory], parallel_tool_calls=False))
 
-    # Get user ID
-    user_id = config["configurable"]["user_id"]
 
-    # Step 1: 获取用户长期记忆：Profile / To Do / Instructions
+@functools.cache
+def router_is_responder() -> bool:
+    """未单独配置 router 模型时，路由调用就是 responder 模型的回复，可直接返回给用户，不必再调用一次"""
+    return role_models("router") == role_models("responder")
+
+
+_replica_store: PostgresStore | None = None
+
+
+def _get_replica_store() -> PostgresStore:
+    global _replica_store
+    if _replica_store is None:
+        _replica_store = PostgresStore(get_replica_pool())
+    return _replica_store
+
+
+def load_memory_context(store: BaseStore, user_id: str) -> tuple:
+    """
+    读取用户长期记忆并格式化为提示词片段：(profile, todo, instructions)
+    配置了只读副本时优先从副本读取（用户近期有写入或副本不可用时读主库）
+    """
+    if isinstance(store, PostgresStore) and use_replica(user_id):
+        try:
+            context = _load_memory_context(_get_replica_store(), user_id)
+            metrics.incr("pg.reads.replica")
+            return context
+        except OperationalError as e:
+            mark_replica_failed(e)
+    return _load_memory_context(store, user_id)
+
+
+def _load_memory_context(store: BaseStore, user_id: str) -> tuple:
     namespace_profile = ("profile", user_id)
     profile_memories = store.search(namespace_profile)
     user_profile = profile_memories[0].value if profile_memories else None
 
+    # 已归档的待办在 todo_archive 前缀下，不进入上下文
     namespace_todo = ("todo", user_id)
-    todo_memories = store.search(namespace_todo)
+    todo_memories = store.search(namespace_todo, limit=TODO_SEARCH_LIMIT)
     todo = "\n".join(json.dumps(mem.value, ensure_ascii=False) for mem in todo_memories)
 
     namespace_instructions = ("instructions", user_id)
     instructions_memories = store.search(namespace_instructions)
     instructions = "\n".join(json.dumps(mem.value) for mem in instructions_memories)
+    return user_profile, todo, instructions
+
+
+def task_mAIstro(state: CustomState, config: RunnableConfig, store: BaseStore):
+    """从 store 中读取记忆，个性化 chatbot 的回应，并处理工具调用后的回复"""
+
+    # Get user ID
+    user_id = config["configurable"]["user_id"]
+
+    # Step 1: 获取用户长期记忆：Profile / To Do / Instructions（先取版本戳，供回复缓存判断记忆是否在生成期间变化）
+    # 长连接会话会传入上一轮的记忆快照，版本戳未变且跨进程失效广播在线时直接复用
+    memory_stamp = response_cache.stamp(user_id)
+    snapshot = config["configurable"].get("memory_snapshot")
+    if snapshot is not None and snapshot.get("stamp") == memory_stamp and invalidation.is_coherent():
+        metrics.incr("memory_snapshot.hits")
+        user_profile, todo, instructions = snapshot["memory"]
+    else:
+        user_profile, todo, instructions = load_memory_context(store, user_id)
+        if snapshot is not None:
+            metrics.incr("memory_snapshot.misses")
+            snapshot.update(stamp=memory_stamp, memory=(user_profile, todo, instructions))
 
     # Step 2: 生成系统提示词
     system_msg = MODEL_SYSTEM_MESSAGE.format(
@@ -73,11 +153,35 @@ def task_mAIstro(state: CustomState, config: RunnableConfig, store: BaseStore):
     # Step 4: 如果上一条是 ToolMessage，说明上轮刚执行了工具，继续补全自然语言响应
     if isinstance(state["messages"][-1], ToolMessage):
         # 继续调用模型让其根据工具调用结果生成自然语言回复
-        response = model.invoke(messages)
+        with llm_scheduler.slot(user_id, Priority.INTERACTIVE, estimate_tokens(messages)):
+            response = responder_model().invoke(messages)
         return {"messages": [response]}
 
-    # Step 5: 否则正常执行对话逻辑（包括可能触发工具调用）
-    response = model.bind_tools([UpdateMemory], parallel_tool_calls=False).invoke(messages)
+    # Step 5: 单轮的纯读取提问可直接命中回复缓存（记忆快照变化或被写入后自动失效）
+    cache_key = None
+    if response_cache.enabled and len(state["messages"]) == 1 and isinstance(state["messages"][0], HumanMessage):
+        cache_key = response_cache.make_key(
+            state["messages"][0].content,
+            snapshot_hash(user_profile, todo, instructions)
+        )
+        cached = response_cache.get(user_id, cache_key)
+        if cached is not None:
+            return {"messages": [AIMessage(content=cached)]}
+
+    # Step 6: 否则正常执行对话逻辑（包括可能触发工具调用）
+    # 单独配置的 router 模型只负责 UpdateMemory 决策，其文本不转发给用户；不更新记忆时由 responder 生成可见回复
+    with llm_scheduler.slot(user_id, Priority.INTERACTIVE, estimate_tokens(messages)):
+        if router_is_responder():
+            response = router_model().invoke(messages)
+        else:
+            response = router_model().invoke(messages, config={"tags": [TAG_NOSTREAM]})
+    if not response.tool_calls and not router_is_responder():
+        with llm_scheduler.slot(user_id, Priority.INTERACTIVE, estimate_tokens(messages)):
+            response = responder_model().invoke(messages)
+
+    # 没有触发记忆更新的回复才可缓存
+    if cache_key is not None and not response.tool_calls:
+        response_cache.put(user_id, cache_key, response.content, memory_stamp)
     return {"messages": [response]}
 
 
@@ -94,13 +198,17 @@ def update_profile(state: CustomState, config: RunnableConfig, store: BaseStore)
         messages=[SystemMessage(content=TRUSTCALL_INSTRUCTION_FORMATTED)] + state["messages"][:-1]
     ))
 
-    result = profile_extractor.invoke({
-        "messages": updated_messages,
-        "existing": existing_memories
-    })
+    with llm_scheduler.slot(user_id, Priority.BACKGROUND, estimate_tokens(updated_messages, existing_memories)):
+        result = profile_extractor().invoke({
+            "messages": updated_messages,
+            "existing": existing_memories
+        })
 
-    for r, rmeta in zip(result["responses"], result["response_metadata"]):
-        store.put(namespace, rmeta.get("json_doc_id", str(uuid.uuid4())), r.model_dump(mode="json"))
+    ops = [
+        PutOp(namespace, rmeta.get("json_doc_id", uuid7()), r.model_dump(mode="json"))
+        for r, rmeta in zip(result["responses"], result["response_metadata"])
+    ]
+    write_memory_batch(store, "profile", user_id, ops)
 
     tool_calls = state['messages'][-1].tool_calls
     return {
@@ -112,7 +220,11 @@ def update_profile(state: CustomState, config: RunnableConfig, store: BaseStore)
 def update_todos(state: CustomState, config: RunnableConfig, store: BaseStore):
     user_id = config["configurable"]["user_id"]
     namespace = ("todo", user_id)
-    existing_items = store.search(namespace)
+    all_items = store.search(namespace, limit=TODO_SEARCH_LIMIT)
+
+    # 只把与近期对话最相似的 top-k 条待办交给 trustcall，缩短抽取提示词
+    query = "\n".join(m.content for m in state["messages"][-6:] if isinstance(m, HumanMessage))
+    existing_items = select_similar_todos(store, namespace, query, all_items)
 
     tool_name = "ToDo"
     existing_memories = ([(item.key, tool_name, item.value) for item in existing_items] if existing_items else None)
@@ -124,20 +236,46 @@ def update_todos(state: CustomState, config: RunnableConfig, store: BaseStore):
 
     spy = Spy()
 
-    todo_extractor = create_extractor(
-        model,
+    todo_extractor = for_role("extractor", lambda m: _create_extractor(
+        m,
         tools=[ToDo],
         tool_choice=tool_name,
-        enable_inserts=True
-    ).with_listeners(on_end=spy)
-
-    result = todo_extractor.invoke({
-        "messages": updated_messages,
-        "existing": existing_memories
-    })
-
+        enable_inserts=True,
+        enable_deletes=TODO_ENABLE_DELETES
+    )).with_listeners(on_end=spy)
+
+    with llm_scheduler.slot(user_id, Priority.BACKGROUND, estimate_tokens(updated_messages, existing_memories)):
+        result = todo_extractor.invoke({
+            "messages": updated_messages,
+            "existing": existing_memories
+        })
+
+    ops: dict[str, PutOp] = {}
+    known_items = list(all_items)
     for r, rmeta in zip(result["responses"], result["response_metadata"]):
-        store.put(namespace, rmeta.get("json_doc_id", str(uuid.uuid4())), r.model_dump(mode="json"))
+        if is_remove_doc(r):
+            ops[r.json_doc_id] = PutOp(namespace, r.json_doc_id, None)
+            known_items = [item for item in known_items if item.key != r.json_doc_id]
+            continue
+
+        value = r.model_dump(mode="json")
+        key = rmeta.get("json_doc_id")
+        if key is None:
+            # 新增的待办若与已有待办高度相似，视为对已有待办的更新，避免重复
+            duplicate = find_duplicate(value.get("task", ""), known_items)
+            if duplicate is not None:
+                print(f"[update_todos] 新待办与已有待办 {duplicate.key} 重复，合并更新")
+                key = duplicate.key
+                value = merge_todo(duplicate.value, value)
+            else:
+                key = uuid7()
+        value["key"] = key
+        # 同一 key 多次写入时只保留最后一次
+        ops[key] = PutOp(namespace, key, value)
+        now = datetime.now()
+        known_items = [item for item in known_items if item.key != key]
+        known_items.append(Item(value=value, key=key, namespace=namespace, created_at=now, updated_at=now))
+    write_memory_batch(store, "todo", user_id, list(ops.values()))
 
     tool_calls = state['messages'][-1].tool_calls
 
@@ -153,23 +291,19 @@ def update_todos(state: CustomState, config: RunnableConfig, store: BaseStore):
 def update_instructions(state: CustomState, config: RunnableConfig, store: BaseStore):
     user_id = config["configurable"]["user_id"]
     namespace = ("instructions", user_id)
-    existing_items = store.search(namespace)
+    existing_items = store.search(namespace, limit=INSTRUCTIONS_SEARCH_LIMIT)
     existing_instructions = [item.value.get("content") for item in existing_items] if existing_items else []
 
     current_text = "\n".join(existing_instructions)
     system_msg = CREATE_INSTRUCTIONS.format(current_instructions=current_text)
 
-    new_memory = model.invoke(
-        [SystemMessage(content=system_msg)] + state['messages'][:-1] + [
-            HumanMessage(content="请根据对话更新 instructions（用户偏好），只需要返回新增的部分。")]
-    )
+    instruction_messages = [SystemMessage(content=system_msg)] + state['messages'][:-1] + [
+        HumanMessage(content="请根据对话更新 instructions（用户偏好），只需要返回新增的部分。")]
+    with llm_scheduler.slot(user_id, Priority.BACKGROUND, estimate_tokens(instruction_messages)):
+        new_memory = instruction_model().invoke(instruction_messages)
 
-    new_key = str(uuid.uuid4())
-    store.put(namespace, new_key, Instruction(
-        language="zh-CN",
-        content=new_memory.content,
-        key=new_key
-    ).model_dump())
+    # 新增内容与已有说明合并为一条规范记录（去重、限长），而不是不断追加新行
+    consolidate_instructions(store, user_id, new_memory.content, language="zh-CN")
 
     tool_calls = state['messages'][-1].tool_calls
     return {
@@ -178,6 +312,28 @@ def update_instructions(state: CustomState, config: RunnableConfig, store: BaseS
         ]
     }
 
+def schedule_memory_updates(state: CustomState, config: RunnableConfig, store: BaseStore):
+    """延迟模式：把记忆抽取提交为后台任务，立即返回让 task_mAIstro 回复用户"""
+    user_id = config["configurable"]["user_id"]
+    thread_id = config["configurable"].get("thread_id")
+    tool_calls = state['messages'][-1].tool_calls
+    job_queue = get_memory_job_queue()
+
+    tool_messages = []
+    for call in tool_calls:
+        update_type = call["args"].get("update_type")
+        job_queue.submit(
+            idempotency_key=f"{thread_id}:{call['id']}:{update_type}",
+            user_id=user_id,
+            update_type=update_type,
+            messages=state["messages"],
+            thread_id=thread_id,
+        )
+        tool_messages.append(ToolMessage(tool_call_id=call['id'], content="已提交后台更新，稍后生效"))
+
+    return {"messages": tool_messages}
+
+
 def route_message(state: CustomState, config: RunnableConfig, store: BaseStore) -> tuple[str, CustomState]:
     messages = state['messages']
     last_msg = messages[-1]
@@ -205,6 +361,10 @@ def route_message(state: CustomState, config: RunnableConfig, store: BaseStore)
         "messages": new_messages
     }
 
+    # 延迟模式：记忆抽取交给后台队列
+    if config["configurable"].get("deferred_memory") and get_memory_job_queue() is not None:
+        return "schedule_memory_updates", new_state
+
     # 逐个分支跳转执行工具更新
     # 用 langgraph 的“多分支支持”处理（你应该在 flow 中对每个 update_type 建立分支）
     if "user" in update_types:
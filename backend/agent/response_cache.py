@@ -0,0 +1,128 @@
+# response_cache.py
+
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from .constants import MODEL_SYSTEM_MESSAGE
+from ..utils import invalidation
+from ..utils.metrics import metrics
+
+load_dotenv()
+
+# 提示词变更后旧缓存自动失效
+PROMPT_VERSION = hashlib.sha1(MODEL_SYSTEM_MESSAGE.encode("utf-8")).hexdigest()[:12]
+
+_TRAILING_PUNCTUATION = "?？!！。.~～ "
+
+
+def normalize_message(text: str) -> str:
+    """统一全半角、大小写与空白，去掉结尾标点"""
+    text = unicodedata.normalize("NFKC", text).lower().strip()
+    text = re.sub(r"\s+", " ", text)
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+
+def snapshot_hash(*parts: Optional[str]) -> str:
+    """用户记忆快照（档案 / 待办 / 偏好）的哈希"""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    纯读取对话轮次的回复缓存
+    key = (规范化后的用户消息, 记忆快照哈希, 提示词版本)，按用户分组，带 TTL 与容量上限；
+    用户任一记忆命名空间被写入时清空该用户的全部条目。
+    条目另带读取记忆时的版本戳（invalidation.version_stamp），命中时版本戳不一致视为未命中：
+    即使失效通知晚到或丢失（其他 worker 的写入、广播重连），也不会返回基于旧记忆的回复
+    """
+
+    def __init__(self, enabled: bool = False, ttl: float = 300.0, max_entries: int = 10000):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, str], tuple[str, float, tuple]] = OrderedDict()
+        self._user_keys: dict[str, set[str]] = {}
+        self._hits = 0
+        self._misses = 0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(
+            enabled=os.getenv("AGENT_RESPONSE_CACHE", "0") == "1",
+            ttl=float(os.getenv("AGENT_RESPONSE_CACHE_TTL", "300")),
+            max_entries=int(os.getenv("AGENT_RESPONSE_CACHE_MAX_ENTRIES", "10000")),
+        )
+
+    @staticmethod
+    def make_key(message: str, memory_hash: str) -> str:
+        raw = f"{normalize_message(message)}\x00{memory_hash}\x00{PROMPT_VERSION}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def stamp(user_id: str) -> tuple:
+        """读取记忆之前调用，结果传给 put"""
+        return invalidation.version_stamp(user_id)
+
+    def get(self, user_id: str, key: str) -> Optional[str]:
+        stamp = invalidation.version_stamp(user_id)
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is not None and (entry[1] < time.monotonic() or entry[2] != stamp):
+                if entry[2] != stamp:
+                    metrics.incr("response_cache.stale")
+                self._drop(user_id, key)
+                entry = None
+
+            if entry is None:
+                self._misses += 1
+                metrics.incr("response_cache.misses")
+            else:
+                self._entries.move_to_end((user_id, key))
+                self._hits += 1
+                metrics.incr("response_cache.hits")
+            metrics.gauge("response_cache.hit_rate", self._hits / (self._hits + self._misses))
+            return entry[0] if entry else None
+
+    def put(self, user_id: str, key: str, content: str, stamp: tuple) -> None:
+        """stamp 为读取记忆前取得的版本戳；生成回复期间记忆已被写入时不缓存"""
+        if stamp != invalidation.version_stamp(user_id):
+            metrics.incr("response_cache.stale")
+            return
+        with self._lock:
+            self._entries[(user_id, key)] = (content, time.monotonic() + self.ttl, stamp)
+            self._entries.move_to_end((user_id, key))
+            self._user_keys.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                (old_user, old_key), _ = self._entries.popitem(last=False)
+                self._user_keys.get(old_user, set()).discard(old_key)
+            metrics.gauge("response_cache.entries", len(self._entries))
+
+    def invalidate_user(self, user_id: str) -> None:
+        with self._lock:
+            keys = self._user_keys.pop(user_id, set())
+            for key in keys:
+                self._entries.pop((user_id, key), None)
+            if keys:
+                metrics.incr("response_cache.invalidations")
+            metrics.gauge("response_cache.entries", len(self._entries))
+
+    def _drop(self, user_id: str, key: str) -> None:
+        self._entries.pop((user_id, key), None)
+        self._user_keys.get(user_id, set()).discard(key)
+
+
+response_cache = ResponseCache.from_env()
+invalidation.add_listener(lambda kind, user_id, version: response_cache.invalidate_user(user_id))
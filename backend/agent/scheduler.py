@@ -0,0 +1,210 @@
+# scheduler.py
+
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Iterable
+
+from dotenv import load_dotenv
+
+from ..utils.metrics import metrics
+
+
+class Priority(IntEnum):
+    """模型调用优先级，数值越小越先调度"""
+    INTERACTIVE = 0  # 直接回复用户的调用（task_mAIstro）
+    BACKGROUND = 1   # 记忆抽取等后台调用（update_*、trustcall）
+
+
+class TokenBucket:
+    """令牌桶：按分钟速率补充，rate 为 0 表示不限速"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.available = self.capacity
+        self.updated_at = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """距离可以取出 amount 个令牌还需等待的秒数"""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def consume(self, amount: float) -> None:
+        if self.unlimited:
+            return
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+
+@dataclass
+class _Waiter:
+    priority: Priority
+    seq: int
+    user_id: str
+    tokens: int
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class LLMScheduler:
+    """
+    所有模型调用的集中调度器：
+    - 全局并发上限与单用户并发上限
+    - 按请求数、token 数的令牌桶限流
+    - 优先级队列：交互回复优先于后台记忆抽取；同优先级下在途调用少的用户优先，其次先来先服务
+    """
+
+    def __init__(
+            self,
+            max_concurrency: int = 8,
+            max_per_user: int = 2,
+            requests_per_minute: float = 0,
+            tokens_per_minute: float = 0,
+            queue_timeout: float = 120.0,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_per_user = max(1, max_per_user)
+        self.queue_timeout = queue_timeout
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting: list[_Waiter] = []
+        self._inflight = 0
+        self._user_inflight: dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "LLMScheduler":
+        load_dotenv()
+        return cls(
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            max_per_user=int(os.getenv("LLM_MAX_CONCURRENCY_PER_USER", "2")),
+            requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")),
+            tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+            queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "120")),
+        )
+
+    @contextmanager
+    def slot(self, user_id: str, priority: Priority = Priority.INTERACTIVE, tokens: int = 0):
+        """
+        申请一次模型调用的执行名额，with 块结束后释放
+        :param user_id: 用户id，用于单用户并发限制与公平调度
+        :param priority: 调用优先级
+        :param tokens: 预估的输入 token 数，用于 token 限流
+        """
+        waiter = self._acquire(user_id, priority, tokens)
+        try:
+            yield
+        finally:
+            self._release(waiter)
+
+    def _next_waiter(self) -> _Waiter | None:
+        if self._inflight >= self.max_concurrency:
+            return None
+        candidates = [
+            w for w in self._waiting
+            if self._user_inflight.get(w.user_id, 0) < self.max_per_user
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda w: (w.priority, self._user_inflight.get(w.user_id, 0), w.seq))
+
+    def _acquire(self, user_id: str, priority: Priority, tokens: int) -> _Waiter:
+        waiter = _Waiter(priority=priority, seq=next(self._seq), user_id=user_id, tokens=tokens)
+        deadline = waiter.enqueued_at + self.queue_timeout
+
+        with self._cond:
+            self._waiting.append(waiter)
+            self._report_queue()
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        metrics.incr("llm.queue_timeouts")
+                        raise TimeoutError(f"[LLMScheduler] 等待模型调用名额超时 ({self.queue_timeout}s)")
+
+                    if self._next_waiter() is waiter:
+                        delay = max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+                        if delay <= 0:
+                            break
+                        self._cond.wait(min(delay, remaining))
+                    else:
+                        self._cond.wait(remaining)
+            except BaseException:
+                self._waiting.remove(waiter)
+                self._report_queue()
+                self._cond.notify_all()
+                raise
+
+            self._waiting.remove(waiter)
+            self._requests.consume(1)
+            self._tokens.consume(tokens)
+            self._inflight += 1
+            self._user_inflight[user_id] = self._user_inflight.get(user_id, 0) + 1
+            self._report_queue()
+            # 名额可能还有剩余，唤醒其他等待者重新判断
+            self._cond.notify_all()
+
+        metrics.incr(f"llm.calls.{priority.name.lower()}")
+        metrics.observe("llm.queue_wait_seconds", time.monotonic() - waiter.enqueued_at)
+        return waiter
+
+    def _release(self, waiter: _Waiter) -> None:
+        with self._cond:
+            self._inflight -= 1
+            left = self._user_inflight.get(waiter.user_id, 1) - 1
+            if left > 0:
+                self._user_inflight[waiter.user_id] = left
+            else:
+                self._user_inflight.pop(waiter.user_id, None)
+            self._report_queue()
+            self._cond.notify_all()
+
+    def _report_queue(self) -> None:
+        metrics.gauge("llm.inflight", self._inflight)
+        metrics.gauge("llm.queue_depth", len(self._waiting))
+        for p in Priority:
+            metrics.gauge(
+                f"llm.queue_depth.{p.name.lower()}",
+                sum(1 for w in self._waiting if w.priority == p)
+            )
+
+
+def estimate_tokens(*parts: Iterable | str | None) -> int:
+    """
+    粗略估算输入 token 数（中文约一字一 token，英文约四字符一 token，这里统一按两字符计）
+    :param parts: 消息列表、字符串或任意可 str() 的对象
+    """
+    total = 0
+    for part in parts:
+        if part is None:
+            continue
+        if isinstance(part, str):
+            total += len(part)
+            continue
+        for item in part:
+            content = getattr(item, "content", item)
+            total += len(content if isinstance(content, str) else str(content))
+    return max(1, total // 2)
+
+
+llm_scheduler = LLMScheduler.from_env()
@@ -0,0 +1,152 @@
+# serde.py
+
+import os
+import zlib
+from typing import Any, Optional
+
+import orjson
+from dotenv import load_dotenv
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from ..utils.metrics import metrics
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，未安装时 zstd 回退为 zlib
+    zstandard = None
+
+load_dotenv()
+
+# 检查点序列化格式：msgpack（ormsgpack，默认）/ json（orjson 编码，可读、便于排查）
+CHECKPOINT_SERDE = os.getenv("CHECKPOINT_SERDE", "msgpack")
+# 压缩算法：zstd / zlib / none；只压缩超过阈值（字节）的数据，小数据压缩得不偿失
+CHECKPOINT_COMPRESSION = os.getenv("CHECKPOINT_COMPRESSION", "zstd")
+CHECKPOINT_COMPRESS_THRESHOLD = int(os.getenv("CHECKPOINT_COMPRESS_THRESHOLD", "4096"))
+CHECKPOINT_COMPRESSION_LEVEL = int(os.getenv("CHECKPOINT_COMPRESSION_LEVEL", "3"))
+
+_ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS
+    # 以下类型交给 JsonPlusSerializer 编码，读取时才能还原成原类型
+    | orjson.OPT_PASSTHROUGH_DATETIME
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+    | orjson.OPT_PASSTHROUGH_SUBCLASS
+)
+
+
+class OrjsonPlusSerializer(JsonPlusSerializer):
+    """用 orjson 编解码 JSON 的 JsonPlusSerializer；写出的仍是 "json" 类型，与默认序列化器互相可读"""
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        if obj is None or isinstance(obj, (bytes, bytearray)):
+            return super().dumps_typed(obj)
+        try:
+            return "json", orjson.dumps(obj, default=self._default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # orjson 不支持的情况（如超大整数）回退到 msgpack
+            return super().dumps_typed(obj)
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_ == "json":
+            return self._revive(orjson.loads(payload))
+        return super().loads_typed(data)
+
+    def _revive(self, value: Any) -> Any:
+        # 与 json.loads(object_hook=...) 相同：自底向上还原 LangChain 对象
+        if isinstance(value, dict):
+            return self._reviver({k: self._revive(v) for k, v in value.items()})
+        if isinstance(value, list):
+            return [self._revive(v) for v in value]
+        return value
+
+
+class _Codec:
+    def __init__(self, name: str, level: int):
+        self.name = name
+        if name == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=level)
+            self._decompressor = zstandard.ZstdDecompressor()
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            return self._compressor.compress(data)
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            return self._decompressor.decompress(data)
+        return zlib.decompress(data)
+
+
+def _codec(name: str, level: int) -> Optional[_Codec]:
+    if name in ("", "none"):
+        return None
+    if name == "zstd" and zstandard is None:
+        print("[Checkpoint] 未安装 zstandard，检查点压缩回退为 zlib")
+        name = "zlib"
+    if name not in ("zstd", "zlib"):
+        raise ValueError(f"不支持的检查点压缩算法: {name}")
+    return _Codec(name, min(level, 9) if name == "zlib" else level)
+
+
+class CompressedSerializer(SerializerProtocol):
+    """
+    在内层序列化器外加一层压缩：超过阈值的数据压缩后类型标记为 "<原类型>+<算法>"（如 msgpack+zstd）
+    读取时按标记解压，未压缩的旧检查点照常读取
+    """
+
+    def __init__(self, inner: SerializerProtocol, compression: str = "zstd",
+                 threshold: int = CHECKPOINT_COMPRESS_THRESHOLD, level: int = CHECKPOINT_COMPRESSION_LEVEL):
+        self.inner = inner
+        self.threshold = threshold
+        self.codec = _codec(compression, level)
+        # 解压不受当前配置影响，切换算法后仍能读取旧数据
+        self._decoders = {"zlib": _Codec("zlib", 0)}
+        if zstandard is not None:
+            self._decoders["zstd"] = _Codec("zstd", 0)
+
+    def dumps(self, obj: Any) -> bytes:
+        return self.inner.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return self.inner.loads(data)
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        type_, payload = self.inner.dumps_typed(obj)
+        if self.codec is None or payload is None or len(payload) < self.threshold:
+            return type_, payload
+        compressed = self.codec.compress(payload)
+        if len(compressed) >= len(payload):
+            return type_, payload
+        metrics.incr("checkpoint.bytes_raw", len(payload))
+        metrics.incr("checkpoint.bytes_stored", len(compressed))
+        return f"{type_}+{self.codec.name}", compressed
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        type_, payload = data
+        base, sep, algorithm = type_.rpartition("+")
+        if sep and algorithm in ("zstd", "zlib"):
+            decoder = self._decoders.get(algorithm)
+            if decoder is None:
+                raise RuntimeError(f"检查点使用 {algorithm} 压缩，需要安装 zstandard 才能读取")
+            return self.inner.loads_typed((base, decoder.decompress(payload)))
+        return self.inner.loads_typed(data)
+
+
+def build_serializer(fmt: str = CHECKPOINT_SERDE, compression: str = CHECKPOINT_COMPRESSION,
+                     threshold: int = CHECKPOINT_COMPRESS_THRESHOLD,
+                     level: int = CHECKPOINT_COMPRESSION_LEVEL) -> SerializerProtocol:
+    """
+    按配置构建检查点序列化器
+    :param fmt: msgpack / json
+    :param compression: zstd / zlib / none
+    """
+    if fmt == "msgpack":
+        inner = JsonPlusSerializer()
+    elif fmt == "json":
+        inner = OrjsonPlusSerializer()
+    else:
+        raise ValueError(f"不支持的检查点序列化格式: {fmt}")
+    return CompressedSerializer(inner, compression, threshold, level)
@@ -0,0 +1,122 @@
+# similarity.py
+
+import hashlib
+import math
+import os
+import re
+import unicodedata
+from typing import Iterable, Optional
+
+from dotenv import load_dotenv
+from langgraph.store.base import BaseStore, Item
+
+load_dotenv()
+
+EMBED_DIMS = int(os.getenv("TODO_EMBED_DIMS", "256"))
+EXTRACT_TOP_K = int(os.getenv("TODO_EXTRACT_TOP_K", "8"))
+DUPLICATE_THRESHOLD = float(os.getenv("TODO_DUPLICATE_THRESHOLD", "0.85"))
+
+_CJK = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+")
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _features(text: str) -> list[str]:
+    """中文取单字与相邻双字，英文取单词与词内三字母片段"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    features = []
+    for run in _CJK.findall(text):
+        features.extend(run)
+        features.extend(run[i:i + 2] for i in range(len(run) - 1))
+    for word in _WORD.findall(text):
+        features.append(word)
+        padded = f"#{word}#"
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return features
+
+
+def embed_texts(texts: list[str]) -> list[list[float]]:
+    """
+    本地哈希向量（feature hashing），无需模型与网络，结果确定
+    可直接作为 PostgresStore / InMemoryStore 的 index["embed"]
+    """
+    vectors = []
+    for text in texts:
+        vector = [0.0] * EMBED_DIMS
+        for feature in _features(text or ""):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % EMBED_DIMS
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        vectors.append([v / norm for v in vector])
+    return vectors
+
+
+def cosine(a: list[float], b: list[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+def todo_index_config() -> Optional[dict]:
+    """store 的向量索引配置，TODO_VECTOR_INDEX=1 时启用（Postgres 需要 pgvector 扩展）"""
+    if os.getenv("TODO_VECTOR_INDEX", "0") != "1":
+        return None
+    return {"dims": EMBED_DIMS, "embed": embed_texts, "fields": ["task"]}
+
+
+def _task_of(item: Item) -> str:
+    return str(item.value.get("task", ""))
+
+
+def select_similar_todos(store: BaseStore, namespace: tuple, query: str,
+                         items: list[Item], k: int = EXTRACT_TOP_K) -> list[Item]:
+    """
+    从 items 中选出与 query 最相似的 k 条待办，用作 trustcall 的 existing
+    store 配置了向量索引时优先使用 store 的相似度检索，未建向量的条目（如直接经 DAO 写入的）用本地向量补齐
+    """
+    if len(items) <= k or not query.strip():
+        return items
+
+    selected: dict[str, Item] = {}
+    if getattr(store, "index_config", None):
+        try:
+            for hit in store.search(namespace, query=query, limit=k):
+                selected[hit.key] = hit
+        except Exception as e:
+            print(f"[Similarity] 向量检索失败，使用本地相似度: {e}")
+
+    if len(selected) < k:
+        query_vector = embed_texts([query])[0]
+        candidates = [item for item in items if item.key not in selected]
+        vectors = embed_texts([_task_of(item) for item in candidates])
+        ranked = sorted(zip(candidates, vectors), key=lambda p: cosine(query_vector, p[1]), reverse=True)
+        for item, _ in ranked[:k - len(selected)]:
+            selected[item.key] = item
+
+    return list(selected.values())
+
+
+def find_duplicate(task: str, items: Iterable[Item],
+                   threshold: float = DUPLICATE_THRESHOLD) -> Optional[Item]:
+    """返回与 task 相似度不低于阈值的最相似待办，没有则 None"""
+    items = list(items)
+    if not items or not task.strip():
+        return None
+    task_vector = embed_texts([task])[0]
+    vectors = embed_texts([_task_of(item) for item in items])
+    best_score, best_item = max(
+        ((cosine(task_vector, vector), item) for item, vector in zip(items, vectors)),
+        key=lambda p: p[0]
+    )
+    return best_item if best_score >= threshold else None
+
+
+def merge_todo(existing: dict, incoming: dict) -> dict:
+    """把判定为重复的新待办合并进已有待办：新字段覆盖旧字段，solutions / planned_edits 取并集"""
+    merged = {**existing, **{k: v for k, v in incoming.items() if v not in (None, [], "")}}
+    for field in ("solutions", "planned_edits"):
+        combined = list(existing.get(field) or []) + list(incoming.get(field) or [])
+        merged[field] = list(dict.fromkeys(combined))
+    # 新抽取的待办默认是 not started，不应覆盖已有进度
+    if incoming.get("status") == "not started" and existing.get("status"):
+        merged["status"] = existing["status"]
+    return merged
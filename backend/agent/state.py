@@ -0,0 +1,10 @@
+# state.py
+
+from typing import Optional
+
+from langgraph.graph import MessagesState
+
+
+class CustomState(MessagesState, total=False):
+    """继承自 MessagesState，增加 search_results 用于保存网络搜索结果。"""
+    search_results: Optional[str]
@@ -0,0 +1,495 @@
+# tiered_store.py
+
+import asyncio
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, Optional
+
+from dotenv import load_dotenv
+from langgraph.store.base import (
+    BaseStore, GetOp, Item, ListNamespacesOp, Op, PutOp, Result, SearchItem, SearchOp,
+)
+
+from ..utils import invalidation
+from ..utils.metrics import metrics
+
+load_dotenv()
+
+STORE_WRITE_BEHIND = os.getenv("STORE_WRITE_BEHIND", "0") == "1"
+# 本地日志文件；多进程部署时每个进程自动使用 <path>.1、<path>.2 ...，旁边的 .lock 文件是各槽位的进程锁，不要删除
+STORE_JOURNAL_PATH = os.getenv("STORE_JOURNAL_PATH", "data/store_journal.log")
+# 批量刷写间隔（秒）与单批最大写入数
+STORE_FLUSH_INTERVAL = float(os.getenv("STORE_FLUSH_INTERVAL", "0.5"))
+STORE_FLUSH_BATCH = int(os.getenv("STORE_FLUSH_BATCH", "500"))
+# 内存层最多保留的条目数，超出时按 LRU 淘汰已落库的条目（未落库的永不淘汰）
+STORE_CACHE_MAX_ENTRIES = int(os.getenv("STORE_CACHE_MAX_ENTRIES", "50000"))
+
+
+@dataclass
+class _Entry:
+    value: Optional[dict]  # None 表示已删除，尚未落库
+    created_at: datetime
+    updated_at: datetime
+    index: Any = None
+    seq: int = 0  # 未落库时为最近一次写入的序号，已落库为 0
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _compare(actual: Any, expected: Any) -> bool:
+    if not isinstance(expected, dict):
+        return actual == expected
+    operators = {
+        "$eq": lambda a, b: a == b, "$ne": lambda a, b: a != b,
+        "$gt": lambda a, b: a is not None and a > b, "$gte": lambda a, b: a is not None and a >= b,
+        "$lt": lambda a, b: a is not None and a < b, "$lte": lambda a, b: a is not None and a <= b,
+    }
+    return all(op in operators and operators[op](actual, b) for op, b in expected.items())
+
+
+def _matches(value: dict, filter: Optional[dict]) -> bool:
+    return not filter or all(_compare(value.get(k), v) for k, v in filter.items())
+
+
+class _Journal:
+    """
+    追加写的本地日志：写入先落日志（fsync）再确认；刷写成功后用剩余未落库的条目原子地重写
+    每个日志槽位（<path>、<path>.1 ...）有一个长期存在的锁文件 <槽位>.lock，进程在整个生命周期内持有它的 flock；
+    锁不加在日志文件本身上，重写时替换日志文件不会出现无锁的空档，其他进程不会把仍在使用的日志当作遗留文件
+    启动时接管已无进程持有锁的槽位并回放其日志
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.base_path = path
+        self.path, self._lock_file = self._claim(path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    @staticmethod
+    def _try_lock(path: str):
+        """尝试锁定日志槽位，成功时返回锁文件（关闭即释放）"""
+        file = open(f"{path}.lock", "a+")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return file
+        except BlockingIOError:
+            file.close()
+            return None
+
+    def _claim(self, path: str):
+        for n in range(1024):
+            candidate = path if n == 0 else f"{path}.{n}"
+            file = self._try_lock(candidate)
+            if file is not None:
+                return candidate, file
+        raise RuntimeError(f"无法获取写入日志文件: {path}")
+
+    def claim_orphans(self) -> list[tuple[str, Any]]:
+        """
+        其他已退出进程遗留的日志文件（槽位锁当前无人持有）
+        :return: [(日志路径, 锁文件)]；返回时已持有这些槽位的锁，回放并删除日志后关闭锁文件释放
+        """
+        orphans = []
+        for path in sorted(glob.glob(f"{glob.escape(self.base_path)}*")):
+            if path == self.path or path.endswith((".tmp", ".lock")):
+                continue
+            lock = self._try_lock(path)
+            if lock is not None:
+                orphans.append((path, lock))
+        return orphans
+
+    @staticmethod
+    def read(path: str) -> list[dict]:
+        records = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # 崩溃时写了一半的最后一行
+                    break
+        return records
+
+    def append(self, records: list[dict]) -> None:
+        self._file.write("".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def rewrite(self, records: list[dict]) -> None:
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        # 原文件已被替换，重新打开；槽位锁在锁文件上，替换期间一直持有
+        old = self._file
+        self._file = open(self.path, "a", encoding="utf-8")
+        old.close()
+
+    def close(self) -> None:
+        self._file.close()
+        self._lock_file.close()
+
+
+class TieredStore(BaseStore):
+    """
+    写回式分层 store：内存层 + 本地日志 + 后端（PostgresStore）
+    - 写：先追加到本地日志并 fsync，再更新内存层后立即返回；后台线程按批把未落库的写入刷到后端，失败时保留并重试
+    - 读：get 优先命中内存层；search 在后端结果上叠加未落库的写入，整个命名空间加载过且跨进程失效广播在线时直接由内存层返回
+    - 后端暂时不可用时，读取降级为内存层中的数据，写入照常确认
+    - 启动时回放日志中未落库的写入；内存层按 LRU 淘汰已落库的条目
+    其他进程 / DAO 对后端的写入通过 invalidation 监听清除对应命名空间的已落库条目；
+    刷写成功后再广播一次，让按后端数据计算的 ETag 等缓存在数据真正落库后失效
+    """
+
+    def __init__(self, backend: BaseStore, journal_path: str = STORE_JOURNAL_PATH,
+                 flush_interval: float = STORE_FLUSH_INTERVAL, flush_batch: int = STORE_FLUSH_BATCH,
+                 max_entries: int = STORE_CACHE_MAX_ENTRIES, setup_backend: "bool | Callable[[], BaseStore]" = False,
+                 on_backend_ready: Optional[Callable[[], None]] = None):
+        self.backend = backend
+        self.index_config = getattr(backend, "index_config", None)
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.max_entries = max_entries
+
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[tuple[tuple, str], _Entry]" = OrderedDict()
+        self._dirty: dict[tuple[tuple, str], int] = {}
+        self._complete: set[tuple] = set()  # 已整体加载到内存层的命名空间
+        self._seq = 0
+        # 每完成一批刷写加一：读取后端期间发生过刷写时，读到的可能是刷写前的数据，不能缓存为已落库
+        self._flush_gen = 0
+        # 本线程正在广播自己刷写完成的命名空间，监听回调不必清除内存层（内存层已是最新）
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        # 启动时后端不可用：由刷写线程在第一次刷写前完成建表，之后调用 on_backend_ready（如安装变更触发器）
+        # setup_backend 为函数时由它建表并返回可用的后端（如向量索引不可用时换成不带索引的 store）
+        self._backend_ready = not setup_backend
+        self._setup_backend = setup_backend if callable(setup_backend) else None
+        self._on_backend_ready = on_backend_ready
+
+        self._journal = _Journal(journal_path)
+        self._replay()
+        invalidation.add_listener(self._on_invalidate)
+        self._thread = threading.Thread(target=self._flush_loop, name="tiered-store-flush", daemon=True)
+        self._thread.start()
+
+    # ==================== 内存层 ====================
+
+    def _touch(self, k: tuple[tuple, str]) -> Optional[_Entry]:
+        entry = self._entries.get(k)
+        if entry is not None:
+            self._entries.move_to_end(k)
+        return entry
+
+    def _cache_clean(self, item: Item) -> None:
+        k = (tuple(item.namespace), item.key)
+        if k in self._dirty:
+            return
+        self._entries[k] = _Entry(dict(item.value), item.created_at, item.updated_at)
+        self._entries.move_to_end(k)
+
+    def _evict(self) -> None:
+        if len(self._entries) <= self.max_entries:
+            return
+        for k in list(self._entries):
+            if len(self._entries) <= self.max_entries:
+                break
+            if k in self._dirty:
+                continue
+            del self._entries[k]
+            self._complete = {ns for ns in self._complete if k[0][:len(ns)] != ns}
+            metrics.incr("tiered_store.evictions")
+
+    def _on_invalidate(self, kind: str, user_id: str, version: int) -> None:
+        namespace = (kind, user_id)
+        if namespace in getattr(self._local, "flushed", ()):
+            return
+        with self._lock:
+            for k in [k for k in self._entries if k[0] == namespace and k not in self._dirty]:
+                del self._entries[k]
+            self._complete = {ns for ns in self._complete if ns != namespace and namespace[:len(ns)] != ns}
+
+    @staticmethod
+    def _item(k: tuple[tuple, str], entry: _Entry, score: Optional[float] = None, search: bool = False):
+        namespace, key = k
+        if search:
+            return SearchItem(namespace, key, entry.value, entry.created_at, entry.updated_at, score)
+        return Item(value=entry.value, key=key, namespace=namespace,
+                    created_at=entry.created_at, updated_at=entry.updated_at)
+
+    # ==================== 写入 ====================
+
+    def _apply_puts(self, puts: list[PutOp], journal: bool = True) -> None:
+        # 同一批内对同一条目的多次写入只保留最后一次
+        latest: dict[tuple[tuple, str], PutOp] = {}
+        for op in puts:
+            latest[(tuple(op.namespace), op.key)] = op
+        with self._lock:
+            records = []
+            now = _now()
+            for k, op in latest.items():
+                self._seq += 1
+                previous = self._entries.get(k)
+                created_at = previous.created_at if previous is not None and previous.value is not None else now
+                self._entries[k] = _Entry(op.value, created_at, now, op.index, self._seq)
+                self._entries.move_to_end(k)
+                self._dirty[k] = self._seq
+                records.append({"namespace": list(k[0]), "key": k[1], "value": op.value,
+                                "index": op.index if isinstance(op.index, list) else op.index is not False})
+            if journal:
+                self._journal.append(records)
+            metrics.gauge("tiered_store.dirty", len(self._dirty))
+        self._wakeup.set()
+
+    def _replay(self) -> None:
+        """回放本进程日志与遗留日志中未落库的写入"""
+        orphans = self._journal.claim_orphans()
+        try:
+            paths = [self._journal.path] + [path for path, _ in orphans]
+            puts = []
+            for path in paths:
+                for record in _Journal.read(path):
+                    index = record.get("index")
+                    puts.append(PutOp(tuple(record["namespace"]), record["key"], record["value"],
+                                      None if index is True else index))
+            if puts:
+                self._apply_puts(puts, journal=False)
+                # 合并后写入本进程的日志，再删除遗留文件（删除前一直持有其槽位锁）
+                with self._lock:
+                    self._journal.rewrite(self._journal_records())
+                metrics.incr("tiered_store.replayed", len(puts))
+                print(f"[TieredStore] 已回放 {len(puts)} 条未落库的写入")
+            for path in paths[1:]:
+                os.remove(path)
+        finally:
+            for _, lock in orphans:
+                lock.close()
+
+    def _journal_records(self) -> list[dict]:
+        records = []
+        for k in self._dirty:
+            entry = self._entries[k]
+            records.append({"namespace": list(k[0]), "key": k[1], "value": entry.value,
+                            "index": entry.index if isinstance(entry.index, list) else entry.index is not False})
+        return records
+
+    # ==================== 刷写 ====================
+
+    def _flush_loop(self) -> None:
+        backoff = self.flush_interval
+        while not self._stopped.is_set():
+            self._wakeup.wait(backoff)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                backoff = self.flush_interval
+            except Exception as e:
+                metrics.incr("tiered_store.flush_errors")
+                backoff = min(max(backoff * 2, self.flush_interval), 30.0)
+                print(f"[TieredStore] 刷写后端失败，{backoff:.1f}s 后重试: {e}")
+
+    def flush(self) -> int:
+        """把未落库的写入按批刷到后端，返回刷写条数；后端报错时抛出，条目保持未落库"""
+        if not self._backend_ready:
+            if self._setup_backend is not None:
+                self.backend = self._setup_backend()
+                self.index_config = getattr(self.backend, "index_config", None)
+            else:
+                self.backend.setup()
+            self._backend_ready = True
+            print("[TieredStore] 后端已就绪")
+            if self._on_backend_ready is not None:
+                try:
+                    self._on_backend_ready()
+                except Exception as e:
+                    print(f"[TieredStore] 后端就绪回调失败: {e}")
+
+        total = 0
+        while True:
+            with self._lock:
+                pending = list(self._dirty.items())[:self.flush_batch]
+                ops = []
+                for k, _ in pending:
+                    entry = self._entries[k]
+                    ops.append(PutOp(k[0], k[1], entry.value, entry.index))
+            if not pending:
+                return total
+
+            start = time.monotonic()
+            self.backend.batch(ops)
+            metrics.observe("tiered_store.flush_seconds", time.monotonic() - start)
+            metrics.incr("tiered_store.flushed", len(ops))
+
+            with self._lock:
+                for k, seq in pending:
+                    # 刷写期间又被写入的条目保持未落库，等下一批
+                    if self._dirty.get(k) != seq:
+                        continue
+                    del self._dirty[k]
+                    entry = self._entries[k]
+                    if entry.value is None:
+                        del self._entries[k]
+                    else:
+                        entry.seq = 0
+                        entry.index = None
+                self._flush_gen += 1
+                self._journal.rewrite(self._journal_records())
+                metrics.gauge("tiered_store.dirty", len(self._dirty))
+                self._evict()
+            total += len(pending)
+            self._announce_flushed({k[0] for k, _ in pending})
+
+    def _announce_flushed(self, namespaces: set[tuple]) -> None:
+        """
+        写入时的 invalidation.bump 发生在落库之前，期间按后端数据计算的结果（如 ETag）会缓存在新版本号下；
+        落库后再 bump 一次，让这些缓存失效。本进程的内存层已是最新，不因此清除
+        """
+        flushed = {ns for ns in namespaces if len(ns) == 2 and ns[0] in invalidation.NAMESPACE_KINDS}
+        self._local.flushed = flushed
+        try:
+            for kind, user_id in flushed:
+                invalidation.bump(kind, user_id)
+        finally:
+            self._local.flushed = ()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """停止刷写线程并尽量把剩余写入刷到后端（失败的仍保留在日志中，下次启动回放）"""
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"[TieredStore] 关闭时刷写失败，{len(self._dirty)} 条写入将在下次启动时回放: {e}")
+        self._journal.close()
+
+    # ==================== 读取 ====================
+
+    def _get(self, op: GetOp) -> Optional[Item]:
+        k = (tuple(op.namespace), op.key)
+        with self._lock:
+            entry = self._touch(k)
+            if entry is not None:
+                metrics.incr("tiered_store.hits")
+                return self._item(k, entry) if entry.value is not None else None
+            complete = any(k[0][:len(ns)] == ns for ns in self._complete) and invalidation.is_coherent()
+            flush_gen = self._flush_gen
+        if complete:
+            return None
+
+        metrics.incr("tiered_store.misses")
+        try:
+            item = self.backend.batch([op])[0]
+        except Exception as e:
+            metrics.incr("tiered_store.degraded_reads")
+            print(f"[TieredStore] 后端读取失败，按未找到处理: {e}")
+            return None
+        if item is not None:
+            with self._lock:
+                if self._flush_gen == flush_gen:
+                    self._cache_clean(item)
+                    self._evict()
+        return item
+
+    def _dirty_under(self, prefix: tuple) -> list[tuple[tuple[tuple, str], _Entry]]:
+        return [(k, self._entries[k]) for k in self._dirty if k[0][:len(prefix)] == prefix]
+
+    def _search_memory(self, op: SearchOp) -> list[SearchItem]:
+        prefix = tuple(op.namespace_prefix)
+        with self._lock:
+            matched = [
+                (k, entry) for k, entry in self._entries.items()
+                if k[0][:len(prefix)] == prefix and entry.value is not None and _matches(entry.value, op.filter)
+            ]
+        matched.sort(key=lambda p: p[1].updated_at, reverse=True)
+        return [self._item(k, entry, search=True) for k, entry in matched[op.offset:op.offset + op.limit]]
+
+    def _search(self, op: SearchOp) -> list[SearchItem]:
+        prefix = tuple(op.namespace_prefix)
+        with self._lock:
+            complete = prefix in self._complete and invalidation.is_coherent()
+            # 读取后端期间这些写入可能刚好落库（不再是未落库），仍要用它们覆盖可能读到的旧数据
+            dirty_before = dict(self._dirty_under(prefix))
+            flush_gen = self._flush_gen
+        if complete and op.query is None:
+            metrics.incr("tiered_store.hits")
+            return self._search_memory(op)
+
+        metrics.incr("tiered_store.misses")
+        try:
+            results = self.backend.batch([op])[0]
+        except Exception as e:
+            metrics.incr("tiered_store.degraded_reads")
+            print(f"[TieredStore] 后端检索失败，使用内存层数据: {e}")
+            return self._search_memory(op)
+
+        with self._lock:
+            dirty = {**dirty_before, **dict(self._dirty_under(prefix))}
+            # 整个命名空间都已读出、且读取期间没有刷写（结果不会早于已落库的数据），可以缓存为完整视图
+            if (self._flush_gen == flush_gen and op.query is None and not op.filter
+                    and op.offset == 0 and len(results) < op.limit):
+                for item in results:
+                    self._cache_clean(item)
+                self._complete.add(prefix)
+                self._evict()
+
+        if not dirty:
+            return results
+        # 未落库的写入覆盖后端结果：删除的去掉，新增 / 修改的放在最前（最新）
+        merged = [
+            self._item(k, entry, search=True) for k, entry in dirty.items()
+            if entry.value is not None and _matches(entry.value, op.filter)
+        ]
+        merged += [item for item in results if (tuple(item.namespace), item.key) not in dirty]
+        return merged[:op.limit]
+
+    def _list_namespaces(self, op: ListNamespacesOp) -> list[tuple]:
+        namespaces = self.backend.batch([op])[0]
+        with self._lock:
+            pending = {k[0] for k in self._dirty}
+        seen = set(namespaces)
+        for namespace in sorted(pending):
+            if namespace in seen:
+                continue
+            prefix = next((c.path for c in op.match_conditions or () if c.match_type == "prefix"), ())
+            if tuple(namespace[:len(prefix)]) != tuple(prefix):
+                continue
+            if op.max_depth is not None:
+                namespace = namespace[:op.max_depth]
+            if namespace not in seen:
+                seen.add(namespace)
+                namespaces.append(namespace)
+        return namespaces[:op.limit]
+
+    # ==================== BaseStore ====================
+
+    def batch(self, ops: Iterable[Op]) -> list[Result]:
+        ops = list(ops)
+        results: list[Result] = [None] * len(ops)
+        puts = [op for op in ops if isinstance(op, PutOp)]
+        # 写入先于同一批中的读取生效，与 PostgresStore 的行为一致
+        if puts:
+            self._apply_puts(puts)
+        for i, op in enumerate(ops):
+            if isinstance(op, GetOp):
+                results[i] = self._get(op)
+            elif isinstance(op, SearchOp):
+                results[i] = self._search(op)
+            elif isinstance(op, ListNamespacesOp):
+                results[i] = self._list_namespaces(op)
+        return results
+
+    async def abatch(self, ops: Iterable[Op]) -> list[Result]:
+        return await asyncio.to_thread(self.batch, list(ops))
@@ -0,0 +1,195 @@
+# turns.py
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from dotenv import load_dotenv
+from langchain_core.messages import AIMessage, BaseMessage
+
+from .response_cache import normalize_message
+from ..utils.metrics import metrics
+from ..utils.storage import is_postgres
+
+load_dotenv()
+
+# 相同消息在该窗口（秒）内重复提交视为同一轮
+TURN_DEDUP_WINDOW = float(os.getenv("AGENT_TURN_DEDUP_WINDOW", "10"))
+# 等待同一用户上一轮对话的最长时间（秒）
+TURN_LOCK_TIMEOUT = float(os.getenv("AGENT_TURN_LOCK_TIMEOUT", "120"))
+
+
+def message_hash(user_id: str, message: str, thread_id: Optional[str] = None) -> str:
+    raw = f"{user_id}\x00{thread_id or ''}\x00{normalize_message(message)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TurnCoordinator:
+    """
+    同一用户的对话轮次串行执行，并合并重复提交：
+    - 进程内：相同消息的在途 / 刚完成的轮次直接共享其结果
+    - 跨 worker：Postgres advisory lock 串行化；拿到锁后若去重窗口内已有相同消息的结果则直接返回
+    未配置 dao（内存模式）时只在进程内串行与去重
+    """
+
+    def __init__(self, dao=None, window: float = TURN_DEDUP_WINDOW, lock_timeout: float = TURN_LOCK_TIMEOUT):
+        self.dao = dao
+        self.window = window
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._turns: dict[str, tuple[Future, float]] = {}  # hash -> (结果, 完成时间；未完成为 inf)
+        self._user_locks: dict[str, threading.Lock] = {}
+
+    def _attach(self, digest: str) -> tuple[Future, bool]:
+        """返回 (本轮结果, 是否由当前调用负责执行)"""
+        now = time.monotonic()
+        with self._lock:
+            for key, (_, finished_at) in list(self._turns.items()):
+                if finished_at + self.window < now:
+                    del self._turns[key]
+            entry = self._turns.get(digest)
+            if entry is not None:
+                return entry[0], False
+            future = Future()
+            self._turns[digest] = (future, float("inf"))
+            return future, True
+
+    def in_flight(self, user_id: str, message: str, thread_id: Optional[str] = None) -> Optional[Future]:
+        """相同消息正在执行或刚完成时返回其结果 Future（可在事件循环中用 asyncio.wrap_future 等待），否则返回 None"""
+        digest = message_hash(user_id, message, thread_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._turns.get(digest)
+            if entry is None or entry[1] + self.window < now:
+                return None
+            return entry[0]
+
+    def _finish(self, digest: str, future: Future) -> None:
+        with self._lock:
+            if future.exception() is not None:
+                # 失败的轮次不参与去重，允许客户端重试
+                self._turns.pop(digest, None)
+            else:
+                self._turns[digest] = (future, time.monotonic())
+
+    @contextmanager
+    def serialized(self, user_id: str):
+        """同一用户的轮次互斥（数据库可用时跨 worker）"""
+        if self.dao is not None:
+            with self.dao.user_lock(user_id, self.lock_timeout):
+                yield
+            return
+        with self._lock:
+            user_lock = self._user_locks.setdefault(user_id, threading.Lock())
+        if not user_lock.acquire(timeout=self.lock_timeout):
+            raise TimeoutError(f"等待用户 {user_id} 的上一轮对话超时")
+        try:
+            yield
+        finally:
+            user_lock.release()
+
+    def _recent(self, digest: str) -> Optional[str]:
+        if self.dao is None:
+            return None
+        try:
+            return self.dao.get_recent(digest, self.window)
+        except Exception as e:
+            print(f"[TurnCoordinator] 查询最近轮次失败: {e}")
+            return None
+
+    def _save(self, digest: str, user_id: str, content: str) -> None:
+        if self.dao is None:
+            return
+        try:
+            self.dao.save(digest, user_id, content)
+        except Exception as e:
+            print(f"[TurnCoordinator] 记录轮次失败: {e}")
+
+    def run(self, user_id: str, message: str, execute: Callable[[], BaseMessage],
+            thread_id: Optional[str] = None) -> BaseMessage:
+        """执行一轮对话（非流式）；重复提交返回同一结果"""
+        digest = message_hash(user_id, message, thread_id)
+        future, owner = self._attach(digest)
+        if not owner:
+            metrics.incr("turns.deduplicated")
+            return future.result()
+
+        try:
+            with self.serialized(user_id):
+                content = self._recent(digest)
+                if content is not None:
+                    metrics.incr("turns.deduplicated")
+                    result = AIMessage(content=content)
+                else:
+                    metrics.incr("turns.executed")
+                    result = execute()
+                    self._save(digest, user_id, result.content)
+            future.set_result(result)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._finish(digest, future)
+        return result
+
+    def stream(self, user_id: str, message: str, execute: Callable[[], Iterator[BaseMessage]],
+               thread_id: Optional[str] = None) -> Iterator[BaseMessage]:
+        """
+        执行一轮对话（流式）；重复提交只收到最终回复
+        同步生成器，会阻塞等待轮次锁与重复轮次的结果，须在工作线程中迭代（见 AgentService.chat_with_agent_stream）
+        """
+        digest = message_hash(user_id, message, thread_id)
+        future, owner = self._attach(digest)
+        if not owner:
+            metrics.incr("turns.deduplicated")
+            yield future.result()
+            return
+
+        try:
+            with self.serialized(user_id):
+                content = self._recent(digest)
+                if content is not None:
+                    metrics.incr("turns.deduplicated")
+                    last = AIMessage(content=content)
+                    yield last
+                else:
+                    metrics.incr("turns.executed")
+                    last = None
+                    for chunk in execute():
+                        last = chunk
+                        yield chunk
+                    if last is not None:
+                        self._save(digest, user_id, last.content)
+            future.set_result(last)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._finish(digest, future)
+
+
+_coordinator: Optional[TurnCoordinator] = None
+_coordinator_lock = threading.Lock()
+
+
+def get_turn_coordinator() -> TurnCoordinator:
+    """进程级轮次协调器；数据库可用时使用 advisory lock 与 agent_turns 表"""
+    global _coordinator
+    with _coordinator_lock:
+        if _coordinator is None:
+            dao = None
+            # 单机模式（SQLite / 内存）只有一个进程，进程内串行即可
+            if is_postgres():
+                try:
+                    from ..dao.TurnDao import TurnDao
+                    dao = TurnDao()
+                    dao.ensure_table()
+                except Exception as e:
+                    print(f"[TurnCoordinator] 轮次表初始化失败，仅在进程内串行与去重: {e}")
+                    dao = None
+            _coordinator = TurnCoordinator(dao)
+        return _coordinator
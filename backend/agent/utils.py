@@ -1,5 +1,10 @@
 # utils.py
 
+from langgraph.store.base import BaseStore, PutOp
+
+from ..utils import invalidation
+from ..utils.metrics import metrics
+
 # Inspect the tool calls made by Trustcall
 class Spy:
     def __init__(self):
@@ -12,7 +17,8 @@ class Spy:
             r = q.pop()
             if r.child_runs:
                 q.extend(r.child_runs)
-            if r.run_type == "chat_model":
+            # 主模型失败、由备用模型接管时，失败的那次调用没有输出
+            if r.run_type == "chat_model" and r.outputs:
                 self.called_tools.append(
                     r.outputs["generations"][0][0]["message"]["kwargs"]["tool_calls"]
                 )
@@ -60,3 +66,27 @@ def extract_tool_info(tool_calls, schema_name="Memory"):
             )
 
     return "\n\n".join(result_parts)
+
+
+
+def is_remove_doc(response) -> bool:
+    """trustcall 开启 enable_deletes 后，删除操作以 RemoveDoc 对象出现在 responses 中"""
+    return type(response).__name__ == "RemoveDoc"
+
+
+def write_memory_batch(store: BaseStore, kind: str, user_id: str, ops: list[PutOp]) -> None:
+    """
+    把一轮记忆更新的全部写入（value 为 None 表示删除）合并为一次 store.batch：
+    PostgresStore 会在同一连接上以 pipeline 方式执行一条多行 upsert 与一条批量删除
+    """
+    if not ops:
+        return
+
+    store.batch(ops)
+
+    deleted = sum(1 for op in ops if op.value is None)
+    metrics.incr("memory_writes.batches")
+    metrics.incr("memory_writes.rows_put", len(ops) - deleted)
+    metrics.incr("memory_writes.rows_deleted", deleted)
+    metrics.observe("memory_writes.batch_rows", len(ops))
+    invalidation.bump(kind, user_id)
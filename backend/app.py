@@ -1,18 +1,46 @@
-from litestar import Litestar, get
+from litestar import Litestar, Response, get
 from litestar.config.cors import CORSConfig
 from backend.controller.BasicAgentController import AgentChatController
 from backend.controller.CommonController import CommonController
+from backend.service.AgentService import close_shared_agent
 from backend.utils.pg_pool import on_startup_pg_pool, close_pg_pool
+from backend.utils.metrics import metrics
+from backend.utils.change_feed import on_startup_change_feed
+from backend.utils.pg_listener import stop_pg_listener
+from backend.utils.invalidation import start_invalidation_bus
+from backend.service.ArchiveService import start_todo_archiver
+from backend.utils.sqlite_db import close_sqlite
+from backend.utils.storage import is_postgres
+from backend.utils import health
 
 
 @get("/")
 async def index() -> str:
     return "Hello, world!"
 
+
+@get("/metrics")
+async def get_metrics() -> dict:
+    """进程内运行指标（模型调用排队、并发等）"""
+    return metrics.snapshot()
+
+
+@get("/healthz")
+async def healthz() -> dict:
+    """存活探针：进程能响应即返回 200"""
+    return health.liveness()
+
+
+@get("/readyz")
+async def readyz() -> Response[dict]:
+    """就绪探针：连接池与 agent 预热完成前返回 503"""
+    ready, detail = health.readiness()
+    return Response(detail, status_code=200 if ready else 503)
+
 # 配置 CORS
 cors_config = CORSConfig(
     allow_origins=["http://localhost:5173", "http://47.117.125.48"],
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["*"],
     allow_credentials=True,
 )
@@ -20,10 +48,18 @@ cors_config = CORSConfig(
 app = Litestar(
     route_handlers=[
         index,
+        get_metrics,
+        healthz,
+        readyz,
         AgentChatController,
         CommonController
     ],
-    on_app_init=[on_startup_pg_pool],
-    on_shutdown=[lambda: close_pg_pool()],
+    # 变更推送与跨进程失效广播依赖 Postgres LISTEN/NOTIFY；单机模式（SQLite / 内存）只有一个进程，不需要
+    on_app_init=[on_startup_pg_pool] if is_postgres() else [],
+    on_startup=(
+        [on_startup_change_feed, start_invalidation_bus, start_todo_archiver, health.start_warmup] if is_postgres()
+        else [start_todo_archiver, health.start_warmup]
+    ),
+    on_shutdown=[lambda: close_shared_agent(), lambda: stop_pg_listener(), lambda: close_pg_pool(), lambda: close_sqlite()],
     cors_config=cors_config,
 )
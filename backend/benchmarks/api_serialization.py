@@ -0,0 +1,100 @@
+"""
+接口序列化基准：对 100 / 1000 / 5000 条待办，比较读取接口从数据库行到 JSON 响应体的耗时
+- pydantic：ToDo.from_dict 校验 → model_dump 生成字典 → 框架编码（原实现）
+- msgspec：行直接转换为 TodoItem Struct → 框架原生编码（当前实现）
+
+运行：
+    python -m backend.benchmarks.api_serialization          # 只测序列化
+    python -m backend.benchmarks.api_serialization --http   # 另外用 SQLite 临时库经完整 HTTP 请求测量 GET /api/todos
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from litestar.serialization import encode_json
+
+from backend.agent.models import ToDo
+from backend.service.schemas import TodoListResponse, todo_items
+
+SIZES = [100, 1000, 5000]
+
+
+def synthetic_rows(n: int) -> list[dict]:
+    """与 ToDoDao.get_rows 返回的行形状一致：列表字段为 JSON 文本，数值字段为文本"""
+    return [{
+        "task": f"第 {i} 项：整理季度报告并发给王经理",
+        "status": ("not started", "in progress", "done")[i % 3],
+        "deadline": f"2025-06-{i % 28 + 1:02d}T15:00:00" if i % 2 else None,
+        "solutions": json.dumps(["先汇总各组数据", "用上季度模板", "周五前发初稿"], ensure_ascii=False),
+        "planned_edits": json.dumps([]),
+        "time_to_complete": str(30 + i % 90),
+        "key": f"01900000-0000-7000-8000-{i:012d}",
+    } for i in range(n)]
+
+
+def pydantic_body(rows: list[dict]) -> bytes:
+    todos = [ToDo.from_dict(dict(row)) for row in rows]
+    return encode_json({"success": True, "response": [todo.model_dump() for todo in todos]})
+
+
+def msgspec_body(rows: list[dict]) -> bytes:
+    return encode_json(TodoListResponse(response=todo_items(rows)))
+
+
+def _timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def bench_serialization(repeat: int) -> None:
+    print(f"{'条数':>6}{'pydantic ms':>14}{'msgspec ms':>14}{'加速':>8}{'字节':>10}")
+    for size in SIZES:
+        rows = synthetic_rows(size)
+        # 两种实现输出的 JSON 必须一致
+        assert json.loads(pydantic_body(rows)) == json.loads(msgspec_body(rows))
+        old_ms = _timed(lambda: pydantic_body(rows), repeat)
+        new_ms = _timed(lambda: msgspec_body(rows), repeat)
+        print(f"{size:>6}{old_ms:>14.2f}{new_ms:>14.2f}{old_ms / new_ms:>7.1f}x{len(msgspec_body(rows)):>10}")
+
+
+def bench_http(repeat: int) -> None:
+    """SQLite 临时库写入 1000 条待办，经 Litestar TestClient 请求 GET /api/todos（不带 If-None-Match）"""
+    directory = tempfile.mkdtemp(prefix="api-bench-")
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(directory, "bench.db")
+    os.environ.setdefault("OPENAI_API_KEY", "api-serialization-benchmark")
+    os.environ["STARTUP_WARMUP"] = "0"
+
+    from litestar.testing import TestClient
+    from langgraph.store.sqlite import SqliteStore
+    from backend.app import app
+    from backend.dao.factory import todo_dao
+    from backend.utils.sqlite_db import get_sqlite_conn
+
+    SqliteStore(get_sqlite_conn("store")).setup()
+    dao = todo_dao()
+    for row in synthetic_rows(1000):
+        todo = ToDo.from_dict(dict(row))
+        asyncio.run(dao.create_todo("bench", todo))
+
+    with TestClient(app) as client:
+        assert len(client.get("/api/todos/bench").json()["response"]) == 1000
+        ms = _timed(lambda: client.get("/api/todos/bench"), repeat)
+    print(f"\nGET /api/todos（1000 条，SQLite）: {ms:.2f} ms / 请求")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="接口序列化基准")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--http", action="store_true", help="另外经完整 HTTP 请求测量 GET /api/todos")
+    args = parser.parse_args()
+
+    bench_serialization(args.repeat)
+    if args.http:
+        bench_http(args.repeat)
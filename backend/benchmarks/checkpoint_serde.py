@@ -0,0 +1,108 @@
+"""
+检查点序列化基准：对 50 / 200 / 1000 条消息的合成对话，比较各序列化配置每个检查点的写入 / 读取耗时与字节数
+
+运行：
+    python -m backend.benchmarks.checkpoint_serde              # 只测序列化
+    python -m backend.benchmarks.checkpoint_serde --postgres   # 另外通过 PostgresSaver 实际写入 / 读取
+"""
+
+import argparse
+import time
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.base import empty_checkpoint
+
+from backend.agent.serde import build_serializer
+
+CONFIGS = [
+    ("msgpack", "none"),
+    ("msgpack", "zlib"),
+    ("msgpack", "zstd"),
+    ("json", "none"),
+    ("json", "zstd"),
+]
+SIZES = [50, 200, 1000]
+
+
+def synthetic_thread(n: int) -> list:
+    """合成对话：用户消息、带工具调用的回复、工具结果、普通回复循环出现"""
+    messages = []
+    for i in range(n):
+        kind = i % 4
+        if kind == 0:
+            messages.append(HumanMessage(content=f"第 {i} 条：明天下午三点前把季度报告发给王经理，顺便约周五的评审会"))
+        elif kind == 1:
+            messages.append(AIMessage(
+                content="",
+                tool_calls=[{"name": "UpdateMemory", "args": {"update_type": "todo"}, "id": f"call_{i}"}],
+                usage_metadata={"input_tokens": 812, "output_tokens": 23, "total_tokens": 835},
+            ))
+        elif kind == 2:
+            messages.append(ToolMessage(content="updated todo", tool_call_id=f"call_{i - 1}"))
+        else:
+            messages.append(AIMessage(content=f"好的，已为你添加待办「发送季度报告」，截止时间为明天 15:00。（{i}）"))
+    return messages
+
+
+def _timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def bench_serde(repeat: int) -> None:
+    print(f"{'格式':<8}{'压缩':<6}{'消息数':>6}{'字节':>12}{'写入 ms':>10}{'读取 ms':>10}")
+    for size in SIZES:
+        messages = synthetic_thread(size)
+        for fmt, compression in CONFIGS:
+            serde = build_serializer(fmt, compression)
+            typed = serde.dumps_typed(messages)
+            assert len(serde.loads_typed(typed)) == size
+            write_ms = _timed(lambda: serde.dumps_typed(messages), repeat)
+            read_ms = _timed(lambda: serde.loads_typed(typed), repeat)
+            print(f"{fmt:<8}{compression:<6}{size:>6}{len(typed[1]):>12}{write_ms:>10.2f}{read_ms:>10.2f}")
+
+
+def bench_postgres(repeat: int) -> None:
+    from langgraph.checkpoint.postgres import PostgresSaver
+    from backend.utils.pg_pool import get_pg_pool
+
+    pool = get_pg_pool()
+    print(f"\nPostgresSaver 每个检查点（put / get_tuple）")
+    print(f"{'格式':<8}{'压缩':<6}{'消息数':>6}{'写入 ms':>10}{'读取 ms':>10}")
+    for size in SIZES:
+        messages = synthetic_thread(size)
+        for fmt, compression in CONFIGS:
+            saver = PostgresSaver(pool, serde=build_serializer(fmt, compression))
+            saver.setup()
+            thread_id = f"bench-{uuid.uuid4()}"
+            config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+            version = [0]
+
+            def put():
+                # 每次写入新的消息版本，与真实对话每轮写一份完整消息列表一致
+                version[0] += 1
+                checkpoint = empty_checkpoint()
+                checkpoint["channel_values"] = {"messages": messages}
+                checkpoint["channel_versions"] = {"messages": version[0]}
+                saver.put(config, checkpoint, {"source": "loop", "step": version[0]}, {"messages": version[0]})
+
+            try:
+                write_ms = _timed(put, repeat)
+                read_ms = _timed(lambda: saver.get_tuple(config), repeat)
+            finally:
+                saver.delete_thread(thread_id)
+            print(f"{fmt:<8}{compression:<6}{size:>6}{write_ms:>10.2f}{read_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="检查点序列化基准")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--postgres", action="store_true", help="同时通过 PostgresSaver 实际写入 / 读取")
+    args = parser.parse_args()
+
+    bench_serde(args.repeat)
+    if args.postgres:
+        bench_postgres(args.repeat)
@@ -0,0 +1,87 @@
+"""
+导入耗时报告：在全新的子进程中用 python -X importtime 导入各入口模块，报告总耗时与最慢的依赖，
+并检查 CRUD 入口没有加载 agent 相关的重依赖（langgraph、langchain_openai、trustcall）
+
+运行：
+    python -m backend.benchmarks.import_time               # 默认入口，每个重复 5 次取最小值
+    python -m backend.benchmarks.import_time --top 15 backend.agent.core
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+TARGETS = [
+    "backend.agent.models",
+    "backend.service.CommonService",
+    "backend.app",
+    "backend.agent.core",
+]
+# 只在对话时需要的重依赖；CRUD 入口导入后不应出现在 sys.modules 中
+HEAVY_MODULES = ("langgraph", "langchain_openai", "langchain_core", "trustcall", "openai")
+# 这些入口不应加载重依赖
+LIGHT_TARGETS = {"backend.agent.models", "backend.service.CommonService", "backend.app"}
+
+_CHECK = "import sys, {module}; print(','.join(m for m in {heavy!r} if m in sys.modules))"
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    # 模块导入时会读取这些配置；只测导入，不连接数据库与模型服务
+    env.setdefault("STORAGE_BACKEND", "memory")
+    env.setdefault("OPENAI_API_KEY", "import-time-benchmark")
+    return env
+
+
+def import_profile(module: str) -> tuple[float, list[tuple[float, str]], list[str]]:
+    """
+    :return: (总耗时 ms, [(累计耗时 ms, 模块名)], 已加载的重依赖)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHECK.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, env=_env(), check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # 名称前的缩进表示嵌套层级，顶层模块没有缩进
+        rows.append((int(cumulative) / 1000, name[1:].rstrip()))
+    top_level = [row for row in rows if not row[1].startswith(" ")]
+    total = sum(ms for ms, _ in top_level)
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    return total, rows, loaded
+
+
+def report(modules: list[str], repeat: int, top: int) -> bool:
+    ok = True
+    print(f"{'模块':<36}{'最小 ms':>10}{'最大 ms':>10}  重依赖")
+    slowest = {}
+    for module in modules:
+        runs = [import_profile(module) for _ in range(repeat)]
+        totals = [total for total, _, _ in runs]
+        loaded = runs[0][2]
+        slowest[module] = min(runs, key=lambda run: run[0])[1]
+        if module in LIGHT_TARGETS and loaded:
+            ok = False
+        print(f"{module:<36}{min(totals):>10.0f}{max(totals):>10.0f}  {','.join(loaded) or '-'}")
+
+    for module, rows in slowest.items():
+        print(f"\n{module} 最慢的 {top} 个依赖（累计 ms）")
+        for ms, name in sorted(rows, reverse=True)[:top]:
+            print(f"{ms:>10.0f}  {name.strip()}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导入耗时报告")
+    parser.add_argument("modules", nargs="*", default=TARGETS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    if not report(args.modules, args.repeat, args.top):
+        print("\nCRUD 入口加载了 agent 重依赖，检查是否有模块级导入绕过了延迟导入")
+        sys.exit(1)
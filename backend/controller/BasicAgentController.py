@@ -1,16 +1,25 @@
-from litestar import Litestar, get, post, Controller
+from litestar import Litestar, get, post, websocket, Controller, WebSocket
 from litestar.di import Provide
-from pydantic import BaseModel, field_validator
+from litestar.exceptions import WebSocketDisconnect
+from pydantic import BaseModel, ValidationError, field_validator
+from typing import Optional
 from litestar.connection import Request
 from litestar.response import ServerSentEvent
 from backend.service.AgentService import AgentService
+from backend.utils.metrics import metrics
+import asyncio
+import os
 import traceback
 import json
 
+# 单条消息发送超时（秒）：客户端长时间不收数据时断开连接，避免拖住模型输出线程
+WS_SEND_TIMEOUT = float(os.getenv("AGENT_WS_SEND_TIMEOUT", "30"))
+
 
 class ChatInput(BaseModel):
     user_id: str
     input: str
+    deferred_memory: Optional[bool] = None
     @field_validator("user_id", "input")
     @classmethod
     def not_empty(cls, v: str) -> str:
@@ -18,6 +27,16 @@ class ChatInput(BaseModel):
             raise ValueError("不能为空或仅包含空格")
         return v.strip()
 
+class SessionInput(BaseModel):
+    """长连接会话中的一条用户消息"""
+    input: str
+    @field_validator("input")
+    @classmethod
+    def not_empty(cls, v: str) -> str:
+        if not v or not v.strip():
+            raise ValueError("不能为空或仅包含空格")
+        return v.strip()
+
 class AgentChatController(Controller):
     path = "/agent"
     dependencies = {
@@ -37,7 +56,8 @@ class AgentChatController(Controller):
             result = await agent_service.chat_with_agent(
                 user_id=data.user_id,
                 input_text=data.input,
-                client_info=client_info
+                client_info=client_info,
+                deferred_memory=data.deferred_memory
             )
             return result
         except Exception as e:
@@ -51,9 +71,10 @@ class AgentChatController(Controller):
         """
         async def event_generator():
             try:
-                for chunk in agent_service.chat_with_agent_stream(
+                async for chunk in agent_service.chat_with_agent_stream(
                     user_id=data.user_id,
-                    input_text=data.input
+                    input_text=data.input,
+                    deferred_memory=data.deferred_memory
                 ):
                     if hasattr(chunk, 'content'):
                         yield {"data": json.dumps({"response": chunk.content})}
@@ -65,6 +86,82 @@ class AgentChatController(Controller):
 
         return ServerSentEvent(event_generator())
 
+    @websocket("/chat/ws")
+    async def chat_session(
+            self,
+            socket: WebSocket,
+            agent_service: AgentService,
+            user_id: str,
+            thread_id: Optional[str] = None,
+            deferred_memory: Optional[bool] = None,
+    ) -> None:
+        """
+        长连接对话接口（WebSocket）：连接期间保持会话（user_id、thread_id、记忆快照），多轮对话无需重复握手
+        客户端发送 {"input": "..."}；服务端依次推送 session / token / done / error 消息
+        """
+        await socket.accept()
+        if not user_id or not user_id.strip():
+            await socket.send_json({"type": "error", "error": "user_id不能为空"})
+            await socket.close()
+            return
+
+        session = agent_service.open_session(user_id.strip(), thread_id, deferred_memory)
+        metrics.incr("agent_ws.sessions")
+
+        async def send(message: dict) -> None:
+            await asyncio.wait_for(socket.send_json(message), timeout=WS_SEND_TIMEOUT)
+
+        try:
+            await send({"type": "session", "thread_id": session.thread_id})
+            while True:
+                # 一轮结束后才读取下一条消息，客户端的连续输入自然排队
+                try:
+                    data = SessionInput.model_validate(await socket.receive_json())
+                except (ValidationError, ValueError) as e:
+                    await send({"type": "error", "error": str(e)})
+                    continue
+
+                async for event_type, content in agent_service.session_turn(session, data.input):
+                    if event_type == "token":
+                        await send({"type": "token", "content": content})
+                    elif event_type == "done":
+                        await send({"type": "done", "response": content})
+                    else:
+                        await send({"type": "error", "error": content})
+        except WebSocketDisconnect:
+            pass
+        except asyncio.TimeoutError:
+            metrics.incr("agent_ws.slow_client_disconnects")
+            await socket.close(code=1013, reason="client too slow")
+        except Exception as e:
+            traceback.print_exc()
+            await socket.close(code=1011, reason=str(e)[:120])
+
+    @get("/jobs/{user_id:str}")
+    async def get_memory_jobs(self, user_id: str, agent_service: AgentService) -> dict:
+        """
+        轮询后台记忆抽取任务状态（延迟模式）
+        """
+        if not user_id or not user_id.strip():
+            return {"error": "user_id不能为空"}
+
+        return await agent_service.get_memory_jobs(user_id)
+
+    @get("/jobs/{user_id:str}/events")
+    async def memory_job_events(self, user_id: str, agent_service: AgentService, after: int = 0) -> ServerSentEvent:
+        """
+        后台记忆抽取完成事件（SSE），待办事项更新后推送 todo_updated 事件；任务在任一 worker 中执行都会推送
+        """
+        async def event_generator():
+            try:
+                async for event_type, payload in agent_service.memory_job_events(user_id, after=after):
+                    yield {"event": event_type, "data": json.dumps(payload)}
+            except Exception as e:
+                traceback.print_exc()
+                yield {"data": json.dumps({"error": str(e)})}
+
+        return ServerSentEvent(event_generator())
+
     # @get("/todos/{user_id:str}")
     # async def get_todos(self, user_id: str, agent_service: AgentService) -> dict:
     #     """
@@ -1,68 +1,138 @@
-from litestar import Controller, get, post, put, delete
+from datetime import datetime
+from litestar import Controller, get, post, put, patch, delete
 from litestar.di import Provide
-from litestar.status_codes import HTTP_200_OK
-from pydantic import BaseModel, field_validator
-from typing import List, Optional
+from litestar.exceptions import HTTPException, ValidationException
+from litestar.params import Parameter
+from litestar.response import Response, ServerSentEvent
+from litestar.status_codes import HTTP_200_OK, HTTP_304_NOT_MODIFIED, HTTP_409_CONFLICT
+from msgspec import UNSET, UnsetType
+from typing import List, Literal, Optional, Union
+import json
+import msgspec
+import traceback
 
+from backend.dao.ToDoDao import IdempotencyConflict, InvalidCursor
 from backend.service.CommonService import CommonService
+from backend.service.schemas import ErrorResponse, InstructionListResponse, ProfileResponse, TodoListResponse
+from backend.utils.etag import etag_matches
+from backend.utils.metrics import metrics
 
 
-class InstructionCreateRequest(BaseModel):
+async def conditional_get(kind: str, user_id: str, if_none_match: Optional[str],
+                          common_service: CommonService, load) -> Response:
+    """
+    带 ETag 的读取：If-None-Match 命中时直接返回 304，不查询、不序列化记录
+    ETag 取不到（如数据库异常）时退化为普通读取
+    """
+    try:
+        etag = await common_service.get_etag(kind, user_id)
+    except Exception as e:
+        print(f"[CommonController] 计算 ETag 失败: {e}")
+        return Response(await load())
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        metrics.incr(f"etag.not_modified.{kind}")
+        return Response(content=None, status_code=HTTP_304_NOT_MODIFIED, headers=headers)
+
+    result = await load()
+    if isinstance(result, ErrorResponse):
+        return Response(result)
+    return Response(result, headers=headers)
+
+
+def _strip_required(struct: msgspec.Struct, *names: str, message: str = "不能为空或仅包含空格") -> None:
+    """必填文本字段去除首尾空白，为空时报错（在 __post_init__ 中调用，msgspec 将 ValueError 转为校验错误，接口返回 400）"""
+    for name in names:
+        value = getattr(struct, name)
+        if not value or not value.strip():
+            raise ValueError(f"{name}{message}")
+        setattr(struct, name, value.strip())
+
+
+class InstructionCreateRequest(msgspec.Struct):
     user_id: str
     language: str
     content: str
-    
-    @field_validator("user_id", "language", "content")
-    @classmethod
-    def not_empty(cls, v: str) -> str:
-        if not v or not v.strip():
-            raise ValueError("不能为空或仅包含空格")
-        return v.strip()
 
+    def __post_init__(self) -> None:
+        _strip_required(self, "user_id", "language", "content")
 
-class InstructionUpdateRequest(BaseModel):
+
+class InstructionUpdateRequest(msgspec.Struct):
     language: str
     content: str
-    
-    @field_validator("language", "content")
-    @classmethod
-    def not_empty(cls, v: str) -> str:
-        if not v or not v.strip():
-            raise ValueError("不能为空或仅包含空格")
-        return v.strip()
 
+    def __post_init__(self) -> None:
+        _strip_required(self, "language", "content")
 
-class ProfileCreateRequest(BaseModel):
+
+class ProfileCreateRequest(msgspec.Struct):
     user_id: str
     name: Optional[str] = None
     location: Optional[str] = None
     job: Optional[str] = None
     connections: List[str] = []
     interests: List[str] = []
-    
-    @field_validator("user_id")
-    @classmethod
-    def not_empty(cls, v: str) -> str:
-        if not v or not v.strip():
-            raise ValueError("user_id不能为空")
-        return v.strip()
+
+    def __post_init__(self) -> None:
+        _strip_required(self, "user_id", message="不能为空")
+
+
+class ProfilePatchRequest(msgspec.Struct):
+    """档案局部更新：未传的字段保持不变，*_append 追加到对应列表末尾"""
+    name: Union[Optional[str], UnsetType] = UNSET
+    location: Union[Optional[str], UnsetType] = UNSET
+    job: Union[Optional[str], UnsetType] = UNSET
+    interests_append: List[str] = []
+    connections_append: List[str] = []
+
+    def changed_fields(self) -> dict:
+        return {name: getattr(self, name) for name in ("name", "location", "job") if getattr(self, name) is not UNSET}
+
+
+TodoStatus = Literal["not started", "in progress", "done", "archived"]
 
 
-class TodoCreateRequest(BaseModel):
+def _valid_deadline(value) -> None:
+    if isinstance(value, str):
+        try:
+            datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"deadline 不是有效的 ISO 时间: {value}")
+
+
+class TodoPatchRequest(msgspec.Struct):
+    """待办局部更新：未传的字段保持不变，solutions_append 追加到 solutions 末尾"""
+    status: Union[Optional[TodoStatus], UnsetType] = UNSET
+    deadline: Union[Optional[str], UnsetType] = UNSET
+    time_to_complete: Union[Optional[int], UnsetType] = UNSET
+    solutions_append: List[str] = []
+
+    def __post_init__(self) -> None:
+        _valid_deadline(self.deadline)
+
+    def changed_fields(self) -> dict:
+        fields = {name: getattr(self, name) for name in ("status", "deadline", "time_to_complete")
+                  if getattr(self, name) is not UNSET}
+        # status 不允许置空；deadline 传 null 表示清除截止时间
+        if fields.get("status", "") is None:
+            fields.pop("status")
+        return fields
+
+
+class TodoCreateRequest(msgspec.Struct):
     user_id: str
     task: str
     time_to_complete: Optional[int] = None
     deadline: Optional[str] = None
     solutions: List[str] = []
-    status: str = "not started"
+    status: TodoStatus = "not started"
     planned_edits: List[str] = []
-    
-    @field_validator("user_id", "task")
-    @classmethod
-    def not_empty(cls, v: str) -> str:
-        if not v or not v.strip():
-            raise ValueError("不能为空或仅包含空格")
-        return v.strip()
+
+    def __post_init__(self) -> None:
+        _strip_required(self, "user_id", "task")
+        _valid_deadline(self.deadline)
 
 
 class CommonController(Controller):
@@ -74,14 +144,20 @@ class CommonController(Controller):
     # ==================== Instruction CRUD ====================
     
     @get("/instructions/{user_id:str}")
-    async def get_instructions(self, user_id: str, common_service: CommonService) -> dict:
+    async def get_instructions(
+            self,
+            user_id: str,
+            common_service: CommonService,
+            if_none_match: Optional[str] = Parameter(header="If-None-Match", default=None),
+    ) -> Response[Union[InstructionListResponse, ErrorResponse]]:
         """
-        获取用户的所有指令
+        获取用户的所有指令，支持 If-None-Match 条件请求
         """
         if not user_id or not user_id.strip():
-            return {"error": "user_id不能为空"}
+            return Response(ErrorResponse("user_id不能为空"))
         
-        return await common_service.get_instructions(user_id)
+        return await conditional_get("instructions", user_id, if_none_match, common_service,
+                                     lambda: common_service.get_instructions(user_id))
     
     @post("/instructions")
     async def create_instruction(self, data: InstructionCreateRequest, common_service: CommonService) -> dict:
@@ -126,14 +202,20 @@ class CommonController(Controller):
     # ==================== Profile CRUD ====================
     
     @get("/profile/{user_id:str}")
-    async def get_profile(self, user_id: str, common_service: CommonService) -> dict:
+    async def get_profile(
+            self,
+            user_id: str,
+            common_service: CommonService,
+            if_none_match: Optional[str] = Parameter(header="If-None-Match", default=None),
+    ) -> Response[Union[ProfileResponse, ErrorResponse]]:
         """
-        获取用户档案
+        获取用户档案，支持 If-None-Match 条件请求
         """
         if not user_id or not user_id.strip():
-            return {"error": "user_id不能为空"}
+            return Response(ErrorResponse("user_id不能为空"))
         
-        return await common_service.get_profile(user_id)
+        return await conditional_get("profile", user_id, if_none_match, common_service,
+                                     lambda: common_service.get_profile(user_id))
     
     @post("/profile")
     async def create_profile(self, data: ProfileCreateRequest, common_service: CommonService) -> dict:
@@ -166,32 +248,83 @@ class CommonController(Controller):
             interests=data.interests
         )
 
+    @patch("/profile/{user_id:str}")
+    async def patch_profile(self, user_id: str, data: ProfilePatchRequest, common_service: CommonService) -> dict:
+        """
+        局部更新用户档案，只返回变更的字段
+        """
+        if not user_id or not user_id.strip():
+            return {"error": "user_id不能为空"}
+
+        return await common_service.patch_profile(
+            user_id=user_id,
+            fields=data.changed_fields(),
+            interests_append=data.interests_append,
+            connections_append=data.connections_append
+        )
+
     # ==================== Todo CRUD ====================
     
     @get("/todos/{user_id:str}")
-    async def get_todos(self, user_id: str, common_service: CommonService) -> dict:
+    async def get_todos(
+            self,
+            user_id: str,
+            common_service: CommonService,
+            if_none_match: Optional[str] = Parameter(header="If-None-Match", default=None),
+    ) -> Response[Union[TodoListResponse, ErrorResponse]]:
         """
-        获取用户的所有待办事项
+        获取用户的所有待办事项，支持 If-None-Match 条件请求
         """
         if not user_id or not user_id.strip():
-            return {"error": "user_id不能为空"}
+            return Response(ErrorResponse("user_id不能为空"))
         
-        return await common_service.get_todos(user_id)
+        return await conditional_get("todo", user_id, if_none_match, common_service,
+                                     lambda: common_service.get_todos(user_id))
+    
+    @get("/todos/{user_id:str}/history")
+    async def get_todo_history(
+            self,
+            user_id: str,
+            common_service: CommonService,
+            limit: int = Parameter(default=20, ge=1, le=100),
+            cursor: Optional[str] = None,
+    ) -> dict:
+        """
+        分页获取已归档的历史待办（已完成并超过归档期限的待办不再出现在待办列表中）
+        :param cursor: 上一页返回的 next_cursor，无法解析时返回 400
+        """
+        if not user_id or not user_id.strip():
+            return {"error": "user_id不能为空"}
+
+        try:
+            return await common_service.get_todo_history(user_id, limit, cursor)
+        except InvalidCursor as e:
+            raise ValidationException(detail=str(e)) from e
     
     @post("/todos")
-    async def create_todo(self, data: TodoCreateRequest, common_service: CommonService) -> dict:
+    async def create_todo(
+            self,
+            data: TodoCreateRequest,
+            common_service: CommonService,
+            idempotency_key: Optional[str] = Parameter(header="Idempotency-Key", default=None),
+    ) -> dict:
         """
-        创建新的待办事项
+        创建新的待办事项，可通过 Idempotency-Key 请求头保证重试幂等
+        同一幂等键重放相同内容时返回原结果；内容不同时返回 409
         """
-        return await common_service.create_todo(
-            user_id=data.user_id,
-            task=data.task,
-            time_to_complete=data.time_to_complete,
-            deadline=data.deadline,
-            solutions=data.solutions,
-            status=data.status,
-            planned_edits=data.planned_edits
-        )
+        try:
+            return await common_service.create_todo(
+                user_id=data.user_id,
+                task=data.task,
+                time_to_complete=data.time_to_complete,
+                deadline=data.deadline,
+                solutions=data.solutions,
+                status=data.status,
+                planned_edits=data.planned_edits,
+                idempotency_key=idempotency_key
+            )
+        except IdempotencyConflict as e:
+            raise HTTPException(status_code=HTTP_409_CONFLICT, detail=f"Idempotency-Key 已用于内容不同的请求: {e}") from e
     
     @put("/todos/{user_id:str}/{key:str}")
     async def update_todo(self, user_id: str, key: str, data: TodoCreateRequest, common_service: CommonService) -> dict:
@@ -214,6 +347,23 @@ class CommonController(Controller):
             planned_edits=data.planned_edits
         )
     
+    @patch("/todos/{user_id:str}/{key:str}")
+    async def patch_todo(self, user_id: str, key: str, data: TodoPatchRequest, common_service: CommonService) -> dict:
+        """
+        局部更新指定的待办事项（状态切换、截止时间、追加 solutions），只返回变更的字段
+        """
+        if not user_id or not user_id.strip():
+            return {"error": "user_id不能为空"}
+        if not key or not key.strip():
+            return {"error": "key不能为空"}
+
+        return await common_service.patch_todo(
+            user_id=user_id,
+            key=key,
+            fields=data.changed_fields(),
+            solutions_append=data.solutions_append
+        )
+    
     @delete("/todos/{user_id:str}/{key:str}", status_code=HTTP_200_OK)
     async def delete_todo(self, user_id: str, key: str, common_service: CommonService) -> dict:
         """
@@ -224,4 +374,27 @@ class CommonController(Controller):
         if not key or not key.strip():
             return {"error": "key不能为空"}
         
-        return await common_service.delete_todo(user_id, key)
\ No newline at end of file
+        return await common_service.delete_todo(user_id, key)
+
+    # ==================== 变更订阅 ====================
+
+    @get("/changes/{user_id:str}")
+    async def subscribe_changes(self, user_id: str, common_service: CommonService, kinds: Optional[str] = None) -> ServerSentEvent:
+        """
+        订阅用户记忆的变更增量（SSE），事件类型为 todo / profile / instructions
+        :param kinds: 逗号分隔的类型过滤，如 todo,profile
+        """
+        kind_set = {k.strip() for k in kinds.split(",") if k.strip()} if kinds else None
+
+        async def event_generator():
+            try:
+                async for event in common_service.change_events(user_id, kind_set):
+                    if event is None:
+                        yield {"comment": "keepalive"}
+                    else:
+                        yield {"event": event["kind"], "data": json.dumps(event, ensure_ascii=False)}
+            except Exception as e:
+                traceback.print_exc()
+                yield {"data": json.dumps({"error": str(e)})}
+
+        return ServerSentEvent(event_generator())
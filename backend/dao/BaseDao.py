@@ -1,6 +1,10 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import TypeVar, Generic, List
-from backend.utils.pg_pool import get_pg_pool, init_pg_pool
+from backend.utils.pg_pool import get_read_pool, init_pg_pool, mark_replica_failed
+from backend.utils.sqlite_db import get_sqlite_pool
+from backend.utils.storage import is_sqlite
+from psycopg import OperationalError
 from psycopg_pool import ConnectionPool
 import json
 
@@ -8,15 +12,31 @@ T = TypeVar('T')
 
 class BaseDao(ABC, Generic[T]):
     """DAO基类，提供通用的数据库操作方法"""
+
+    NAMESPACE_VERSION_SQL = """
+        SELECT max(updated_at) AS updated_at, count(*) AS total
+        FROM store
+        WHERE prefix = %s;
+    """
     
     def __init__(self):
-        self.pool: ConnectionPool = init_pg_pool()
+        # SQLite 模式下使用与连接池用法相同的共享连接，SQL 不同的方法由 Sqlite*Dao 子类覆盖
+        self.pool: ConnectionPool = get_sqlite_pool() if is_sqlite() else init_pg_pool()
     
     @abstractmethod
     async def get_by_id(self, user_id: str) -> T | List[T]:
-        """根据用户ID获取数据的抽象方法"""
+        """根据用户ID获取数据的抽象方法；实现中用 asyncio.to_thread 执行查询，避免阻塞事件循环"""
         pass
     
+    async def get_namespace_version(self, kind: str, user_id: str) -> str:
+        """
+        命名空间的数据版本：max(updated_at) 与记录数（删除不会改变 max(updated_at)）
+        只走 (prefix, key) 主键索引做聚合，比读出并序列化全部记录便宜得多
+        """
+        row = await asyncio.to_thread(self._execute_single_query, self.NAMESPACE_VERSION_SQL, (f'{kind}.{user_id}',))
+        updated_at = row["updated_at"].timestamp() if row["updated_at"] else 0
+        return f"{updated_at:.6f}-{row['total']}"
+
     def _execute_query(self, sql: str, params: tuple = None):
         """执行SQL查询的通用方法"""
         with self.pool.connection() as conn:
@@ -27,6 +47,27 @@ class BaseDao(ABC, Generic[T]):
                     cur.execute(sql)
                 return cur.fetchall()
 
+    def _execute_read(self, sql: str, params: tuple, user_id: str, single: bool = False):
+        """
+        只读查询：只读副本可用且该用户近期没有写入时走副本，副本连接出错时标记不可用并在主库重试
+        :param single: True 返回单行，否则返回全部行
+        """
+        pool = self.pool if is_sqlite() else get_read_pool(user_id)
+        try:
+            return self._query_on(pool, sql, params, single)
+        except OperationalError as e:
+            if pool is self.pool:
+                raise
+            mark_replica_failed(e)
+            return self._query_on(self.pool, sql, params, single)
+
+    @staticmethod
+    def _query_on(pool, sql: str, params: tuple, single: bool):
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                return cur.fetchone() if single else cur.fetchall()
+
     def _execute_write(self, sql: str, params: tuple = None):
         with self.pool.connection() as conn:
             with conn.cursor() as cur:
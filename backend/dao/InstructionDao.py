@@ -1,56 +1,84 @@
+import asyncio
 import json
 from typing import List
 from backend.dao.BaseDao import BaseDao
+from backend.utils import invalidation
 from backend.agent.models import Instruction
 
 class InstructionDao(BaseDao[Instruction]):
     """用户偏好说明数据访问对象"""
+
+    # 热点查询：启动预热时在每个连接上预先 prepare（见 utils/health.py）
+    GET_BY_ID_SQL = """
+        SELECT
+            value ->> 'content' as content,
+            value ->> 'language' as language,
+            key
+        FROM store
+        WHERE prefix = %s;
+    """
     
+    async def get_rows(self, user_id: str) -> List[dict]:
+        """
+        根据用户ID获取用户偏好说明的原始行，供接口层直接转换为响应结构
+        :param user_id: 用户ID
+        :return: 行字典列表
+        """
+        sql = self.GET_BY_ID_SQL
+
+        try:
+            return await asyncio.to_thread(self._execute_read, sql, (f'instructions.{user_id}',), user_id)
+        except Exception as e:
+            print(f"[InstructionDao] 查询用户偏好说明失败: {e}")
+            return []
+
     async def get_by_id(self, user_id: str) -> List[Instruction]:
         """
         根据用户ID获取用户偏好说明
         :param user_id: 用户ID
         :return: Instruction对象列表
         """
-        sql = """
-            SELECT
-                value ->> 'content' as content,
-                value ->> 'language' as language,
-                key
-            FROM store
-            WHERE prefix = %s;
-        """
-        
         try:
-            rows = self._execute_query(sql, (f'instructions.{user_id}',))
-            return [Instruction.from_dict(row) for row in rows]
+            return [Instruction.from_dict(row) for row in await self.get_rows(user_id)]
         except Exception as e:
-            print(f"[InstructionDao] 查询用户偏好说明失败: {e}")
+            print(f"[InstructionDao] 转换用户偏好说明失败: {e}")
             return []
 
     
     async def create_instruction(self, user_id: str, instruction: Instruction) -> bool:
         """
-        创建用户偏好说明
+        创建用户偏好说明：每个用户每种语言只有一条规范记录（key 为 "{user_id}_{language}"），
+        新内容与已有内容按规则合并（去重、限长），而不是覆盖
         :param user_id: 用户ID
         :param instruction: Instruction对象
         :return: 是否创建成功
         """
-        sql = """
-            INSERT INTO store (prefix, key, value)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (prefix, key) DO UPDATE SET value = EXCLUDED.value;
-        """
-        
         try:
-            instruction_data = instruction.model_dump(exclude_none=True)
-            key = f"{user_id}_{instruction.language}"
-            self._execute_write(sql, (f'instructions.{user_id}', key, json.dumps(instruction_data)))
+            await asyncio.to_thread(self._merge_instruction, user_id, instruction.language, instruction.content)
+            invalidation.bump('instructions', user_id)
             return True
         except Exception as e:
             print(f"[InstructionDao] 创建偏好说明失败: {e}")
             return False
 
+    def _merge_instruction(self, user_id: str, language: str, content: str) -> None:
+        # 规则合并在 agent 包中，CRUD 入口导入本模块时不加载
+        from backend.agent.consolidation import canonical_key, merge_content
+        prefix, key = f'instructions.{user_id}', canonical_key(user_id, language)
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                # 同一用户的合并串行化，避免两个请求读到同一份旧内容后互相覆盖
+                conn.execute("SELECT pg_advisory_xact_lock(hashtextextended(%s, 0));", (f"instructions:{user_id}",))
+                row = conn.execute(
+                    "SELECT value ->> 'content' AS content FROM store WHERE prefix = %s AND key = %s;", (prefix, key)
+                ).fetchone()
+                value = {"language": language, "content": merge_content(row["content"] if row else None, content), "key": key}
+                conn.execute("""
+                    INSERT INTO store (prefix, key, value)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (prefix, key) DO UPDATE SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP;
+                """, (prefix, key, json.dumps(value)))
+
     async def delete_by_key(self, user_id: str, key: str) -> bool:
         """
         根据key删除用户偏好说明
@@ -65,6 +93,7 @@ class InstructionDao(BaseDao[Instruction]):
         
         try:
             self._execute_write(sql, (f'instructions.{user_id}', key))
+            invalidation.bump('instructions', user_id)
             return True
         except Exception as e:
             print(f"[InstructionDao] 删除偏好说明失败: {e}")
@@ -80,13 +109,14 @@ class InstructionDao(BaseDao[Instruction]):
         """
         sql = """
             UPDATE store 
-            SET value = %s 
+            SET value = %s, updated_at = CURRENT_TIMESTAMP
             WHERE prefix = %s AND key = %s;
         """
         
         try:
             instruction_data = instruction.model_dump(exclude_none=True)
             self._execute_write(sql, (json.dumps(instruction_data), f'instructions.{user_id}', key))
+            invalidation.bump('instructions', user_id)
             return True
         except Exception as e:
             print(f"[InstructionDao] 更新偏好说明失败: {e}")
@@ -0,0 +1,147 @@
+from typing import List, Optional
+from backend.dao.BaseDao import BaseDao
+
+
+class MemoryJobDao(BaseDao[dict]):
+    """
+    后台记忆抽取任务数据访问对象
+    get_by_id 供接口层查询使用；其余方法由后台工作线程调用，均为同步方法
+    """
+
+    def ensure_table(self) -> None:
+        """建表（幂等）"""
+        sql = """
+            CREATE TABLE IF NOT EXISTS memory_jobs (
+                id BIGSERIAL PRIMARY KEY,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                user_id TEXT NOT NULL,
+                update_type TEXT NOT NULL,
+                payload JSONB NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INT NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            CREATE INDEX IF NOT EXISTS memory_jobs_user_idx ON memory_jobs (user_id, created_at DESC);
+            CREATE INDEX IF NOT EXISTS memory_jobs_open_idx ON memory_jobs (status)
+                WHERE status IN ('pending', 'running');
+            -- 任务结束（done / failed）时取一个全局递增的序号，任意 worker 都能按序号读到完成事件
+            CREATE SEQUENCE IF NOT EXISTS memory_jobs_finished_seq;
+            ALTER TABLE memory_jobs ADD COLUMN IF NOT EXISTS finished_seq BIGINT;
+            CREATE INDEX IF NOT EXISTS memory_jobs_finished_idx ON memory_jobs (user_id, finished_seq)
+                WHERE finished_seq IS NOT NULL;
+        """
+        self._execute_write(sql)
+
+    async def get_by_id(self, user_id: str) -> List[dict]:
+        """
+        获取用户最近的后台任务
+        :param user_id: 用户ID
+        :return: 任务字典列表（不含 payload）
+        """
+        sql = """
+            SELECT id, update_type, status, attempts, last_error, created_at, updated_at
+            FROM memory_jobs
+            WHERE user_id = %s
+            ORDER BY created_at DESC
+            LIMIT 50;
+        """
+
+        try:
+            return self._execute_query(sql, (user_id,))
+        except Exception as e:
+            print(f"[MemoryJobDao] 查询后台任务失败: {e}")
+            return []
+
+    def enqueue(self, idempotency_key: str, user_id: str, update_type: str, payload: dict) -> Optional[dict]:
+        """
+        持久化一个新任务；幂等键已存在时返回已有任务
+        :return: 任务字典（id, status）
+        """
+        sql = """
+            INSERT INTO memory_jobs (idempotency_key, user_id, update_type, payload)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (idempotency_key) DO NOTHING
+            RETURNING id, status;
+        """
+        row = self._execute_single_query(sql, (idempotency_key, user_id, update_type, payload))
+        if row:
+            return row
+        return self._execute_single_query(
+            "SELECT id, status FROM memory_jobs WHERE idempotency_key = %s;",
+            (idempotency_key,)
+        )
+
+    def claim(self, job_id: int) -> Optional[dict]:
+        """
+        原子地将 pending 任务置为 running，多个进程并发恢复时只有一个能领取成功
+        :return: 领取成功时返回完整任务，否则 None
+        """
+        sql = """
+            UPDATE memory_jobs
+            SET status = 'running', attempts = attempts + 1, updated_at = now()
+            WHERE id = %s AND status = 'pending'
+            RETURNING id, idempotency_key, user_id, update_type, payload, attempts;
+        """
+        return self._execute_single_query(sql, (job_id,))
+
+    def mark_done(self, job_id: int) -> None:
+        self._execute_write(
+            """
+            UPDATE memory_jobs
+            SET status = 'done', last_error = NULL, finished_seq = nextval('memory_jobs_finished_seq'), updated_at = now()
+            WHERE id = %s;
+            """,
+            (job_id,)
+        )
+
+    def mark_failed(self, job_id: int, error: str, retry: bool) -> None:
+        """记录失败；retry 为 True 时放回 pending 等待重试，否则标记为 failed 并产生完成事件"""
+        if retry:
+            sql = "UPDATE memory_jobs SET status = 'pending', last_error = %s, updated_at = now() WHERE id = %s;"
+        else:
+            sql = """
+                UPDATE memory_jobs
+                SET status = 'failed', last_error = %s, finished_seq = nextval('memory_jobs_finished_seq'), updated_at = now()
+                WHERE id = %s;
+            """
+        self._execute_write(sql, (error[:2000], job_id))
+
+    def finished_since(self, user_id: str, after: int) -> List[dict]:
+        """
+        用户序号大于 after 的任务完成事件（所有 worker 执行的任务）
+        :return: 事件字典列表（seq, job_id, update_type, status），按序号升序
+        """
+        sql = """
+            SELECT finished_seq AS seq, id AS job_id, update_type, status
+            FROM memory_jobs
+            WHERE user_id = %s AND finished_seq > %s
+            ORDER BY finished_seq
+            LIMIT 100;
+        """
+        return self._execute_query(sql, (user_id, after))
+
+    def open_count(self, user_id: str) -> int:
+        """用户未完成（pending / running）的任务数"""
+        row = self._execute_single_query(
+            "SELECT count(*) AS total FROM memory_jobs WHERE user_id = %s AND status IN ('pending', 'running');",
+            (user_id,)
+        )
+        return row["total"]
+
+    def recover_open_jobs(self, stale_seconds: int) -> List[dict]:
+        """
+        进程启动时调用：把长时间停留在 running 的任务（进程崩溃遗留）放回 pending，并返回所有待执行任务
+        :return: 任务字典列表（id, user_id）
+        """
+        self._execute_write(
+            """
+            UPDATE memory_jobs SET status = 'pending', updated_at = now()
+            WHERE status = 'running' AND updated_at < now() - make_interval(secs => %s);
+            """,
+            (stale_seconds,)
+        )
+        return self._execute_query(
+            "SELECT id, user_id FROM memory_jobs WHERE status = 'pending' ORDER BY id;"
+        )
@@ -1,35 +1,52 @@
+import asyncio
 import json
-from typing import Optional
+from typing import List, Optional
 from backend.dao.BaseDao import BaseDao
+from backend.utils import invalidation
 from backend.agent.models import Profile
 
 class ProfileDao(BaseDao[Profile]):
     """用户档案数据访问对象"""
+
+    # 热点查询：启动预热时在每个连接上预先 prepare（见 utils/health.py）
+    GET_BY_ID_SQL = """
+        SELECT
+            value ->> 'name' AS name,
+            value ->> 'job' AS job,
+            value ->> 'location' AS location,
+            value ->> 'interests' AS interests,
+            value ->> 'connections' AS connections
+        FROM store
+        WHERE prefix = %s;
+    """
     
+    async def get_row(self, user_id: str) -> Optional[dict]:
+        """
+        根据用户ID获取用户档案的原始行（列表字段为 JSON 字符串），供接口层直接转换为响应结构
+        :param user_id: 用户ID
+        :return: 行字典或None
+        """
+        sql = self.GET_BY_ID_SQL
+
+        try:
+            return await asyncio.to_thread(self._execute_read, sql, (f'profile.{user_id}',), user_id, True)
+        except Exception as e:
+            print(f"[ProfileDao] 查询用户档案失败: {e}")
+            return None
+
     async def get_by_id(self, user_id: str) -> Optional[Profile]:
         """
         根据用户ID获取用户档案信息
         :param user_id: 用户ID
         :return: Profile对象或None
         """
-        sql = """
-            SELECT
-                value ->> 'name' AS name,
-                value ->> 'job' AS job,
-                value ->> 'location' AS location,
-                value ->> 'interests' AS interests,
-                value ->> 'connections' AS connections
-            FROM store
-            WHERE prefix = %s;
-        """
-        
         try:
-            row = self._execute_single_query(sql, (f'profile.{user_id}',))
+            row = await self.get_row(user_id)
             if row:
                 return Profile.from_dict(row)
             return None
         except Exception as e:
-            print(f"[ProfileDao] 查询用户档案失败: {e}")
+            print(f"[ProfileDao] 转换用户档案失败: {e}")
             return None
     
     async def create_profile(self, user_id: str, profile: Profile) -> bool:
@@ -42,12 +59,13 @@ class ProfileDao(BaseDao[Profile]):
         sql = """
             INSERT INTO store (prefix, key, value)
             VALUES (%s, %s, %s)
-            ON CONFLICT (prefix, key) DO UPDATE SET value = EXCLUDED.value;
+            ON CONFLICT (prefix, key) DO UPDATE SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP;
         """
         
         try:
             profile_data = profile.model_dump(exclude_none=True)
             self._execute_write(sql, (f'profile.{user_id}', user_id, json.dumps(profile_data)))
+            invalidation.bump('profile', user_id)
             return True
         except Exception as e:
             print(f"[ProfileDao] 创建用户档案失败: {e}")
@@ -56,13 +74,56 @@ class ProfileDao(BaseDao[Profile]):
     async def update_profile(self, user_id: str, profile: Profile) -> bool:
         sql = """
             UPDATE store 
-            SET value = %s 
+            SET value = %s, updated_at = CURRENT_TIMESTAMP
             WHERE prefix = %s;
         """
         try:
             profile_data = profile.model_dump(exclude_none=True)
             self._execute_write(sql, (json.dumps(profile_data), f'profile.{user_id}'))
+            invalidation.bump('profile', user_id)
             return True
         except Exception as e:
             print(f"[ProfileDao] 更新用户档案失败: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    async def patch_profile(self, user_id: str, fields: dict, list_append: dict[str, List[str]] = None) -> Optional[dict]:
+        """
+        按字段局部更新用户档案：标量字段用 jsonb || 合并，interests / connections 用 jsonb_set 追加
+        :param user_id: 用户ID
+        :param fields: 需要覆盖的字段，如 {"job": "工程师"}
+        :param list_append: 需要追加的列表字段，如 {"interests": ["游泳"]}
+        :return: 变更字段在库中的最新值；档案不存在或失败时返回 None
+        """
+        list_append = {k: v for k, v in (list_append or {}).items() if v}
+        changed = list(fields) + list(list_append)
+        if not changed:
+            return {}
+
+        new_value = "value || %s::jsonb"
+        params = [json.dumps(fields)]
+        for field, items in list_append.items():
+            # field 仅来自固定的白名单（interests / connections），可安全拼接
+            new_value = f"""
+                jsonb_set({new_value}, '{{{field}}}',
+                          COALESCE(value -> '{field}', '[]'::jsonb) || %s::jsonb)
+            """
+            params.append(json.dumps(items))
+
+        sql = f"""
+            UPDATE store
+            SET value = {new_value}, updated_at = CURRENT_TIMESTAMP
+            WHERE prefix = %s
+            RETURNING (
+                SELECT jsonb_object_agg(field, value -> field)
+                FROM unnest(%s::text[]) AS field
+            ) AS changed;
+        """
+        try:
+            row = self._execute_single_query(sql, (*params, f'profile.{user_id}', changed))
+            if row is None:
+                return None
+            invalidation.bump('profile', user_id)
+            return row["changed"]
+        except Exception as e:
+            print(f"[ProfileDao] 局部更新用户档案失败: {e}")
+            return None
@@ -0,0 +1,57 @@
+import asyncio
+import json
+from typing import List, Optional
+from backend.utils import invalidation
+
+# SqliteStore 用 orjson 写入 value（BLOB），JSON 函数需要先转成文本
+VALUE = "CAST(value AS TEXT)"
+
+
+def field(name: str) -> str:
+    """取 value 中的字段，等价于 Postgres 的 value ->> 'name'（数组 / 对象返回 JSON 文本）"""
+    return f"json_extract({VALUE}, '$.{name}')"
+
+
+class SqliteDaoMixin:
+    """SQLite 模式下 DAO 的公共实现：覆盖 BaseDao 中使用 Postgres 专有语法的方法"""
+
+    async def get_namespace_version(self, kind: str, user_id: str) -> str:
+        """
+        命名空间的数据版本：max(updated_at)、记录数与本进程的写入版本号
+        SQLite 的 CURRENT_TIMESTAMP 只精确到秒，同一秒内的多次修改靠写入版本号区分（单机模式只有一个进程写入）
+        """
+        sql = """
+            SELECT max(updated_at) AS updated_at, count(*) AS total
+            FROM store
+            WHERE prefix = %s;
+        """
+        row = await asyncio.to_thread(self._execute_single_query, sql, (f'{kind}.{user_id}',))
+        return f"{row['updated_at'] or 0}-{row['total']}-{invalidation.current_version(kind, user_id)}"
+
+    def _patch_value(self, prefix: str, key: Optional[str], fields: dict,
+                     list_append: dict[str, List[str]]) -> Optional[dict]:
+        """
+        在一个写事务内读出 value、合并字段、追加列表字段后写回
+        :param key: None 表示按 prefix 定位（档案每个用户只有一条）
+        :return: 变更字段的最新值；记录不存在时返回 None
+        """
+        where = "prefix = %s" + (" AND key = %s" if key is not None else "")
+        params = (prefix, key) if key is not None else (prefix,)
+        with self.pool.connection() as conn:
+            # IMMEDIATE：开始时即拿写锁，避免读后写时与其他写者冲突
+            conn.execute("BEGIN IMMEDIATE;")
+            row = conn.execute(f"SELECT key, {VALUE} AS value FROM store WHERE {where} LIMIT 1;", params).fetchone()
+            if row is None:
+                conn.rollback()
+                return None
+
+            value = json.loads(row["value"])
+            value.update(json.loads(json.dumps(fields, default=str)))
+            for name, items in list_append.items():
+                value[name] = list(value.get(name) or []) + list(items)
+            conn.execute(
+                "UPDATE store SET value = %s, updated_at = CURRENT_TIMESTAMP WHERE prefix = %s AND key = %s;",
+                (json.dumps(value), prefix, row["key"])
+            )
+            conn.commit()
+        return {name: value.get(name) for name in list(fields) + list(list_append)}
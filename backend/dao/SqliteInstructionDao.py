@@ -0,0 +1,41 @@
+import asyncio
+import json
+from typing import List
+from backend.dao.InstructionDao import InstructionDao
+from backend.dao.SqliteDao import SqliteDaoMixin, VALUE, field
+
+
+class SqliteInstructionDao(SqliteDaoMixin, InstructionDao):
+    """用户偏好说明数据访问对象（SQLite 单机模式）"""
+
+    async def get_rows(self, user_id: str) -> List[dict]:
+        sql = f"""
+            SELECT
+                {field('content')} as content,
+                {field('language')} as language,
+                key
+            FROM store
+            WHERE prefix = %s;
+        """
+
+        try:
+            return await asyncio.to_thread(self._execute_query, sql, (f'instructions.{user_id}',))
+        except Exception as e:
+            print(f"[SqliteInstructionDao] 查询用户偏好说明失败: {e}")
+            return []
+
+    def _merge_instruction(self, user_id: str, language: str, content: str) -> None:
+        from backend.agent.consolidation import canonical_key, merge_content
+        prefix, key = f'instructions.{user_id}', canonical_key(user_id, language)
+        with self.pool.connection() as conn:
+            # IMMEDIATE：开始时即拿写锁，读出旧内容到写回之间没有其他写者
+            conn.execute("BEGIN IMMEDIATE;")
+            row = conn.execute(f"SELECT {VALUE} AS value FROM store WHERE prefix = %s AND key = %s;", (prefix, key)).fetchone()
+            existing = json.loads(row["value"]).get("content") if row else None
+            value = {"language": language, "content": merge_content(existing, content), "key": key}
+            conn.execute("""
+                INSERT INTO store (prefix, key, value)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (prefix, key) DO UPDATE SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP;
+            """, (prefix, key, json.dumps(value)))
+            conn.commit()
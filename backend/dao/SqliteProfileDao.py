@@ -0,0 +1,41 @@
+import asyncio
+from typing import List, Optional
+from backend.dao.ProfileDao import ProfileDao
+from backend.dao.SqliteDao import SqliteDaoMixin, field
+from backend.utils import invalidation
+
+
+class SqliteProfileDao(SqliteDaoMixin, ProfileDao):
+    """用户档案数据访问对象（SQLite 单机模式）"""
+
+    async def get_row(self, user_id: str) -> Optional[dict]:
+        sql = f"""
+            SELECT
+                {field('name')} AS name,
+                {field('job')} AS job,
+                {field('location')} AS location,
+                {field('interests')} AS interests,
+                {field('connections')} AS connections
+            FROM store
+            WHERE prefix = %s;
+        """
+
+        try:
+            return await asyncio.to_thread(self._execute_single_query, sql, (f'profile.{user_id}',))
+        except Exception as e:
+            print(f"[SqliteProfileDao] 查询用户档案失败: {e}")
+            return None
+
+    async def patch_profile(self, user_id: str, fields: dict, list_append: dict[str, List[str]] = None) -> Optional[dict]:
+        list_append = {k: v for k, v in (list_append or {}).items() if v}
+        if not fields and not list_append:
+            return {}
+        try:
+            changed = self._patch_value(f'profile.{user_id}', None, fields, list_append)
+            if changed is None:
+                return None
+            invalidation.bump('profile', user_id)
+            return changed
+        except Exception as e:
+            print(f"[SqliteProfileDao] 局部更新用户档案失败: {e}")
+            return None
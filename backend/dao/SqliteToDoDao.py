@@ -0,0 +1,115 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import List, Optional
+from backend.dao.SqliteDao import SqliteDaoMixin, VALUE, field
+from backend.dao.ToDoDao import ToDoDao, decode_history_cursor, encode_history_cursor
+from backend.utils import invalidation
+from backend.agent.models import ToDo
+
+_COLUMNS = f"""
+    {field('task')} as task,
+    {field('status')} as status,
+    {field('deadline')} as deadline,
+    {field('solutions')} as solutions,
+    {field('planned_edits')} as planned_edits,
+    {field('time_to_complete')} as time_to_complete,
+    key
+"""
+
+
+class SqliteToDoDao(SqliteDaoMixin, ToDoDao):
+    """待办事项数据访问对象（SQLite 单机模式）；创建 / 删除 / 整体更新的 SQL 两种数据库通用，沿用父类"""
+
+    VALUE_TEXT = VALUE
+
+    async def get_rows(self, user_id: str) -> List[dict]:
+        sql = f"""
+            SELECT {_COLUMNS}
+            FROM store
+            WHERE prefix = %s;
+        """
+
+        try:
+            return await asyncio.to_thread(self._execute_query, sql, (f'todo.{user_id}',))
+        except Exception as e:
+            print(f"[SqliteToDoDao] 查询待办事项失败: {e}")
+            return []
+
+    async def patch_by_key(self, user_id: str, key: str, fields: dict, solutions_append: List[str] = None) -> Optional[dict]:
+        if not fields and not solutions_append:
+            return {}
+        try:
+            changed = self._patch_value(f'todo.{user_id}', key, fields,
+                                        {"solutions": solutions_append} if solutions_append else {})
+            if changed is None:
+                return None
+            invalidation.bump('todo', user_id)
+            return changed
+        except Exception as e:
+            print(f"[SqliteToDoDao] 局部更新待办事项失败: {e}")
+            return None
+
+    def archive_finished(self, older_than_days: int) -> List[str]:
+        """把完成 / 归档超过期限的待办移到 todo_archive.{user_id}；复制与删除在同一个写事务中"""
+        condition = f"""
+            prefix LIKE 'todo.%%'
+            AND {field('status')} IN ('done', 'archived')
+            AND updated_at < datetime('now', %s)
+        """
+        params = (f"{-int(older_than_days)} days",)
+
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE;")
+            conn.execute(f"""
+                INSERT INTO store (prefix, key, value, created_at, updated_at)
+                SELECT 'todo_archive.' || substr(prefix, length('todo.') + 1), key, value, created_at, updated_at
+                FROM store
+                WHERE {condition}
+                ON CONFLICT (prefix, key) DO UPDATE
+                    SET value = excluded.value, updated_at = excluded.updated_at;
+            """, params)
+            rows = conn.execute(f"""
+                DELETE FROM store
+                WHERE {condition}
+                RETURNING substr(prefix, length('todo.') + 1) AS user_id;
+            """, params).fetchall()
+            conn.commit()
+
+        user_ids = sorted({row["user_id"] for row in rows})
+        for user_id in user_ids:
+            invalidation.bump('todo', user_id)
+        return user_ids
+
+    async def get_history(self, user_id: str, limit: int = 20, cursor: Optional[str] = None) -> tuple[List[dict], Optional[str]]:
+        conditions = "prefix = %s"
+        params: list = [f'todo_archive.{user_id}']
+        if cursor:
+            updated_at, key = decode_history_cursor(cursor)
+            conditions += " AND (updated_at, key) < (%s, %s)"
+            params += [updated_at, key]
+
+        sql = f"""
+            SELECT {_COLUMNS}, updated_at
+            FROM store
+            WHERE {conditions}
+            ORDER BY updated_at DESC, key DESC
+            LIMIT %s;
+        """
+        params.append(limit + 1)
+
+        try:
+            rows = await asyncio.to_thread(self._execute_query, sql, tuple(params))
+        except Exception as e:
+            print(f"[SqliteToDoDao] 查询历史待办失败: {e}")
+            return [], None
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            # 游标直接使用库中的时间文本，比较时与列的格式一致
+            next_cursor = encode_history_cursor(rows[-1]['updated_at'], rows[-1]['key'])
+        todos = []
+        for row in rows:
+            updated_at = datetime.fromisoformat(row.pop("updated_at")).replace(tzinfo=timezone.utc)
+            todos.append({**ToDo.from_dict(row).model_dump(), "updated_at": updated_at.isoformat()})
+        return todos, next_cursor
@@ -1,58 +1,138 @@
+import asyncio
+import base64
+import binascii
 import json
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 from backend.dao.BaseDao import BaseDao
+from backend.utils import invalidation
 from backend.agent.models import ToDo
 
+
+class InvalidCursor(ValueError):
+    """历史分页游标无法解析"""
+
+
+class IdempotencyConflict(Exception):
+    """同一幂等键（同一 key）再次创建时，请求内容与已有记录不同"""
+
+
+def encode_history_cursor(updated_at: str, key: str) -> str:
+    """
+    游标编码为不透明的 URL 安全文本：时间的 isoformat 含 "+"，直接放进查询参数会被解析成空格
+    :param updated_at: 该页最后一条的更新时间文本（与库中列的格式一致）
+    """
+    return base64.urlsafe_b64encode(f"{updated_at}|{key}".encode()).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor: str) -> tuple[str, str]:
+    """
+    :return: (updated_at 文本, key)
+    :raises InvalidCursor: 游标不是 encode_history_cursor 生成的
+    """
+    try:
+        text = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        updated_at, sep, key = text.partition("|")
+        if not sep or not key:
+            raise ValueError("缺少 key")
+        datetime.fromisoformat(updated_at)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor(f"无效的分页游标: {cursor}") from e
+    return updated_at, key
+
+
 class ToDoDao(BaseDao[ToDo]):
     """待办事项数据访问对象"""
+
+    # value 列转为 JSON 文本的表达式（SQLite 中 value 为 BLOB，由子类覆盖）
+    VALUE_TEXT = "value::text"
+
+    # 热点查询：启动预热时在每个连接上预先 prepare（见 utils/health.py）
+    GET_BY_ID_SQL = """
+        SELECT
+            value ->> 'task' as task,
+            value ->> 'status' as status,
+            value ->> 'deadline' as deadline,
+            value ->> 'solutions' as solutions,
+            value ->> 'planned_edits' as planned_edits,
+            value ->> 'time_to_complete' as time_to_complete,
+            key
+        FROM store
+        WHERE prefix = %s;
+    """
     
+    async def get_rows(self, user_id: str) -> List[dict]:
+        """
+        根据用户ID获取所有待办事项的原始行（列表字段为 JSON 字符串），供接口层直接转换为响应结构
+        :param user_id: 用户ID
+        :return: 行字典列表
+        """
+        sql = self.GET_BY_ID_SQL
+
+        try:
+            return await asyncio.to_thread(self._execute_read, sql, (f'todo.{user_id}',), user_id)
+        except Exception as e:
+            print(f"[ToDoDao] 查询待办事项失败: {e}")
+            return []
+
     async def get_by_id(self, user_id: str) -> List[ToDo]:
         """
         根据用户ID获取所有待办事项
         :param user_id: 用户ID
         :return: ToDo对象列表
         """
-        sql = """
-            SELECT
-                value ->> 'task' as task,
-                value ->> 'status' as status,
-                value ->> 'deadline' as deadline,
-                value ->> 'solutions' as solutions,
-                value ->> 'planned_edits' as planned_edits,
-                value ->> 'time_to_complete' as time_to_complete,
-                key
-            FROM store
-            WHERE prefix = %s;
-        """
-        
         try:
-            rows = self._execute_query(sql, (f'todo.{user_id}',))
-            return [ToDo.from_dict(row) for row in rows]
+            return [ToDo.from_dict(row) for row in await self.get_rows(user_id)]
         except Exception as e:
-            print(f"[ToDoDao] 查询待办事项失败: {e}")
+            print(f"[ToDoDao] 转换待办事项失败: {e}")
             return []
 
     
     async def create_todo(self, user_id: str, todo: ToDo) -> bool:
         """
-        创建待办事项
+        创建待办事项（幂等：key 已存在且内容相同时视为重放，返回成功但不重复写入、不广播失效）
         :param user_id: 用户ID
-        :param to do: To Do对象
+        :param todo: ToDo对象，key 由调用方生成（UUIDv7 或由幂等键派生）
         :return: 是否创建成功
+        :raises IdempotencyConflict: key 已存在且内容不同（幂等键被用于不同的请求）
         """
-        sql = """
-            INSERT INTO store (prefix, key, value)
-            VALUES (%s, %s, %s);
-        """
-        
         try:
             todo_data = todo.model_dump(exclude_none=True)
-            key = f"{user_id}_{todo.task[:50]}"
-            self._execute_write(sql, (f'todo.{user_id}', key, json.dumps(todo_data, default=str)))
-            return True
+            inserted = await asyncio.to_thread(
+                self._insert_once, f'todo.{user_id}', todo.key, json.dumps(todo_data, default=str)
+            )
+        except IdempotencyConflict:
+            raise
         except Exception as e:
             print(f"[ToDoDao] 创建待办事项失败: {e}")
             return False
+        if inserted:
+            invalidation.bump('todo', user_id)
+        return True
+
+    def _insert_once(self, prefix: str, key: str, value: str) -> bool:
+        """
+        插入记录，key 已存在时不覆盖
+        :return: 是否新插入；已存在且内容相同时返回 False
+        :raises IdempotencyConflict: 已存在且内容不同
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO store (prefix, key, value)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (prefix, key) DO NOTHING;
+                """, (prefix, key, value))
+                inserted = cur.rowcount == 1
+                existing = None
+                if not inserted:
+                    cur.execute(f"SELECT {self.VALUE_TEXT} AS value FROM store WHERE prefix = %s AND key = %s;", (prefix, key))
+                    existing = cur.fetchone()
+            conn.commit()
+        # 已存在的记录在此期间被删除时没有可比较的内容，按重放处理
+        if existing is not None and json.loads(existing["value"]) != json.loads(value):
+            raise IdempotencyConflict(f"key {key} 已存在且内容不同")
+        return inserted
 
     async def delete_by_key(self, user_id: str, key: str) -> bool:
         """
@@ -68,6 +148,7 @@ class ToDoDao(BaseDao[ToDo]):
         
         try:
             self._execute_write(sql, (f'todo.{user_id}', key))
+            invalidation.bump('todo', user_id)
             return True
         except Exception as e:
             print(f"[ToDoDao] 删除待办事项失败: {e}")
@@ -83,14 +164,138 @@ class ToDoDao(BaseDao[ToDo]):
         """
         sql = """
             UPDATE store 
-            SET value = %s 
+            SET value = %s, updated_at = CURRENT_TIMESTAMP
             WHERE prefix = %s AND key = %s;
         """
         
         try:
             todo_data = todo.model_dump(exclude_none=True)
             self._execute_write(sql, (json.dumps(todo_data, default=str), f'todo.{user_id}', key))
+            invalidation.bump('todo', user_id)
             return True
         except Exception as e:
             print(f"[ToDoDao] 更新待办事项失败: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    async def patch_by_key(self, user_id: str, key: str, fields: dict, solutions_append: List[str] = None) -> Optional[dict]:
+        """
+        按字段局部更新待办事项：标量字段用 jsonb || 合并，solutions 用 jsonb_set 追加，不重写整个文档
+        :param user_id: 用户ID
+        :param key: 记录的key
+        :param fields: 需要覆盖的字段，如 {"status": "done"}
+        :param solutions_append: 追加到 solutions 末尾的条目
+        :return: 变更字段在库中的最新值；记录不存在或失败时返回 None
+        """
+        changed = list(fields) + (["solutions"] if solutions_append else [])
+        if not changed:
+            return {}
+
+        if solutions_append:
+            new_value = """
+                jsonb_set(value || %s::jsonb, '{solutions}',
+                          COALESCE(value -> 'solutions', '[]'::jsonb) || %s::jsonb)
+            """
+            params = [json.dumps(fields, default=str), json.dumps(solutions_append)]
+        else:
+            new_value = "value || %s::jsonb"
+            params = [json.dumps(fields, default=str)]
+
+        sql = f"""
+            UPDATE store
+            SET value = {new_value}, updated_at = CURRENT_TIMESTAMP
+            WHERE prefix = %s AND key = %s
+            RETURNING (
+                SELECT jsonb_object_agg(field, value -> field)
+                FROM unnest(%s::text[]) AS field
+            ) AS changed;
+        """
+
+        try:
+            row = self._execute_single_query(sql, (*params, f'todo.{user_id}', key, changed))
+            if row is None:
+                return None
+            invalidation.bump('todo', user_id)
+            return row["changed"]
+        except Exception as e:
+            print(f"[ToDoDao] 局部更新待办事项失败: {e}")
+            return None
+
+    def archive_finished(self, older_than_days: int) -> List[str]:
+        """
+        把完成 / 归档超过 older_than_days 天的待办从 todo.{user_id} 移到冷前缀 todo_archive.{user_id}
+        删除与插入在同一条语句中完成，不会出现中间状态
+        :return: 发生迁移的用户ID列表
+        """
+        sql = """
+            WITH moved AS (
+                DELETE FROM store
+                WHERE prefix LIKE 'todo.%%'
+                  AND value ->> 'status' IN ('done', 'archived')
+                  AND updated_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+                RETURNING prefix, key, value, created_at, updated_at
+            )
+            INSERT INTO store (prefix, key, value, created_at, updated_at)
+            SELECT 'todo_archive.' || substr(prefix, length('todo.') + 1), key, value, created_at, updated_at
+            FROM moved
+            ON CONFLICT (prefix, key) DO UPDATE
+                SET value = EXCLUDED.value, updated_at = EXCLUDED.updated_at
+            RETURNING substr(prefix, length('todo_archive.') + 1) AS user_id;
+        """
+
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, (older_than_days,))
+                user_ids = sorted({row["user_id"] for row in cur.fetchall()})
+                conn.commit()
+        for user_id in user_ids:
+            invalidation.bump('todo', user_id)
+        return user_ids
+
+    async def get_history(self, user_id: str, limit: int = 20, cursor: Optional[str] = None) -> tuple[List[dict], Optional[str]]:
+        """
+        分页查询已归档的待办，按归档前最后更新时间倒序
+        :param user_id: 用户ID
+        :param limit: 每页条数
+        :param cursor: 上一页返回的游标，None 表示第一页
+        :return: (待办列表（附 updated_at）, 下一页游标；没有更多时为 None)
+        :raises InvalidCursor: 游标无法解析
+        """
+        conditions = "prefix = %s"
+        params: list = [f'todo_archive.{user_id}']
+        if cursor:
+            updated_at, key = decode_history_cursor(cursor)
+            conditions += " AND (updated_at, key) < (%s::timestamptz, %s)"
+            params += [updated_at, key]
+
+        sql = f"""
+            SELECT
+                value ->> 'task' as task,
+                value ->> 'status' as status,
+                value ->> 'deadline' as deadline,
+                value ->> 'solutions' as solutions,
+                value ->> 'planned_edits' as planned_edits,
+                value ->> 'time_to_complete' as time_to_complete,
+                key,
+                updated_at
+            FROM store
+            WHERE {conditions}
+            ORDER BY updated_at DESC, key DESC
+            LIMIT %s;
+        """
+        params.append(limit + 1)
+
+        try:
+            rows = await asyncio.to_thread(self._execute_query, sql, tuple(params))
+        except Exception as e:
+            print(f"[ToDoDao] 查询历史待办失败: {e}")
+            return [], None
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_history_cursor(rows[-1]['updated_at'].isoformat(), rows[-1]['key'])
+        todos = []
+        for row in rows:
+            updated_at = row.pop("updated_at")
+            todos.append({**ToDo.from_dict(row).model_dump(), "updated_at": updated_at.isoformat()})
+        return todos, next_cursor
@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+from typing import List, Optional
+from psycopg.errors import LockNotAvailable
+from backend.dao.BaseDao import BaseDao
+
+
+class TurnLockTimeout(Exception):
+    """等待同一用户的上一轮对话超时"""
+
+
+class TurnDao(BaseDao[dict]):
+    """
+    对话轮次数据访问对象：跨 worker 的用户级轮次锁（Postgres advisory lock）与最近轮次结果
+    除 get_by_id 外均为同步方法，由对话线程调用
+    """
+
+    def ensure_table(self) -> None:
+        """建表（幂等）"""
+        sql = """
+            CREATE TABLE IF NOT EXISTS agent_turns (
+                message_hash TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            CREATE INDEX IF NOT EXISTS agent_turns_created_idx ON agent_turns (created_at);
+        """
+        self._execute_write(sql)
+
+    async def get_by_id(self, user_id: str) -> List[dict]:
+        """
+        获取用户最近的对话轮次结果
+        :param user_id: 用户ID
+        """
+        sql = """
+            SELECT message_hash, response, created_at
+            FROM agent_turns
+            WHERE user_id = %s
+            ORDER BY created_at DESC
+            LIMIT 50;
+        """
+
+        try:
+            return self._execute_query(sql, (user_id,))
+        except Exception as e:
+            print(f"[TurnDao] 查询对话轮次失败: {e}")
+            return []
+
+    @contextmanager
+    def user_lock(self, user_id: str, timeout: float):
+        """
+        持有用户级会话 advisory lock 直到退出上下文；锁与连接绑定，期间占用一个连接池连接
+        :param timeout: 最长等待秒数，超时抛出 TurnLockTimeout
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT set_config('lock_timeout', %s, false);", (f"{int(timeout * 1000)}ms",))
+                try:
+                    cur.execute("SELECT pg_advisory_lock(hashtextextended(%s, 0));", (f"turn:{user_id}",))
+                except LockNotAvailable as e:
+                    raise TurnLockTimeout(f"等待用户 {user_id} 的上一轮对话超时") from e
+                finally:
+                    cur.execute("RESET lock_timeout;")
+                try:
+                    yield
+                finally:
+                    cur.execute("SELECT pg_advisory_unlock(hashtextextended(%s, 0));", (f"turn:{user_id}",))
+
+    def get_recent(self, message_hash: str, window_seconds: float) -> Optional[str]:
+        """去重窗口内相同消息的回复，没有则 None"""
+        sql = """
+            SELECT response
+            FROM agent_turns
+            WHERE message_hash = %s AND created_at > now() - make_interval(secs => %s);
+        """
+        row = self._execute_single_query(sql, (message_hash, window_seconds))
+        return row["response"] if row else None
+
+    def save(self, message_hash: str, user_id: str, response: str) -> None:
+        """记录本轮回复，并顺带清理一小时前的记录"""
+        sql = """
+            INSERT INTO agent_turns (message_hash, user_id, response)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (message_hash) DO UPDATE
+                SET response = EXCLUDED.response, created_at = now();
+        """
+        self._execute_write(sql, (message_hash, user_id, response))
+        self._execute_write("DELETE FROM agent_turns WHERE created_at < now() - interval '1 hour';")
@@ -0,0 +1,28 @@
+from backend.dao.InstructionDao import InstructionDao
+from backend.dao.ProfileDao import ProfileDao
+from backend.dao.ToDoDao import ToDoDao
+from backend.utils.storage import is_sqlite
+
+
+def todo_dao() -> ToDoDao:
+    """按 STORAGE_BACKEND 创建待办 DAO"""
+    if is_sqlite():
+        from backend.dao.SqliteToDoDao import SqliteToDoDao
+        return SqliteToDoDao()
+    return ToDoDao()
+
+
+def profile_dao() -> ProfileDao:
+    """按 STORAGE_BACKEND 创建用户档案 DAO"""
+    if is_sqlite():
+        from backend.dao.SqliteProfileDao import SqliteProfileDao
+        return SqliteProfileDao()
+    return ProfileDao()
+
+
+def instruction_dao() -> InstructionDao:
+    """按 STORAGE_BACKEND 创建偏好说明 DAO"""
+    if is_sqlite():
+        from backend.dao.SqliteInstructionDao import SqliteInstructionDao
+        return SqliteInstructionDao()
+    return InstructionDao()
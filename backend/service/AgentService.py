@@ -1,22 +1,127 @@
+import asyncio
+import os
+import threading
+import traceback
+import uuid
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
 from litestar.di import Provide
 
-from backend.agent.core import ToDoAgent
+from backend.dao.MemoryJobDao import MemoryJobDao
+from backend.utils.metrics import metrics
+from backend.utils.storage import is_postgres
+
+# agent 模块（langgraph、langchain_openai、trustcall）导入耗时较长，第一次对话时才导入，
+# 只处理 CRUD 请求的进程与测试无需加载
+if TYPE_CHECKING:
+    from backend.agent.core import ToDoAgent
+
+
+# 长连接会话发送队列的容量（条）；队列满时模型输出线程等待，客户端收得慢不会无限占用内存
+WS_SEND_QUEUE_SIZE = int(os.getenv("AGENT_WS_SEND_QUEUE_SIZE", "64"))
+
+_shared_agent: "ToDoAgent | None" = None
+_shared_agent_lock = threading.Lock()
+
+
+def get_shared_agent() -> "ToDoAgent":
+    """进程内共享的 agent：图编译、store / checkpointer 初始化只做一次"""
+    global _shared_agent
+    with _shared_agent_lock:
+        if _shared_agent is None:
+            from backend.agent.core import ToDoAgent
+            _shared_agent = ToDoAgent()
+        return _shared_agent
+
+
+def _turn_coordinator():
+    from backend.agent.turns import get_turn_coordinator
+    return get_turn_coordinator()
+
+
+def _memory_job_queue():
+    from backend.agent.background import get_memory_job_queue
+    return get_memory_job_queue()
+
+
+def close_shared_agent() -> None:
+    """应用关闭时调用"""
+    with _shared_agent_lock:
+        if _shared_agent is not None:
+            _shared_agent.close()
+
+
+async def _iterate_in_thread(make_iterator):
+    """
+    在工作线程中消费同步迭代器，经有界队列逐条交给调用方（背压同 session_turn）
+    调用方中途退出时继续取走剩余元素，让工作线程跑完并释放轮次锁
+    """
+    loop = asyncio.get_running_loop()
+    items: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+    finished = object()
+    failure: list[BaseException] = []
+
+    def produce():
+        try:
+            for item in make_iterator():
+                asyncio.run_coroutine_threadsafe(items.put(item), loop).result()
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            asyncio.run_coroutine_threadsafe(items.put(finished), loop).result()
+
+    worker = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item = await items.get()
+            if item is finished:
+                break
+            yield item
+        if failure:
+            raise failure[0]
+    finally:
+        while not worker.done():
+            try:
+                await asyncio.wait_for(items.get(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+
+
+@dataclass
+class ChatSession:
+    """长连接会话状态：连接存续期间复用同一 thread_id 与记忆快照"""
+    user_id: str
+    thread_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    deferred_memory: bool | None = None
+    memory_snapshot: dict = field(default_factory=dict)
 
 
 class AgentService:
 
-    def __init__(self):
-        self.agent = ToDoAgent()
+    @property
+    def agent(self) -> "ToDoAgent":
+        """仅在真正对话时才构建 agent，查询后台任务等接口无需构建"""
+        return get_shared_agent()
     
-    async def chat_with_agent(self, user_id: str, input_text: str, client_info: dict = None) -> dict:
+    async def chat_with_agent(self, user_id: str, input_text: str, client_info: dict = None,
+                              deferred_memory: bool | None = None) -> dict:
         """
         处理与agent的对话业务逻辑
         :param user_id: 用户ID
         :param input_text: 输入文本
         :param client_info: 客户端信息（可选）
+        :param deferred_memory: 是否先回复、后台抽取记忆（可选）
         :return: 包含响应内容的字典
         """
-        response = self.agent.chat(user_id=user_id, input=input_text, stream=False)
+        # 同一用户的轮次串行执行，重复提交共享同一结果
+        response = await asyncio.to_thread(
+            _turn_coordinator().run,
+            user_id,
+            input_text,
+            lambda: self.agent.chat(user_id=user_id, input=input_text, stream=False,
+                                    deferred_memory=deferred_memory)
+        )
         
         result = {
             "response": response.content
@@ -28,14 +133,152 @@ class AgentService:
             
         return result
 
-    def chat_with_agent_stream(self, user_id: str, input_text: str):
+    async def chat_with_agent_stream(self, user_id: str, input_text: str, deferred_memory: bool | None = None):
         """
         处理与agent的流式对话业务逻辑
+        轮次串行等待与模型输出都在工作线程中进行，经有界队列交给事件循环，不阻塞其他请求
         :param user_id: 用户ID
         :param input_text: 输入文本
-        :return: 流式响应生成器
+        :param deferred_memory: 是否先回复、后台抽取记忆（可选）
+        :return: 流式响应异步生成器
         """
-        return self.agent.chat(user_id=user_id, input=input_text, stream=True)
+        coordinator = _turn_coordinator()
+        pending = coordinator.in_flight(user_id, input_text)
+        if pending is not None:
+            # 相同消息正在执行：等待其最终回复，不占用工作线程
+            metrics.incr("turns.deduplicated")
+            yield await asyncio.wrap_future(pending)
+            return
+
+        async for chunk in _iterate_in_thread(lambda: coordinator.stream(
+            user_id,
+            input_text,
+            lambda: self.agent.chat(user_id=user_id, input=input_text, stream=True,
+                                    deferred_memory=deferred_memory)
+        )):
+            yield chunk
+
+    def open_session(self, user_id: str, thread_id: str | None = None,
+                     deferred_memory: bool | None = None) -> ChatSession:
+        """
+        创建长连接会话
+        :param thread_id: 指定时接续已有对话，否则新建
+        """
+        session = ChatSession(user_id=user_id, deferred_memory=deferred_memory)
+        if thread_id:
+            session.thread_id = thread_id
+        return session
+
+    async def session_turn(self, session: ChatSession, input_text: str):
+        """
+        在会话中执行一轮对话，逐条产出 ("token", 片段) 与最终的 ("done", 完整回复)
+        模型输出在工作线程中产生，经有界队列交给调用方：调用方消费慢时工作线程阻塞等待（背压）
+        """
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        finished = object()
+
+        def produce():
+            try:
+                with _turn_coordinator().serialized(session.user_id):
+                    for event in self.agent.chat_tokens(
+                        user_id=session.user_id,
+                        input=input_text,
+                        thread_id=session.thread_id,
+                        deferred_memory=session.deferred_memory,
+                        memory_snapshot=session.memory_snapshot,
+                    ):
+                        asyncio.run_coroutine_threadsafe(events.put(event), loop).result()
+            except BaseException as e:
+                asyncio.run_coroutine_threadsafe(events.put(("error", str(e))), loop).result()
+                raise
+            finally:
+                asyncio.run_coroutine_threadsafe(events.put(finished), loop).result()
+
+        worker = loop.run_in_executor(None, produce)
+        try:
+            pending = None
+            while True:
+                event = pending if pending is not None else await events.get()
+                pending = None
+                if event is finished:
+                    break
+                if event[0] == "token":
+                    # 客户端跟不上时队列中会积压 token，合并成一条发送，减少帧数
+                    parts = [event[1]]
+                    while not events.empty():
+                        following = events.get_nowait()
+                        if following is finished or following[0] != "token":
+                            pending = following
+                            break
+                        parts.append(following[1])
+                    if len(parts) > 1:
+                        metrics.incr("agent_ws.coalesced_tokens", len(parts) - 1)
+                    event = ("token", "".join(parts))
+                yield event
+        finally:
+            # 调用方中途退出（如连接断开）时继续取走事件，让工作线程跑完本轮并释放轮次锁
+            while not worker.done():
+                try:
+                    await asyncio.wait_for(events.get(), timeout=1)
+                except asyncio.TimeoutError:
+                    pass
+            worker.exception()
+
+    async def get_memory_jobs(self, user_id: str) -> dict:
+        """
+        查询用户的后台记忆抽取任务（轮询接口）
+        :param user_id: 用户ID
+        :return: 包含未完成任务数与最近任务的字典
+        """
+        try:
+            job_queue = _memory_job_queue()
+            if job_queue is not None and job_queue.dao is not None:
+                jobs = await job_queue.dao.get_by_id(user_id)
+            elif job_queue is not None:
+                jobs = job_queue.events_since(user_id, 0)
+            else:
+                jobs = await MemoryJobDao().get_by_id(user_id)
+            return {
+                "success": True,
+                "pending": await asyncio.to_thread(job_queue.pending_count, user_id) if job_queue else 0,
+                "response": jobs,
+            }
+        except Exception as e:
+            traceback.print_exc()
+            return {"error": str(e)}
+
+    async def memory_job_events(self, user_id: str, after: int = 0, timeout: float = 120.0):
+        """
+        后台任务完成事件的异步生成器（SSE），该用户的任务全部完成或超时后结束
+        Postgres 模式下从 memory_jobs 表轮询，任务在其他 worker 中执行（或本 worker 尚未构建 agent）时同样能收到
+        :param user_id: 用户ID
+        :param after: 只返回序号大于 after 的事件
+        :param timeout: 最长等待秒数
+        """
+        source = _memory_job_queue()
+        if source is None:
+            if not is_postgres():
+                return
+            source = MemoryJobDao()
+            events_since, pending_count = source.finished_since, source.open_count
+        else:
+            events_since, pending_count = source.events_since, source.pending_count
+
+        cursor = after
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            for event in await asyncio.to_thread(events_since, user_id, cursor):
+                cursor = event["seq"]
+                if event["update_type"] == "todo" and event["status"] == "done":
+                    yield "todo_updated", event
+                else:
+                    yield "job_finished", event
+            if await asyncio.to_thread(pending_count, user_id) == 0:
+                yield "idle", {"pending": 0}
+                return
+            await asyncio.sleep(0.5)
     
     # async def get_user_todos(self, user_id: str) -> dict:
     #     """
@@ -0,0 +1,40 @@
+import os
+from dotenv import load_dotenv
+from backend.dao import factory
+from backend.utils.metrics import metrics
+from backend.utils.periodic import run_periodically
+
+load_dotenv()
+
+# 完成 / 归档多少天后移入冷前缀
+TODO_ARCHIVE_AFTER_DAYS = int(os.getenv("TODO_ARCHIVE_AFTER_DAYS", "7"))
+# 归档任务的执行间隔（秒），0 表示不启用
+TODO_ARCHIVE_INTERVAL = int(os.getenv("TODO_ARCHIVE_INTERVAL", "3600"))
+
+
+class ArchiveService:
+
+    def __init__(self):
+        self.todo_dao = factory.todo_dao()
+
+    def archive_finished_todos(self, older_than_days: int = TODO_ARCHIVE_AFTER_DAYS) -> list[str]:
+        """
+        把已完成超过期限的待办移入 todo_archive.{user_id}，之后它们不再出现在待办列表、agent 上下文与抽取中
+        :return: 发生迁移的用户ID列表
+        """
+        user_ids = self.todo_dao.archive_finished(older_than_days)
+        metrics.incr("todo_archive.runs")
+        metrics.incr("todo_archive.users", len(user_ids))
+        if user_ids:
+            print(f"[ArchiveService] 已归档 {len(user_ids)} 个用户的已完成待办")
+        return user_ids
+
+
+def start_todo_archiver() -> None:
+    """应用启动时调用：周期归档已完成的待办"""
+    try:
+        service = ArchiveService()
+    except Exception as e:
+        print(f"[ArchiveService] 初始化失败，不启用归档: {e}")
+        return
+    run_periodically("todo-archiver", TODO_ARCHIVE_INTERVAL, service.archive_finished_todos)
@@ -1,44 +1,63 @@
-import uuid
-from typing import List, Optional
-from backend.dao.InstructionDao import InstructionDao
-from backend.dao.ProfileDao import ProfileDao
-from backend.dao.ToDoDao import ToDoDao
+from datetime import datetime
+from typing import List, Optional, Union
+from backend.dao import factory
+from backend.dao.ToDoDao import IdempotencyConflict, InvalidCursor
 from backend.agent.models import Instruction, Profile, ToDo
+from backend.service.schemas import (
+    ErrorResponse, InstructionListResponse, ProfileResponse, TodoListResponse,
+    instruction_items, profile_item, todo_items,
+)
+from backend.utils.ids import uuid7, key_from_idempotency
+from backend.utils.change_feed import change_feed
+from backend.utils.etag import namespace_etags
+from backend.utils.single_flight import SingleFlight
+from backend.utils import invalidation
 import traceback
 
+# 进程级共享（CommonService 每个请求实例化一次）：合并同一用户同时到达的相同读取
+_reads = SingleFlight("common_reads")
+
+# 写入参数已由接口层的请求结构（msgspec Struct）校验，领域模型用 model_construct 构建，不再重复校验；
+# 读取直接把数据库行转换为响应结构（见 schemas.py）
+
+
+def _read_key(method: str, kind: str, user_id: str) -> tuple:
+    # 带上命名空间版本戳：写入之后到达的读取不会复用写入之前发起的查询
+    return method, user_id, invalidation.namespace_stamp(kind, user_id)
+
 
 class CommonService:
     
     def __init__(self):
-        self.instruction_dao = InstructionDao()
-        self.profile_dao = ProfileDao()
-        self.todo_dao = ToDoDao()
+        self.instruction_dao = factory.instruction_dao()
+        self.profile_dao = factory.profile_dao()
+        self.todo_dao = factory.todo_dao()
     
     # ==================== Instruction 业务逻辑 ====================
     
-    async def get_instructions(self, user_id: str) -> dict:
+    async def get_instructions(self, user_id: str) -> Union[InstructionListResponse, ErrorResponse]:
         """
         获取用户的所有指令
         """
         try:
-            instructions = await self.instruction_dao.get_by_id(user_id)
-            return {
-                "success": True,
-                "response": [instruction.model_dump() for instruction in instructions]
-            }
+            rows = await _reads.do(
+                _read_key("get_instructions", "instructions", user_id),
+                lambda: self.instruction_dao.get_rows(user_id)
+            )
+            return InstructionListResponse(response=instruction_items(rows))
         except Exception as e:
             traceback.print_exc()
-            return {"error": str(e)}
+            return ErrorResponse(str(e))
     
     async def create_instruction(self, user_id: str, language: str, content: str) -> dict:
         """
         创建新的用户指令
         """
         try:
-            instruction = Instruction(
+            instruction = Instruction.model_construct(
                 language=language,
                 content=content,
-                key=str(uuid.uuid4())
+                key=uuid7()
             )
             success = await self.instruction_dao.create_instruction(user_id, instruction)
             
@@ -55,7 +74,7 @@ class CommonService:
         更新指定的用户指令
         """
         try:
-            instruction = Instruction(
+            instruction = Instruction.model_construct(
                 language=language,
                 content=content,
                 key=key
@@ -87,22 +106,22 @@ class CommonService:
     
     # ==================== Profile 业务逻辑 ====================
     
-    async def get_profile(self, user_id: str) -> dict:
+    async def get_profile(self, user_id: str) -> Union[ProfileResponse, ErrorResponse]:
         """
         获取用户档案
         """
         try:
-            profile = await self.profile_dao.get_by_id(user_id)
-            if profile:
-                return {
-                    "success": True,
-                    "response": profile.model_dump()
-                }
+            row = await _reads.do(
+                _read_key("get_profile", "profile", user_id),
+                lambda: self.profile_dao.get_row(user_id)
+            )
+            if row:
+                return ProfileResponse(response=profile_item(row))
             else:
-                return {"error": "用户档案不存在"}
+                return ErrorResponse("用户档案不存在")
         except Exception as e:
             traceback.print_exc()
-            return {"error": str(e)}
+            return ErrorResponse(str(e))
     
     async def create_profile(self, user_id: str, name: Optional[str] = None, 
                            location: Optional[str] = None, job: Optional[str] = None,
@@ -111,7 +130,7 @@ class CommonService:
         创建用户档案
         """
         try:
-            profile = Profile(
+            profile = Profile.model_construct(
                 name=name,
                 location=location,
                 job=job,
@@ -135,7 +154,7 @@ class CommonService:
         更新用户档案
         """
         try:
-            profile = Profile(
+            profile = Profile.model_construct(
                 name=name,
                 location=location,
                 job=job,
@@ -152,33 +171,59 @@ class CommonService:
             traceback.print_exc()
             return {"error": str(e)}
     
+    async def patch_profile(self, user_id: str, fields: dict, interests_append: List[str] = None,
+                            connections_append: List[str] = None) -> dict:
+        """
+        局部更新用户档案，只返回变更的字段
+        """
+        try:
+            changed = await self.profile_dao.patch_profile(
+                user_id,
+                fields,
+                {"interests": interests_append or [], "connections": connections_append or []}
+            )
+            if changed is None:
+                return {"error": "用户档案不存在或更新失败"}
+            return {"success": True, "response": changed}
+        except Exception as e:
+            traceback.print_exc()
+            return {"error": str(e)}
+    
     # ==================== Todo 业务逻辑 ====================
     
-    async def get_todos(self, user_id: str) -> dict:
+    async def get_todos(self, user_id: str) -> Union[TodoListResponse, ErrorResponse]:
         """
         获取用户的所有待办事项
         """
         try:
-            todos = await self.todo_dao.get_by_id(user_id)
-            return {
-                "success": True,
-                "response": [todo.model_dump() for todo in todos]
-            }
+            rows = await _reads.do(
+                _read_key("get_todos", "todo", user_id),
+                lambda: self.todo_dao.get_rows(user_id)
+            )
+            return TodoListResponse(response=todo_items(rows))
         except Exception as e:
             traceback.print_exc()
-            return {"error": str(e)}
+            return ErrorResponse(str(e))
     
     async def create_todo(self, user_id: str, task: str, time_to_complete: Optional[int] = None,
                          deadline: Optional[str] = None, solutions: List[str] = None,
-                         status: str = "not started", planned_edits: List[str] = None) -> dict:
+                         status: str = "not started", planned_edits: List[str] = None,
+                         idempotency_key: Optional[str] = None) -> dict:
         """
         创建新的待办事项
+        提供 idempotency_key 时 key 由其确定性派生，客户端重试不会产生重复记录
+        :raises IdempotencyConflict: 幂等键已用于内容不同的请求（由接口层返回 409）
         """
         try:
-            todo = ToDo(
+            if idempotency_key:
+                key = key_from_idempotency(f"todo:{user_id}", idempotency_key)
+            else:
+                key = uuid7()
+            todo = ToDo.model_construct(
+                key=key,
                 task=task,
                 time_to_complete=time_to_complete,
-                deadline=deadline,
+                deadline=datetime.fromisoformat(deadline) if deadline else None,
                 solutions=solutions or [],
                 status=status,
                 planned_edits=planned_edits or []
@@ -186,9 +231,11 @@ class CommonService:
             success = await self.todo_dao.create_todo(user_id, todo)
             
             if success:
-                return {"success": True, "message": "待办事项创建成功"}
+                return {"success": True, "message": "待办事项创建成功", "key": key}
             else:
                 return {"error": "待办事项创建失败"}
+        except IdempotencyConflict:
+            raise
         except Exception as e:
             traceback.print_exc()
             return {"error": str(e)}
@@ -201,11 +248,11 @@ class CommonService:
         更新指定的待办事项
         """
         try:
-            todo = ToDo(
+            todo = ToDo.model_construct(
                 key=key,
                 task=task,
                 time_to_complete=time_to_complete,
-                deadline=deadline,
+                deadline=datetime.fromisoformat(deadline) if deadline else None,
                 solutions=solutions or [],
                 status=status,
                 planned_edits=planned_edits or []
@@ -220,6 +267,33 @@ class CommonService:
             traceback.print_exc()
             return {"error": str(e)}
     
+    async def patch_todo(self, user_id: str, key: str, fields: dict, solutions_append: List[str] = None) -> dict:
+        """
+        局部更新指定的待办事项（如切换状态），只返回变更的字段
+        """
+        try:
+            changed = await self.todo_dao.patch_by_key(user_id, key, fields, solutions_append or [])
+            if changed is None:
+                return {"error": "待办事项不存在或更新失败"}
+            return {"success": True, "response": changed}
+        except Exception as e:
+            traceback.print_exc()
+            return {"error": str(e)}
+    
+    async def get_todo_history(self, user_id: str, limit: int = 20, cursor: Optional[str] = None) -> dict:
+        """
+        分页获取已归档的历史待办
+        :raises InvalidCursor: 游标无法解析（由接口层返回 400）
+        """
+        try:
+            todos, next_cursor = await self.todo_dao.get_history(user_id, limit, cursor)
+            return {"success": True, "response": todos, "next_cursor": next_cursor}
+        except InvalidCursor:
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            return {"error": str(e)}
+    
     async def delete_todo(self, user_id: str, key: str) -> dict:
         """
         删除指定的待办事项
@@ -233,4 +307,31 @@ class CommonService:
                 return {"error": "待办事项删除失败"}
         except Exception as e:
             traceback.print_exc()
-            return {"error": str(e)}
\ No newline at end of file
+            return {"error": str(e)}
+    
+    # ==================== 条件请求 ====================
+    
+    async def get_etag(self, kind: str, user_id: str) -> str:
+        """
+        获取用户某类记忆当前的 ETag，用于 If-None-Match 条件请求
+        :param kind: profile / todo / instructions
+        :param user_id: 用户ID
+        """
+        dao = {"profile": self.profile_dao, "todo": self.todo_dao, "instructions": self.instruction_dao}[kind]
+        return await namespace_etags.get(
+            kind,
+            user_id,
+            lambda: _reads.do(_read_key("get_etag", kind, user_id), lambda: dao.get_namespace_version(kind, user_id))
+        )
+    
+    # ==================== 变更订阅 ====================
+    
+    async def change_events(self, user_id: str, kinds: Optional[set[str]] = None):
+        """
+        订阅用户记忆（todo / profile / instructions）的变更增量，供 SSE 推送
+        :param user_id: 用户ID
+        :param kinds: 只关心的类型，None 表示全部
+        :return: 异步生成器，心跳时产出 None
+        """
+        async for event in change_feed.subscribe(user_id, kinds):
+            yield event
@@ -0,0 +1,99 @@
+# schemas.py
+# 读取接口的响应结构（msgspec Struct）：数据库行一次转换为 Struct，由 Litestar 原生编码，
+# 不再经过 pydantic 模型校验、model_dump 生成中间字典、再由框架重新序列化
+
+from datetime import datetime
+from typing import Any, Literal, Optional
+
+import msgspec
+
+_STR_LIST = msgspec.json.Decoder(list[str])
+
+
+class TodoItem(msgspec.Struct, kw_only=True):
+    """待办事项，字段与顺序同 agent.models.ToDo"""
+    task: str
+    time_to_complete: Optional[int] = None
+    deadline: Optional[datetime] = None
+    solutions: list[str] = []
+    status: Literal["not started", "in progress", "done", "archived"] = "not started"
+    planned_edits: Optional[list[str]] = []
+    key: str
+
+
+class ProfileItem(msgspec.Struct, kw_only=True):
+    """用户档案，字段与顺序同 agent.models.Profile"""
+    name: Optional[str] = None
+    location: Optional[str] = None
+    job: Optional[str] = None
+    connections: list[str] = []
+    interests: list[str] = []
+
+
+class InstructionItem(msgspec.Struct, kw_only=True):
+    """用户偏好说明，字段与顺序同 agent.models.Instruction"""
+    language: str
+    content: str
+    key: str
+
+
+# 读取接口的响应信封：成功时为 {"success": true, "response": ...}，失败时为 {"error": "..."}
+
+class TodoListResponse(msgspec.Struct, kw_only=True):
+    success: bool = True
+    response: list[TodoItem]
+
+
+class ProfileResponse(msgspec.Struct, kw_only=True):
+    success: bool = True
+    response: ProfileItem
+
+
+class InstructionListResponse(msgspec.Struct, kw_only=True):
+    success: bool = True
+    response: list[InstructionItem]
+
+
+class ErrorResponse(msgspec.Struct):
+    error: str
+
+
+def _json_list(value: Any) -> Any:
+    # 行中的列表字段是 JSON 文本（value ->> 'x'）；与 from_dict 一致，解析失败视为空列表
+    if isinstance(value, str):
+        try:
+            return _STR_LIST.decode(value)
+        except msgspec.DecodeError:
+            return []
+    return value
+
+
+def _deadline(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return value
+
+
+def todo_items(rows: list[dict]) -> list[TodoItem]:
+    """ToDoDao.get_rows 的结果转换为响应结构；time_to_complete 等文本字段按类型宽松转换"""
+    return msgspec.convert([{
+        **row,
+        "solutions": _json_list(row.get("solutions")) or [],
+        "planned_edits": _json_list(row.get("planned_edits")),
+        "deadline": _deadline(row.get("deadline")),
+    } for row in rows], list[TodoItem], strict=False)
+
+
+def profile_item(row: dict) -> ProfileItem:
+    return msgspec.convert({
+        **row,
+        "connections": _json_list(row.get("connections")) or [],
+        "interests": _json_list(row.get("interests")) or [],
+    }, ProfileItem, strict=False)
+
+
+def instruction_items(rows: list[dict]) -> list[InstructionItem]:
+    return msgspec.convert(rows, list[InstructionItem], strict=False)
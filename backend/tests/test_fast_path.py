@@ -0,0 +1,82 @@
+from datetime import datetime
+
+from langgraph.store.base import Item
+
+from backend.agent.fast_path import Command, match_todo, parse_command
+
+
+def _item(key: str, task: str) -> Item:
+    now = datetime.now()
+    return Item(value={"task": task}, key=key, namespace=("todo", "1"), created_at=now, updated_at=now)
+
+
+def main():
+    # 测试能识别的简单指令
+    print("=== 测试 parse_command 命中 ===")
+    positives = {
+        "mark the report as done": Command("status", "report", "done"),
+        "complete buy milk": Command("status", "buy milk", "done"),
+        "把报告标记为已完成": Command("status", "报告", "done"),
+        "delete buy milk": Command("delete", "buy milk"),
+        "删除买牛奶": Command("delete", "买牛奶"),
+        "rename report to Q3 report": Command("rename", "report", "Q3 report"),
+        "report is due tomorrow": Command("deadline", "report", "tomorrow"),
+        "把报告的截止时间改为明天": Command("deadline", "报告", "明天"),
+    }
+    for text, expected in positives.items():
+        command = parse_command(text)
+        print(f"{text!r} -> {command}")
+        assert command == expected, f"{text!r}: 期望 {expected}，实际 {command}"
+
+    # 疑问句、批量指令、叙述句和新建待办都应交给完整流程
+    print("\n=== 测试 parse_command 不命中 ===")
+    negatives = [
+        "what is due tomorrow",
+        "when is the report due?",
+        "is the report done?",
+        "remove all my done tasks",
+        "delete every task",
+        "删除所有已完成的任务",
+        "把全部任务标记为已完成",
+        "报告完成了吗",
+        "start learning piano next week",
+        "我今天终于把报告做完了",
+        # 代词 / 限定词 / 过短的目标
+        "delete it",
+        "mark it done",
+        "mark this as done",
+        "remove that task",
+        "delete ll",
+        "删除它",
+        "删除这个任务",
+        "把那个标记为已完成",
+        "删除买",
+    ]
+    for text in negatives:
+        command = parse_command(text)
+        print(f"{text!r} -> {command}")
+        assert command is None, f"{text!r}: 期望 None，实际 {command}"
+
+    # 测试目标匹配：完全相同 / 唯一包含 / 有歧义 / 不反向包含
+    print("\n=== 测试 match_todo ===")
+    items = [_item("a", "写季度报告"), _item("b", "买牛奶"), _item("c", "买面包")]
+    assert match_todo("买牛奶", items).key == "b"
+    assert match_todo("季度报告", items).key == "a"
+    assert match_todo("买", items) is None, "同时包含于两条待办，应视为歧义"
+    assert match_todo("我今天终于写季度报告", items) is None, "目标包含待办名称不应匹配"
+    assert match_todo("learning piano next week", [_item("d", "learning piano")]) is None
+    assert match_todo("买牛奶", []) is None
+
+    # 按词元边界匹配："write" 含有 "it"、"call" 含有 "ll" 都不算命中；代词和过短的目标不匹配
+    items = [_item("w", "write quarterly report"), _item("m", "call mom"), _item("r", "写季度报告")]
+    for target in ["it", "all", "ll", "al", "rite", "this", "它", "这个", "报"]:
+        assert match_todo(target, items) is None, f"{target!r} 不应匹配"
+    assert match_todo("quarterly report", items).key == "w"
+    assert match_todo("call", items).key == "m"
+    assert match_todo("季度报告", items).key == "r"
+    assert match_todo("reports", [_item("p", "report"), _item("m", "call mom")]) is None, "只有字符片段相近、没有共同词时不匹配"
+    print("match_todo: 通过")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+import asyncio
+import json
+from backend.dao.MemoryJobDao import MemoryJobDao
+
+
+async def main():
+    dao = MemoryJobDao()
+    dao.ensure_table()
+
+    # 测试提交任务
+    print("=== 测试 enqueue ===")
+    payload = json.dumps({"thread_id": "t1", "messages": []})
+    job = dao.enqueue('t1:call_1:todo', '1', 'todo', payload)
+    print(f"提交结果: {job}")
+
+    # 相同幂等键重复提交，应返回同一个任务
+    print("\n=== 测试幂等键 ===")
+    duplicate = dao.enqueue('t1:call_1:todo', '1', 'todo', payload)
+    print(f"重复提交结果: {duplicate}, 是否同一任务: {duplicate['id'] == job['id']}")
+
+    # 测试领取任务，第二次领取应失败
+    print("\n=== 测试 claim ===")
+    claimed = dao.claim(job['id'])
+    print(f"第一次领取: {claimed is not None}")
+    print(f"第二次领取: {dao.claim(job['id']) is not None}")
+
+    # 测试完成任务
+    print("\n=== 测试 mark_done ===")
+    print(f"完成前未完成任务数: {dao.open_count('1')}")
+    dao.mark_done(job['id'])
+    print(f"完成后未完成任务数: {dao.open_count('1')}")
+    print(f"完成事件: {dao.finished_since('1', 0)}")
+    print(f"恢复的任务: {dao.recover_open_jobs(600)}")
+    jobs = await dao.get_by_id('1')
+    for item in jobs:
+        print(f"任务: {item}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import tempfile
+
+# 单机模式需在导入 DAO 之前选择存储后端
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ.setdefault("SQLITE_PATH", os.path.join(tempfile.mkdtemp(), "graphdo.db"))
+
+from langgraph.store.base import PutOp
+from langgraph.store.sqlite import SqliteStore
+from backend.agent.models import Instruction, Profile, ToDo
+from backend.dao import factory
+from backend.dao.ToDoDao import IdempotencyConflict, InvalidCursor
+from backend.utils.ids import uuid7
+from backend.utils.sqlite_db import get_sqlite_conn, get_sqlite_pool
+
+
+async def main():
+    # agent 通过 SqliteStore 写入（value 为 orjson 写入的 BLOB），DAO 应能读出
+    store = SqliteStore(get_sqlite_conn("store"))
+    store.setup()
+    store.batch([PutOp(("todo", "1"), "agent_key", {"task": "写周报", "status": "done", "solutions": ["列提纲"]})])
+
+    todo_dao = factory.todo_dao()
+    profile_dao = factory.profile_dao()
+    print(f"DAO 类型: {type(todo_dao).__name__}, {type(profile_dao).__name__}")
+    with get_sqlite_pool().connection() as conn:
+        print(f"journal_mode: {conn.execute('PRAGMA journal_mode;').fetchone()}")
+
+    print("\n=== 测试 get_by_id ===")
+    for todo in await todo_dao.get_by_id('1'):
+        print(f"待办事项: {todo}")
+
+    print("\n=== 测试 create_todo / patch_by_key ===")
+    key = uuid7()
+    todo = ToDo(key=key, task='完成项目文档', status='not started', time_to_complete=60)
+    print(f"创建结果: {await todo_dao.create_todo('1', todo)}")
+    print(f"相同内容重放: {await todo_dao.create_todo('1', todo)}")
+    try:
+        await todo_dao.create_todo('1', todo.model_copy(update={"task": "另一项任务"}))
+        print("同 key 不同内容: 成功（不符合预期）")
+    except IdempotencyConflict as e:
+        print(f"同 key 不同内容: {e}")
+    version_before = await todo_dao.get_namespace_version('todo', '1')
+    changed = await todo_dao.patch_by_key('1', key, {"status": "in progress"}, solutions_append=["先写大纲"])
+    print(f"局部更新返回: {changed}")
+    print(f"版本变化: {version_before} -> {await todo_dao.get_namespace_version('todo', '1')}")
+    print(f"不存在的 key: {await todo_dao.patch_by_key('1', 'missing', {'status': 'done'})}")
+    print(f"store 读取: {store.get(('todo', '1'), key).value}")
+
+    print("\n=== 测试 archive_finished / get_history ===")
+    print(f"归档 0 天前完成的待办，涉及用户: {todo_dao.archive_finished(-1)}")
+    print(f"剩余待办: {[t.task for t in await todo_dao.get_by_id('1')]}")
+    history, cursor = await todo_dao.get_history('1', limit=10)
+    print(f"历史待办: {history}, 游标: {cursor}")
+    store.batch([PutOp(("todo_archive", "1"), f"archived_{i}", {"task": f"归档 {i}", "status": "done", "solutions": []}) for i in range(3)])
+    first, cursor = await todo_dao.get_history('1', limit=2)
+    rest, last_cursor = await todo_dao.get_history('1', limit=2, cursor=cursor)
+    print(f"分页: {[t['task'] for t in first]} / {[t['task'] for t in rest]}, 游标: {cursor}, {last_cursor}")
+    try:
+        await todo_dao.get_history('1', cursor="2025-01-01T00:00:00 00:00|x")
+        print("无效游标: 未报错（不符合预期）")
+    except InvalidCursor as e:
+        print(f"无效游标: {e}")
+
+    print("\n=== 测试 create_instruction（合并到规范记录） ===")
+    instruction_dao = factory.instruction_dao()
+    await instruction_dao.create_instruction('1', Instruction(language="zh", content="- 周报用中文", key="a"))
+    await instruction_dao.create_instruction('1', Instruction(language="zh", content="- 日报用中文\n- 周报用中文。", key="b"))
+    print(f"偏好说明: {await instruction_dao.get_rows('1')}")
+
+    print("\n=== 测试 profile ===")
+    await profile_dao.create_profile('1', Profile(name="张三", interests=["阅读"]))
+    print(f"局部更新返回: {await profile_dao.patch_profile('1', {'job': '工程师'}, {'interests': ['游泳']})}")
+    print(f"档案: {await profile_dao.get_by_id('1')}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+import os
+import tempfile
+
+from langgraph.store.base import PutOp
+from langgraph.store.memory import InMemoryStore
+
+from backend.agent.tiered_store import TieredStore, _Journal
+
+
+class FlakyStore(InMemoryStore):
+    """写入在 fail_puts 次内抛错，模拟数据库暂时不可用"""
+
+    def __init__(self, fail_puts: int = 0):
+        super().__init__()
+        self.fail_puts = fail_puts
+
+    def batch(self, ops):
+        ops = list(ops)
+        if self.fail_puts > 0 and any(isinstance(op, PutOp) for op in ops):
+            self.fail_puts -= 1
+            raise ConnectionError("database unavailable")
+        return super().batch(ops)
+
+
+def _store(backend, journal_path: str, **kwargs) -> TieredStore:
+    store = TieredStore(backend, journal_path=journal_path, flush_interval=3600, **kwargs)
+    # 停掉后台刷写线程，由测试显式调用 flush
+    store._stopped.set()
+    store._wakeup.set()
+    store._thread.join()
+    return store
+
+
+def _crash(store: TieredStore) -> None:
+    """模拟进程崩溃：不刷写，只释放文件与槽位锁（进程退出时由内核释放）"""
+    store._journal.close()
+
+
+def main():
+    directory = tempfile.mkdtemp(prefix="tiered-store-")
+    journal = os.path.join(directory, "journal.log")
+    namespace = ("todo", "1")
+
+    # 测试崩溃后回放：未落库的写入在下一个进程启动时从日志恢复并刷到后端
+    print("=== 测试崩溃后回放日志 ===")
+    backend = FlakyStore()
+    store = _store(backend, journal)
+    store.put(namespace, "a", {"task": "写周报"})
+    store.put(namespace, "b", {"task": "买牛奶"})
+    store.delete(namespace, "b")
+    _crash(store)
+    print(f"崩溃前后端: {backend.get(namespace, 'a')}")
+    assert backend.get(namespace, "a") is None
+
+    store = _store(backend, journal)
+    assert store.get(namespace, "a").value == {"task": "写周报"}
+    assert store.get(namespace, "b") is None
+    store.flush()
+    assert backend.get(namespace, "a").value == {"task": "写周报"}
+    assert backend.get(namespace, "b") is None
+    assert _Journal.read(store._journal.path) == []
+    print(f"回放后后端: {backend.get(namespace, 'a').value}")
+    print("回放: 通过")
+
+    # 测试另一个进程启动时不会接管仍在使用的日志（重写日志后锁仍然有效）
+    print("\n=== 测试存活进程的日志不被接管 ===")
+    backend.fail_puts = 1
+    store.put(namespace, "c", {"task": "交房租"})
+    try:
+        store.flush()
+    except ConnectionError:
+        pass
+    other = _store(InMemoryStore(), journal)
+    print(f"第二个进程的日志: {os.path.basename(other._journal.path)}")
+    assert other._journal.path != store._journal.path
+    assert "c" not in {k[1] for k in other._dirty}
+    store.put(namespace, "d", {"task": "订机票"})
+    assert {r["key"] for r in _Journal.read(store._journal.path)} == {"c", "d"}
+    other.close()
+    print("日志占用: 通过")
+
+    # 测试刷写失败后重试：失败时条目保持未落库并留在日志中，后端恢复后刷写成功
+    print("\n=== 测试刷写失败后重试 ===")
+    backend.fail_puts = 2
+    for attempt in range(2):
+        try:
+            store.flush()
+            raise AssertionError("后端不可用时刷写应抛错")
+        except ConnectionError as e:
+            print(f"第 {attempt + 1} 次刷写失败: {e}，未落库 {len(store._dirty)} 条")
+    assert {k[1] for k in store._dirty} == {"c", "d"}
+    assert len(_Journal.read(store._journal.path)) == 2
+    print(f"恢复后刷写条数: {store.flush()}")
+    assert not store._dirty
+    assert backend.get(namespace, "d").value == {"task": "订机票"}
+    assert _Journal.read(store._journal.path) == []
+    store.close()
+    print("重试: 通过")
+
+    # 测试 LRU 淘汰：超出上限时只淘汰已落库的条目，未落库的永不淘汰
+    print("\n=== 测试淘汰不丢未落库的写入 ===")
+    backend = FlakyStore(fail_puts=1)
+    store = _store(backend, os.path.join(directory, "lru.log"), max_entries=2)
+    for i in range(5):
+        store.put(namespace, f"k{i}", {"task": f"任务 {i}"})
+    try:
+        store.flush()
+    except ConnectionError:
+        pass
+    store._evict()
+    print(f"刷写失败后内存层条数: {len(store._entries)}")
+    assert len(store._entries) == 5
+    assert all(store.get(namespace, f"k{i}").value == {"task": f"任务 {i}"} for i in range(5))
+    store.flush()
+    print(f"落库后内存层条数: {len(store._entries)}")
+    assert len(store._entries) <= 2
+    assert all(store.get(namespace, f"k{i}").value == {"task": f"任务 {i}"} for i in range(5))
+    store.close()
+    print("淘汰: 通过")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
 import asyncio
 from datetime import datetime
 from backend.agent.models import ToDo
-from backend.dao.ToDoDao import ToDoDao
+from backend.dao.ToDoDao import IdempotencyConflict, ToDoDao
+from backend.utils.ids import uuid7
 
 
 async def main():
@@ -17,7 +18,9 @@ async def main():
     # 测试创建待办事项
     # {"task": "Finish the assignment and write the paper for the class by next Wednesday", "status": "not started", "deadline": "2025-06-25T23:59:59", "solutions": ["Complete the assignment for the class", "Write the paper for the class"], "planned_edits": [], "time_to_complete": 300}
     print("\n=== 测试 create_todo ===")
+    key = uuid7()
     new_todo = ToDo(
+        key=key,
         task="完成项目文档",
         status="not started",
         deadline=datetime(year=2021, month=1, day=1),
@@ -27,10 +30,23 @@ async def main():
     )
     success = await dao.create_todo('1', new_todo)
     print(f"创建结果: {success}")
+
+    # 相同 key 重复创建（模拟客户端重试），应幂等成功且不产生重复记录
+    print("\n=== 测试重复创建 ===")
+    success = await dao.create_todo('1', new_todo)
+    print(f"重复创建结果: {success}")
+    todos = await dao.get_by_id('1')
+    print(f"同 key 记录数: {len([t for t in todos if t.key == key])}")
+    try:
+        await dao.create_todo('1', new_todo.model_copy(update={"task": "另一项任务"}))
+        print("同 key 不同内容: 成功（不符合预期）")
+    except IdempotencyConflict as e:
+        print(f"同 key 不同内容: {e}")
     
     # 测试按key更新待办事项
     print("\n=== 测试 update_by_key ===")
     updated_todo = ToDo(
+        key=key,
         task="完成项目文档",
         status="in progress",
         deadline=datetime(year=2021, month=3, day=2),
@@ -38,10 +54,31 @@ async def main():
         planned_edits=["添加API文档和用户指南"],
         time_to_complete=300
     )
-    key = "1_完成项目文档"
     success = await dao.update_by_key('1', key, updated_todo)
     print(f"更新结果: {success}")
     
+    # 测试局部更新：只切换状态并追加 solution
+    print("\n=== 测试 patch_by_key ===")
+    version_before = await dao.get_namespace_version('todo', '1')
+    changed = await dao.patch_by_key('1', key, {"status": "done"}, ["提交到仓库"])
+    print(f"变更字段: {changed}")
+    
+    # 写入后命名空间版本（ETag 来源）应变化
+    print("\n=== 测试 get_namespace_version ===")
+    version_after = await dao.get_namespace_version('todo', '1')
+    print(f"版本: {version_before} -> {version_after}, 已变化: {version_before != version_after}")
+    
+    # 测试归档：older_than_days=0 时刚完成的待办也会被移入冷前缀
+    print("\n=== 测试 archive_finished ===")
+    archived_users = dao.archive_finished(0)
+    print(f"发生归档的用户: {archived_users}")
+    todos = await dao.get_by_id('1')
+    print(f"已完成待办仍在列表中: {any(t.key == key for t in todos)}")
+
+    print("\n=== 测试 get_history ===")
+    history, next_cursor = await dao.get_history('1', limit=10)
+    print(f"历史待办数量: {len(history)}, next_cursor: {next_cursor}")
+    
     # 测试按key删除待办事项
     print("\n=== 测试 delete_by_key ===")
     success = await dao.delete_by_key('1', key)
@@ -0,0 +1,31 @@
+import asyncio
+from backend.dao.TurnDao import TurnDao, TurnLockTimeout
+
+
+async def main():
+    dao = TurnDao()
+    dao.ensure_table()
+
+    # 测试记录与查询最近轮次
+    print("=== 测试 save / get_recent ===")
+    dao.save('hash_1', '1', '好的，已为你添加待办')
+    print(f"窗口内查询: {dao.get_recent('hash_1', 10)}")
+    print(f"不存在的消息: {dao.get_recent('hash_2', 10)}")
+
+    # 测试用户级锁：持有期间另一个连接获取同一把锁应超时
+    print("\n=== 测试 user_lock ===")
+    with dao.user_lock('1', timeout=1):
+        try:
+            with dao.user_lock('1', timeout=0.5):
+                print("第二次获取: 成功（不符合预期）")
+        except TurnLockTimeout as e:
+            print(f"第二次获取超时: {e}")
+    with dao.user_lock('1', timeout=1):
+        print("释放后再次获取: 成功")
+
+    turns = await dao.get_by_id('1')
+    for item in turns:
+        print(f"轮次: {item}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import threading
+
+from backend.utils.pg_listener import get_pg_listener
+from backend.utils.metrics import metrics
+
+CHANNEL = "graphdo_store_changes"
+
+# store 表行级触发器：todo / profile / instructions 前缀的写入都会 NOTIFY 一条增量
+# NOTIFY 的 payload 上限约 8000 字节，超长时去掉 value，由客户端自行拉取
+_TRIGGER_SQL = f"""
+    CREATE OR REPLACE FUNCTION graphdo_notify_store_change() RETURNS trigger AS $$
+    DECLARE
+        rec RECORD;
+        kind TEXT;
+        payload JSONB;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN rec := OLD; ELSE rec := NEW; END IF;
+        kind := split_part(rec.prefix, '.', 1);
+        IF kind NOT IN ('todo', 'profile', 'instructions') THEN
+            RETURN NULL;
+        END IF;
+
+        payload := jsonb_build_object(
+            'op', lower(TG_OP),
+            'kind', kind,
+            'user_id', substr(rec.prefix, length(kind) + 2),
+            'key', rec.key
+        );
+        IF TG_OP <> 'DELETE' THEN
+            payload := payload || jsonb_build_object('value', rec.value);
+            IF octet_length(payload::text) > 7000 THEN
+                payload := (payload - 'value') || '{{"truncated": true}}'::jsonb;
+            END IF;
+        END IF;
+
+        PERFORM pg_notify('{CHANNEL}', payload::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE TRIGGER graphdo_store_changes
+        AFTER INSERT OR UPDATE OR DELETE ON store
+        FOR EACH ROW EXECUTE FUNCTION graphdo_notify_store_change();
+"""
+
+
+_trigger_installed = False
+
+
+def install_change_feed_trigger(pool) -> bool:
+    """在 store 表上安装变更通知触发器（幂等）；store 表尚未创建时跳过，待 agent 建表后再安装"""
+    global _trigger_installed
+    if _trigger_installed:
+        return True
+    with pool.connection() as conn:
+        row = conn.execute("SELECT to_regclass('store') IS NOT NULL AS exists;").fetchone()
+        if not row["exists"]:
+            print("[ChangeFeed] store 表不存在，暂不安装触发器")
+            return False
+        conn.execute(_TRIGGER_SQL)
+    _trigger_installed = True
+    print("[ChangeFeed] 变更通知触发器已安装")
+    return True
+
+
+def on_startup_change_feed() -> None:
+    """应用启动时安装触发器并建立共享 LISTEN 连接"""
+    from backend.utils.pg_pool import get_pg_pool
+    try:
+        install_change_feed_trigger(get_pg_pool())
+        get_pg_listener()
+    except Exception as e:
+        print(f"[ChangeFeed] 初始化失败: {e}")
+
+
+class ChangeFeedHub:
+    """
+    把共享 LISTEN 连接收到的变更按用户扇出给 SSE 订阅者
+    每个订阅者一个有界 asyncio.Queue；消费过慢导致队列满时丢弃增量并推送 resync，让客户端整体重拉
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers: dict[str, set[tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._started = False
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        get_pg_listener().subscribe(CHANNEL, self.publish)
+
+    def publish(self, payload: str) -> None:
+        """LISTEN 线程回调"""
+        try:
+            event = json.loads(payload)
+        except json.JSONDecodeError:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers.get(event.get("user_id"), ()))
+        metrics.incr("change_feed.notifications")
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._offer, queue, event)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, event: dict) -> None:
+        if queue.full():
+            metrics.incr("change_feed.dropped")
+            while not queue.empty():
+                queue.get_nowait()
+            event = {"op": "resync", "kind": event.get("kind"), "user_id": event.get("user_id")}
+        queue.put_nowait(event)
+
+    async def subscribe(self, user_id: str, kinds: set[str] | None = None, heartbeat: float = 15.0):
+        """
+        订阅用户的变更增量（异步生成器），无变更时每 heartbeat 秒产出 None 作为心跳
+        :param user_id: 用户id
+        :param kinds: 只关心的命名空间类型，None 表示全部
+        """
+        self._ensure_started()
+        entry = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.queue_size))
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(entry)
+        metrics.incr("change_feed.subscriptions")
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(entry[1].get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if kinds is None or event.get("kind") in kinds:
+                    yield event
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(user_id, set())
+                subscribers.discard(entry)
+                if not subscribers:
+                    self._subscribers.pop(user_id, None)
+
+
+change_feed = ChangeFeedHub()
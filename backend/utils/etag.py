@@ -0,0 +1,58 @@
+import hashlib
+import threading
+from typing import Awaitable, Callable, Optional
+
+from backend.utils import invalidation
+from backend.utils.metrics import metrics
+
+
+def make_etag(kind: str, user_id: str, version: str) -> str:
+    digest = hashlib.sha1(f"{kind}\x00{user_id}\x00{version}".encode("utf-8")).hexdigest()[:20]
+    return f'"{kind}-{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 可能是 *、逗号分隔的多个值，或带 W/ 前缀的弱校验值"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class NamespaceEtags:
+    """
+    (kind, user_id) -> ETag 的进程内缓存
+    ETag 由数据库中命名空间的版本（max(updated_at) + 记录数）计算；
+    失效广播在线时，用本地命名空间版本戳判断缓存的 ETag 是否仍然有效，命中时连聚合查询也省掉；
+    广播不在线时其他 worker 的写入无法感知，每次都回源数据库
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._etags: dict[tuple[str, str], tuple[tuple, str]] = {}
+
+    async def get(self, kind: str, user_id: str, load_version: Callable[[], Awaitable[str]]) -> str:
+        stamp = invalidation.namespace_stamp(kind, user_id)
+        if invalidation.is_coherent():
+            with self._lock:
+                entry = self._etags.get((kind, user_id))
+            if entry is not None and entry[0] == stamp:
+                metrics.incr("etag.cache_hits")
+                return entry[1]
+
+        metrics.incr("etag.cache_misses")
+        etag = make_etag(kind, user_id, await load_version())
+        with self._lock:
+            self._etags[(kind, user_id)] = (stamp, etag)
+        return etag
+
+    def invalidate(self, kind: str, user_id: str) -> None:
+        with self._lock:
+            self._etags.pop((kind, user_id), None)
+
+
+namespace_etags = NamespaceEtags()
+invalidation.add_listener(lambda kind, user_id, version: namespace_etags.invalidate(kind, user_id))
@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from backend.utils.metrics import metrics
+from backend.utils.periodic import run_periodically
+from backend.utils.storage import STORAGE_BACKEND, is_postgres, is_sqlite
+
+load_dotenv()
+
+# 启动预热：建立连接池的最小连接、prepare 热点查询、构建 agent 图、预热模型服务连接
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "30"))
+WARMUP_PRIME_LLM = os.getenv("WARMUP_PRIME_LLM", "1") == "1"
+# 后台连接健康检查间隔（秒）：检查空闲连接并替换已断开的连接
+DB_POOL_CHECK_INTERVAL = float(os.getenv("DB_POOL_CHECK_INTERVAL", "30"))
+
+# /readyz 要求就绪的组件；llm 只做报告（模型服务暂时不可达不影响 CRUD 接口）
+REQUIRED_COMPONENTS = ("database", "agent")
+WARMUP_USER = "__warmup__"
+
+_lock = threading.Lock()
+_status: dict[str, dict] = {}
+_started_at = time.monotonic()
+_warmup_started = False
+
+
+def set_status(component: str, ready: bool, detail: str = "") -> None:
+    with _lock:
+        _status[component] = {"ready": ready, "detail": detail}
+    metrics.gauge(f"health.{component}.ready", 1 if ready else 0)
+
+
+def readiness() -> tuple[bool, dict]:
+    """就绪状态：所有必需组件都已就绪时为 True"""
+    with _lock:
+        components = {name: dict(status) for name, status in _status.items()}
+    ready = all(components.get(name, {}).get("ready") for name in REQUIRED_COMPONENTS)
+    return ready, {"ready": ready, "storage": STORAGE_BACKEND, "components": components}
+
+
+def liveness() -> dict:
+    """存活状态：进程能响应即为存活，附带连接池统计"""
+    result = {"status": "ok", "uptime_seconds": round(time.monotonic() - _started_at, 1)}
+    if is_postgres():
+        from backend.utils.pg_pool import _pool
+        if _pool is not None:
+            stats = _pool.get_stats()
+            result["pool"] = {k: stats.get(k, 0) for k in ("pool_size", "pool_available", "requests_waiting")}
+    return result
+
+
+def _hot_statements() -> list[str]:
+    from backend.dao.BaseDao import BaseDao
+    from backend.dao.InstructionDao import InstructionDao
+    from backend.dao.ProfileDao import ProfileDao
+    from backend.dao.ToDoDao import ToDoDao
+    return [ToDoDao.GET_BY_ID_SQL, ProfileDao.GET_BY_ID_SQL, InstructionDao.GET_BY_ID_SQL, BaseDao.NAMESPACE_VERSION_SQL]
+
+
+def prepare_hot_statements(pool) -> int:
+    """
+    同时借出 min_size 个连接，在每个连接上 prepare 热点查询；之后相同文本的查询直接使用服务端预编译语句
+    :return: 预编译的连接数
+    """
+    connections = []
+    try:
+        for _ in range(pool.min_size):
+            connections.append(pool.getconn(timeout=WARMUP_TIMEOUT))
+        statements = _hot_statements()
+        for conn in connections:
+            for sql in statements:
+                conn.execute(sql, (f"warmup.{WARMUP_USER}",), prepare=True)
+        return len(connections)
+    finally:
+        for conn in connections:
+            pool.putconn(conn)
+
+
+def warm_database() -> None:
+    if is_postgres():
+        from backend.utils.pg_pool import get_replica_pool, init_pg_pool
+        pool = init_pg_pool()
+        pool.wait(timeout=WARMUP_TIMEOUT)
+        replica = get_replica_pool()
+        if replica is not None:
+            replica.wait(timeout=WARMUP_TIMEOUT)
+        set_status("database", True, f"{pool.get_stats().get('pool_size', 0)} 个连接已建立")
+    elif is_sqlite():
+        from backend.utils.sqlite_db import get_sqlite_pool
+        with get_sqlite_pool().connection() as conn:
+            conn.execute("SELECT 1;")
+        set_status("database", True, "sqlite")
+    else:
+        set_status("database", True, "memory")
+
+
+def warm_statements() -> None:
+    if not is_postgres():
+        return
+    from backend.utils.pg_pool import get_pg_pool, get_replica_pool
+    try:
+        count = prepare_hot_statements(get_pg_pool())
+        replica = get_replica_pool()
+        if replica is not None:
+            prepare_hot_statements(replica)
+        print(f"[Warmup] 已在 {count} 个连接上预编译热点查询")
+    except Exception as e:
+        print(f"[Warmup] 预编译热点查询失败: {e}")
+
+
+def warm_agent() -> None:
+    from backend.service.AgentService import get_shared_agent
+    start = time.monotonic()
+    get_shared_agent()
+    set_status("agent", True, f"图构建耗时 {time.monotonic() - start:.1f}s")
+
+
+def warm_llm() -> None:
+    if not WARMUP_PRIME_LLM:
+        return
+    from backend.agent.llm import prime_http_client
+    ok = prime_http_client()
+    set_status("llm", ok, "模型服务连接已预热" if ok else "模型服务暂不可达")
+
+
+def check_database() -> None:
+    """后台健康检查：替换已断开的空闲连接，并用一次往返确认数据库可用"""
+    try:
+        if is_postgres():
+            from backend.utils.pg_pool import get_pg_pool
+            pool = get_pg_pool()
+            pool.check()
+            with pool.connection(timeout=5) as conn:
+                conn.execute("SELECT 1;")
+            stats = pool.get_stats()
+            metrics.gauge("pg.pool.size", stats.get("pool_size", 0))
+            metrics.gauge("pg.pool.available", stats.get("pool_available", 0))
+            metrics.gauge("pg.pool.waiting", stats.get("requests_waiting", 0))
+            set_status("database", True, f"{stats.get('pool_size', 0)} 个连接")
+        elif is_sqlite():
+            from backend.utils.sqlite_db import get_sqlite_pool
+            with get_sqlite_pool().connection() as conn:
+                conn.execute("SELECT 1;")
+            set_status("database", True, "sqlite")
+    except Exception as e:
+        set_status("database", False, f"健康检查失败: {e}")
+        print(f"[Health] 数据库健康检查失败: {e}")
+
+
+def _warmup(steps: list) -> None:
+    start = time.monotonic()
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            set_status(name, False, f"预热失败: {e}")
+            print(f"[Warmup] {name} 预热失败: {e}")
+    metrics.observe("startup.warmup_seconds", time.monotonic() - start)
+    print(f"[Warmup] 预热完成，耗时 {time.monotonic() - start:.1f}s")
+    run_periodically("db-health-check", DB_POOL_CHECK_INTERVAL, check_database)
+
+
+def start_warmup() -> None:
+    """
+    应用启动时调用：在后台线程中预热，完成前 /readyz 返回 503，滚动发布时新实例预热完才接流量
+    STARTUP_WARMUP=0 时跳过预热，agent 在第一次对话时构建
+    """
+    global _warmup_started
+    if _warmup_started:
+        return
+    _warmup_started = True
+    if STARTUP_WARMUP:
+        steps = [("database", warm_database), ("agent", warm_agent), ("statements", warm_statements), ("llm", warm_llm)]
+    else:
+        set_status("agent", True, "按需构建")
+        steps = [("database", warm_database)]
+    threading.Thread(target=_warmup, args=(steps,), name="startup-warmup", daemon=True).start()
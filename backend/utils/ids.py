@@ -0,0 +1,43 @@
+import os
+import threading
+import time
+import uuid
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+# 幂等键派生 key 时使用的命名空间
+_IDEMPOTENCY_NAMESPACE = uuid.UUID("6f6d2a3e-6a1b-4f7e-9c55-2c1d0b7e8a41")
+
+
+def uuid7() -> str:
+    """
+    生成 UUIDv7（RFC 9562）：前 48 位为毫秒时间戳，同一毫秒内用 12 位计数器保证单调递增
+    新 key 总是落在 btree 索引的右端，插入局部性好
+    """
+    global _last_ms, _counter
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _last_ms = ms
+            _counter = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        else:
+            _counter += 1
+            if _counter > 0xFFF:
+                # 计数器溢出时借用下一毫秒
+                _last_ms += 1
+                _counter = 0
+            ms = _last_ms
+
+    value = (ms & ((1 << 48) - 1)) << 80
+    value |= 0x7 << 76
+    value |= _counter << 64
+    value |= 0b10 << 62
+    value |= int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    return str(uuid.UUID(int=value))
+
+
+def key_from_idempotency(scope: str, idempotency_key: str) -> str:
+    """由客户端幂等键确定性地派生记录 key，重试同一请求总是得到同一个 key"""
+    return str(uuid.uuid5(_IDEMPOTENCY_NAMESPACE, f"{scope}:{idempotency_key}"))
@@ -0,0 +1,182 @@
+import json
+import queue
+import threading
+import time
+import uuid
+from typing import Callable
+
+# 记忆命名空间类型，与 store 表 prefix 的第一段一致
+NAMESPACE_KINDS = ("profile", "todo", "instructions")
+
+# 跨进程失效广播使用的 NOTIFY 频道
+CHANNEL = "graphdo_invalidate"
+
+# 当前进程标识，用于忽略自己发出的广播
+PROCESS_ID = uuid.uuid4().hex
+
+_lock = threading.Lock()
+_versions: dict[tuple[str, str], int] = {}
+_listeners: list[Callable[[str, str, int], None]] = []
+# 广播连接断开重连后递增：期间的通知可能已丢失，所有带版本戳的缓存条目一并失效
+_epoch = 0
+
+_bus: "InvalidationBus | None" = None
+
+
+def _next_version(previous: int) -> int:
+    """版本号取纳秒时间戳并保证单调递增，便于不同进程产生的版本相互比较"""
+    return max(previous + 1, time.time_ns())
+
+
+def _notify_listeners(kind: str, user_id: str, version: int) -> None:
+    with _lock:
+        listeners = list(_listeners)
+    for listener in listeners:
+        try:
+            listener(kind, user_id, version)
+        except Exception as e:
+            print(f"[Invalidation] 监听者处理失败: {e}")
+
+
+def bump(kind: str, user_id: str) -> int:
+    """
+    标记用户某类记忆已被写入，递增其版本号并通知监听者；广播总线已启动时同时通知其他进程
+    :param kind: profile / todo / instructions
+    :param user_id: 用户id
+    :return: 新版本号
+    """
+    with _lock:
+        version = _next_version(_versions.get((kind, user_id), 0))
+        _versions[(kind, user_id)] = version
+
+    _notify_listeners(kind, user_id, version)
+    if _bus is not None:
+        _bus.publish(kind, user_id, version)
+    return version
+
+
+def apply_remote(kind: str, user_id: str, version: int) -> None:
+    """应用其他进程广播的版本号（只前进不后退），并通知本进程的监听者"""
+    with _lock:
+        if _versions.get((kind, user_id), 0) >= version:
+            return
+        _versions[(kind, user_id)] = version
+    _notify_listeners(kind, user_id, version)
+
+
+def current_version(kind: str, user_id: str) -> int:
+    """当前进程已知的版本号，0 表示本进程尚未观察到写入"""
+    with _lock:
+        return _versions.get((kind, user_id), 0)
+
+
+def version_stamp(user_id: str) -> tuple:
+    """用户全部记忆命名空间的版本戳，用于给缓存条目打标；任一命名空间写入或总线重连后都会变化"""
+    with _lock:
+        return (_epoch,) + tuple(_versions.get((kind, user_id), 0) for kind in NAMESPACE_KINDS)
+
+
+def namespace_stamp(kind: str, user_id: str) -> tuple:
+    """单个命名空间的版本戳"""
+    with _lock:
+        return _epoch, _versions.get((kind, user_id), 0)
+
+
+def add_listener(listener: Callable[[str, str, int], None]) -> None:
+    """注册写入监听者：listener(kind, user_id, version)，本进程与其他进程的写入都会触发"""
+    with _lock:
+        _listeners.append(listener)
+
+
+def is_coherent() -> bool:
+    """跨进程广播是否在线；不在线时本地版本号只反映本进程的写入"""
+    return _bus is not None and _bus.connected
+
+
+class InvalidationBus:
+    """
+    基于 Postgres LISTEN/NOTIFY 的失效广播，不依赖额外服务
+    - 发送：写入方调用 bump 后入队，由后台线程合并同一命名空间的多次 bump 后用连接池 NOTIFY
+    - 接收：共享 LISTEN 连接收到其他进程的广播后更新本地版本号
+    """
+
+    def __init__(self, pool, listener):
+        self.pool = pool
+        self.listener = listener
+        self._queue: "queue.Queue[tuple[str, str, int]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="invalidation-bus", daemon=True)
+
+    @property
+    def connected(self) -> bool:
+        return self.listener.connected
+
+    def start(self) -> None:
+        self.listener.subscribe(CHANNEL, self._on_notify)
+        self.listener.on_connect(self._on_reconnect)
+        self._thread.start()
+
+    def publish(self, kind: str, user_id: str, version: int) -> None:
+        self._queue.put((kind, user_id, version))
+
+    def _run(self) -> None:
+        while True:
+            pending = {}
+            kind, user_id, version = self._queue.get()
+            pending[(kind, user_id)] = version
+            # 合并短时间内堆积的广播
+            while True:
+                try:
+                    kind, user_id, version = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                pending[(kind, user_id)] = max(version, pending.get((kind, user_id), 0))
+
+            try:
+                with self.pool.connection() as conn:
+                    with conn.cursor() as cur:
+                        for (kind, user_id), version in pending.items():
+                            payload = json.dumps({
+                                "kind": kind,
+                                "user_id": user_id,
+                                "version": version,
+                                "origin": PROCESS_ID,
+                            })
+                            cur.execute("SELECT pg_notify(%s, %s);", (CHANNEL, payload))
+            except Exception as e:
+                print(f"[Invalidation] 广播失败: {e}")
+
+    @staticmethod
+    def _on_notify(payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except json.JSONDecodeError:
+            return
+        if message.get("origin") == PROCESS_ID:
+            return
+        apply_remote(message["kind"], message["user_id"], int(message["version"]))
+
+    @staticmethod
+    def _on_reconnect() -> None:
+        global _epoch
+        with _lock:
+            _epoch += 1
+            users = {user_id for _, user_id in _versions}
+        for user_id in users:
+            for kind in NAMESPACE_KINDS:
+                _notify_listeners(kind, user_id, current_version(kind, user_id))
+
+
+def start_invalidation_bus() -> None:
+    """应用启动时调用：建立跨进程失效广播"""
+    global _bus
+    if _bus is not None:
+        return
+    from backend.utils.pg_pool import get_pg_pool
+    from backend.utils.pg_listener import get_pg_listener
+    try:
+        bus = InvalidationBus(get_pg_pool(), get_pg_listener())
+        bus.start()
+        _bus = bus
+        print("[Invalidation] 跨进程失效广播已启动")
+    except Exception as e:
+        print(f"[Invalidation] 启动失效广播失败: {e}")
@@ -0,0 +1,43 @@
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    """进程内指标注册表：计数器、瞬时值与耗时统计，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = defaultdict(float)
+        self._gauges: dict[str, float] = {}
+        self._timings: dict[str, dict[str, float]] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        """记录一次耗时/大小观测值，保留 count/sum/max"""
+        with self._lock:
+            stat = self._timings.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+            stat["count"] += 1
+            stat["sum"] += value
+            stat["max"] = max(stat["max"], value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            timings = {
+                name: {**stat, "avg": stat["sum"] / stat["count"] if stat["count"] else 0.0}
+                for name, stat in self._timings.items()
+            }
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": timings,
+            }
+
+
+metrics = Metrics()
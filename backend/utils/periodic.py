@@ -0,0 +1,30 @@
+import threading
+import time
+from typing import Callable
+
+_started: set[str] = set()
+_lock = threading.Lock()
+
+
+def run_periodically(name: str, interval: float, fn: Callable[[], None]) -> bool:
+    """
+    启动一个每 interval 秒执行一次 fn 的守护线程（同名任务只启动一次）；首次执行在一个间隔之后
+    :return: 是否新启动了线程；interval <= 0 时不启动
+    """
+    if interval <= 0:
+        return False
+    with _lock:
+        if name in _started:
+            return False
+        _started.add(name)
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                fn()
+            except Exception as e:
+                print(f"[Periodic] {name} 执行失败: {e}")
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return True
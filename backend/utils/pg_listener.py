@@ -0,0 +1,111 @@
+import os
+import threading
+from typing import Callable
+
+import psycopg
+from dotenv import load_dotenv
+
+
+class PgListener:
+    """
+    进程内共享的 LISTEN 连接：一个后台线程持有一条独立的 autocommit 连接（不占用连接池），
+    按频道把 NOTIFY 的 payload 分发给回调；断线后自动重连并重新 LISTEN
+    """
+
+    def __init__(self, conninfo: str):
+        self.conninfo = conninfo
+        self._lock = threading.Lock()
+        self._callbacks: dict[str, list[Callable[[str], None]]] = {}
+        self._connect_callbacks: list[Callable[[], None]] = []
+        self._listening: set[str] = set()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.connected = False
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+        """订阅频道；channel 需为合法的 SQL 标识符"""
+        with self._lock:
+            self._callbacks.setdefault(channel, []).append(callback)
+
+    def on_connect(self, callback: Callable[[], None]) -> None:
+        """每次（重新）建立连接后回调；断线期间的通知已丢失，订阅方应借此丢弃本地缓存"""
+        with self._lock:
+            self._connect_callbacks.append(callback)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="pg-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while not self._stopped.is_set():
+            try:
+                with psycopg.connect(self.conninfo, autocommit=True) as conn:
+                    self._listening = set()
+                    self.connected = True
+                    backoff = 1.0
+                    print("[PG Listener] 已连接")
+                    self._listen_new_channels(conn)
+                    self._notify_connected()
+                    while not self._stopped.is_set():
+                        self._listen_new_channels(conn)
+                        for notify in conn.notifies(timeout=1.0):
+                            self._dispatch(notify.channel, notify.payload)
+            except Exception as e:
+                print(f"[PG Listener] 连接中断，{backoff:.0f}s 后重连: {e}")
+            finally:
+                self.connected = False
+            self._stopped.wait(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def _listen_new_channels(self, conn: psycopg.Connection) -> None:
+        with self._lock:
+            channels = set(self._callbacks) - self._listening
+        for channel in channels:
+            conn.execute(f"LISTEN {channel}")
+            self._listening.add(channel)
+
+    def _notify_connected(self) -> None:
+        with self._lock:
+            callbacks = list(self._connect_callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[PG Listener] 连接回调失败: {e}")
+
+    def _dispatch(self, channel: str, payload: str) -> None:
+        with self._lock:
+            callbacks = list(self._callbacks.get(channel, []))
+        for callback in callbacks:
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"[PG Listener] 处理 {channel} 通知失败: {e}")
+
+
+_listener: PgListener | None = None
+
+
+def get_pg_listener() -> PgListener:
+    """获取进程级 LISTEN 连接（首次调用时创建并启动）"""
+    global _listener
+    if _listener is None:
+        load_dotenv()
+        db_uri = os.getenv("DB_URI")
+        if not db_uri:
+            raise RuntimeError("未配置环境变量 DB_URI")
+        _listener = PgListener(db_uri)
+        _listener.start()
+    return _listener
+
+
+def stop_pg_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+        print("[PG Listener] 已停止")
@@ -1,29 +1,70 @@
 import os
+import threading
+import time
+from contextlib import contextmanager
 
 from litestar.config.app import AppConfig
 from psycopg_pool import ConnectionPool
 from psycopg.rows import dict_row
 from dotenv import load_dotenv
 
+from backend.utils.metrics import metrics
+from backend.utils.periodic import run_periodically
+
+load_dotenv()
+
+# 只读副本（可选）：配置后只读查询（DAO 的 get_by_id、agent 的记忆加载）优先走副本
+DB_REPLICA_URI = os.getenv("DB_REPLICA_URI")
+# 用户写入后的这段时间（秒）内，该用户的读取走主库，保证读到自己的写入
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+# 副本复制延迟超过该值（秒）或健康检查失败时，所有读取回退到主库
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+DB_REPLICA_HEALTH_INTERVAL = float(os.getenv("DB_REPLICA_HEALTH_INTERVAL", "5"))
+
+# 连接池大小：启动时预先建立 min_size 个连接；空闲超过 max_idle 秒的多余连接被关闭，连接最长使用 max_lifetime 秒
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "4"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "600"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))
+
 _pool: ConnectionPool | None = None
+_replica_pool: ConnectionPool | None = None
+_init_lock = threading.Lock()
 
-def init_pg_pool() -> ConnectionPool:
-    """初始化 PostgreSQL 连接池"""
-    global _pool
-    load_dotenv()
-    db_uri = os.getenv("DB_URI")
-    if not db_uri:
-        raise RuntimeError("未配置环境变量 DB_URI")
-
-    _pool = ConnectionPool(
-        conninfo=db_uri,
+def _create_pool(conninfo: str, name: str) -> ConnectionPool:
+    return ConnectionPool(
+        conninfo=conninfo,
+        name=name,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=max(DB_POOL_MAX_SIZE, DB_POOL_MIN_SIZE),
+        max_idle=DB_POOL_MAX_IDLE,
+        max_lifetime=DB_POOL_MAX_LIFETIME,
+        # 创建即在后台建立 min_size 个连接，预热时用 wait() 等待完成
+        open=True,
         kwargs={
             "row_factory": dict_row,
             "autocommit": True
         }
     )
-    print("[PG Pool] 初始化成功")
-    return _pool
+
+def init_pg_pool() -> ConnectionPool:
+    """初始化 PostgreSQL 连接池（幂等，进程内所有 DAO 与 agent 共享同一个池）"""
+    global _pool, _replica_pool
+    with _init_lock:
+        if _pool is not None:
+            return _pool
+        db_uri = os.getenv("DB_URI")
+        if not db_uri:
+            raise RuntimeError("未配置环境变量 DB_URI")
+
+        _pool = _create_pool(db_uri, "primary")
+        print("[PG Pool] 初始化成功")
+
+        if DB_REPLICA_URI:
+            _replica_pool = _create_pool(DB_REPLICA_URI, "replica")
+            _replica.start()
+            print("[PG Pool] 只读副本连接池初始化成功")
+        return _pool
 
 def on_startup_pg_pool(app_config: AppConfig) -> AppConfig:
     init_pg_pool()
@@ -37,7 +78,129 @@ def get_pg_pool() -> ConnectionPool:
 
 def close_pg_pool() -> None:
     """关闭连接池"""
-    global _pool
+    global _pool, _replica_pool
+    if _replica_pool is not None:
+        _replica_pool.close()
+        _replica_pool = None
     if _pool is not None:
         _pool.close()
+        _pool = None
         print("[PG Pool] 已关闭连接池")
+
+
+@contextmanager
+def try_advisory_lock(name: str):
+    """
+    不等待地尝试获取跨 worker 的会话级 advisory lock，yield 是否拿到（如周期任务只在一个 worker 中执行）
+    锁与连接绑定，持有期间占用一个连接池连接，退出上下文时释放
+    """
+    with init_pg_pool().connection() as conn:
+        acquired = conn.execute(
+            "SELECT pg_try_advisory_lock(hashtextextended(%s, 0)) AS acquired;", (name,)
+        ).fetchone()["acquired"]
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute("SELECT pg_advisory_unlock(hashtextextended(%s, 0));", (name,))
+
+
+class ReplicaRouter:
+    """
+    只读流量路由：
+    - 用户最近 DB_READ_YOUR_WRITES_SECONDS 秒内有写入（本进程或其他进程，经 invalidation 广播得知）时读主库
+    - 后台健康检查测量复制延迟；检查失败、延迟过大或查询时连接出错都会把副本标为不可用，下一次检查通过后恢复
+    """
+
+    def __init__(self, window: float = DB_READ_YOUR_WRITES_SECONDS, max_lag: float = DB_REPLICA_MAX_LAG):
+        self.window = window
+        self.max_lag = max_lag
+        self.healthy = False
+        self._lock = threading.Lock()
+        self._last_writes: dict[str, float] = {}
+
+    def start(self) -> None:
+        from backend.utils import invalidation
+        invalidation.add_listener(lambda kind, user_id, version: self.note_write(user_id))
+        self.check()
+        run_periodically("pg-replica-health", DB_REPLICA_HEALTH_INTERVAL, self.check)
+
+    def note_write(self, user_id: str) -> None:
+        with self._lock:
+            self._last_writes[user_id] = time.monotonic()
+
+    def recently_wrote(self, user_id: str | None) -> bool:
+        if user_id is None:
+            return False
+        with self._lock:
+            written_at = self._last_writes.get(user_id)
+        return written_at is not None and time.monotonic() - written_at < self.window
+
+    def check(self) -> None:
+        """测量复制延迟：WAL 已全部回放时延迟为 0（主库空闲时 replay 时间戳不再前进，不能直接相减）"""
+        sql = """
+            SELECT CASE
+                WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+            END AS lag;
+        """
+        try:
+            with _replica_pool.connection(timeout=5) as conn:
+                lag = float(conn.execute(sql).fetchone()["lag"])
+        except Exception as e:
+            self._set_healthy(False, f"健康检查失败: {e}")
+            return
+        metrics.gauge("pg.replica.lag_seconds", lag)
+        self._set_healthy(lag <= self.max_lag, f"复制延迟 {lag:.1f}s")
+
+        # 顺带清理过期的写入记录
+        now = time.monotonic()
+        with self._lock:
+            self._last_writes = {u: t for u, t in self._last_writes.items() if now - t < self.window}
+
+    def mark_failed(self, error: Exception) -> None:
+        """查询时副本连接出错：立即回退到主库，等待下一次健康检查恢复"""
+        self._set_healthy(False, f"查询失败: {error}")
+
+    def _set_healthy(self, healthy: bool, reason: str) -> None:
+        if healthy == self.healthy:
+            return
+        self.healthy = healthy
+        if healthy:
+            print(f"[PG Pool] 只读副本恢复可用（{reason}）")
+        else:
+            metrics.incr("pg.replica.failovers")
+            print(f"[PG Pool] 只读副本不可用，读取回退到主库（{reason}）")
+
+    def use_replica(self, user_id: str | None) -> bool:
+        if _replica_pool is None or not self.healthy:
+            return False
+        if self.recently_wrote(user_id):
+            metrics.incr("pg.reads.read_your_writes")
+            return False
+        return True
+
+
+_replica = ReplicaRouter()
+
+
+def use_replica(user_id: str | None = None) -> bool:
+    """该用户的这次读取是否可以走只读副本"""
+    return _replica.use_replica(user_id)
+
+
+def get_read_pool(user_id: str | None = None) -> ConnectionPool:
+    """只读查询使用的连接池：副本可用且用户近期没有写入时为副本，否则为主库"""
+    if use_replica(user_id):
+        metrics.incr("pg.reads.replica")
+        return _replica_pool
+    metrics.incr("pg.reads.primary")
+    return get_pg_pool()
+
+
+def get_replica_pool() -> ConnectionPool | None:
+    return _replica_pool
+
+
+def mark_replica_failed(error: Exception) -> None:
+    _replica.mark_failed(error)
@@ -0,0 +1,35 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+from backend.utils.metrics import metrics
+
+
+class SingleFlight:
+    """
+    合并并发的相同读取：同一 key 同时只有一个调用真正执行，其余调用等待并共享其结果（或异常）
+    只合并"同时在途"的调用，结束后立即移除，不做结果缓存；共享的结果调用方不应修改
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        metrics.incr(f"single_flight.{self.name}.calls")
+        task = self._inflight.get(key)
+        if task is not None:
+            metrics.incr(f"single_flight.{self.name}.coalesced")
+        else:
+            # 查询作为独立任务执行：发起者的请求被取消（如客户端断开）时查询照常完成，其他等待者不受影响
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        # shield：任一等待者（包括发起者）被取消都不会取消共享的查询
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # 没有等待者时避免 "exception was never retrieved" 警告
+            task.exception()
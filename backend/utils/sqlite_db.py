@@ -0,0 +1,153 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/graphdo.db")
+# 写锁等待时间（毫秒）：WAL 下读写互不阻塞，只有写与写之间需要等待
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# 每个连接的页缓存（KB）与内存映射大小（字节）
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+_lock = threading.Lock()
+_connections: dict[str, sqlite3.Connection] = {}
+_pool: "SqlitePool | None" = None
+
+
+def sqlite_connect(path: str = SQLITE_PATH) -> sqlite3.Connection:
+    """
+    打开一个调优过的连接：WAL（读写并发）、synchronous=NORMAL（WAL 下崩溃安全，只在断电时可能丢最后几个事务）、
+    内存临时表、较大的页缓存与 mmap；autocommit，跨线程共享（调用方负责串行使用）
+    """
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS};")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB};")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE};")
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.execute("PRAGMA foreign_keys=ON;")
+    return conn
+
+
+def get_sqlite_conn(name: str) -> sqlite3.Connection:
+    """
+    进程内共享的命名连接（checkpointer / store / dao 各一个）
+    SqliteSaver、SqliteStore 各自用锁串行使用自己的连接，分开连接可避免它们的事务互相穿插
+    """
+    with _lock:
+        conn = _connections.get(name)
+        if conn is None:
+            conn = _connections[name] = sqlite_connect()
+            print(f"[SQLite] 已打开连接 {name}: {SQLITE_PATH}")
+        return conn
+
+
+class _SqliteCursor:
+    """兼容 psycopg 游标用法的最小封装：%s 占位符、dict 行"""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+
+    def execute(self, sql: str, params=None) -> "_SqliteCursor":
+        sql = sql.replace("%%", "\0").replace("%s", "?").replace("\0", "%")
+        self._cursor.execute(sql, tuple(params) if params else ())
+        return self
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return dict(row) if row is not None else None
+
+    def fetchall(self):
+        return [dict(row) for row in self._cursor.fetchall()]
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    def close(self) -> None:
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _SqliteConnection:
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def cursor(self) -> _SqliteCursor:
+        return _SqliteCursor(self._conn.cursor())
+
+    def execute(self, sql: str, params=None) -> _SqliteCursor:
+        return self.cursor().execute(sql, params)
+
+    def commit(self) -> None:
+        # autocommit 连接；显式事务由调用方 BEGIN / COMMIT
+        if self._conn.in_transaction:
+            self._conn.commit()
+
+    def rollback(self) -> None:
+        if self._conn.in_transaction:
+            self._conn.rollback()
+
+
+class SqlitePool:
+    """
+    与 psycopg_pool.ConnectionPool 相同的 connection() 用法，供 BaseDao 复用同一套执行方法
+    单个共享连接，借出期间独占；上下文异常退出时回滚未提交的事务
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        conn.row_factory = sqlite3.Row
+        self._conn = conn
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def connection(self) -> Iterator[_SqliteConnection]:
+        with self._lock:
+            wrapped = _SqliteConnection(self._conn)
+            try:
+                yield wrapped
+            except BaseException:
+                wrapped.rollback()
+                raise
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def get_sqlite_pool() -> SqlitePool:
+    """DAO 使用的共享连接"""
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = SqlitePool(sqlite_connect())
+            print(f"[SQLite] DAO 连接已打开: {SQLITE_PATH}")
+        return _pool
+
+
+def close_sqlite() -> None:
+    """关闭所有共享连接"""
+    global _pool
+    with _lock:
+        closed = bool(_connections) or _pool is not None
+        for conn in _connections.values():
+            conn.close()
+        _connections.clear()
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+    if closed:
+        print("[SQLite] 已关闭连接")
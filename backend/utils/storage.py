@@ -0,0 +1,22 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 存储后端：
+# - postgres：默认，多实例部署（连接失败时 agent 回退到不持久化的内存存储）
+# - sqlite：单机部署，检查点、store 与 DAO 均落在本地 SQLite 文件（WAL 模式）
+# - memory：不持久化，仅用于开发调试
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "postgres").lower()
+
+if STORAGE_BACKEND not in ("postgres", "sqlite", "memory"):
+    raise RuntimeError(f"不支持的存储后端 STORAGE_BACKEND={STORAGE_BACKEND}")
+
+
+def is_postgres() -> bool:
+    return STORAGE_BACKEND == "postgres"
+
+
+def is_sqlite() -> bool:
+    return STORAGE_BACKEND == "sqlite"
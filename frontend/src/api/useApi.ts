@@ -329,6 +329,29 @@ export const deleteInstruction = async (key: string) => {
   }
 }
 
+// ==================== Change Feed ====================
+
+// 一条行级变更：insert / update 带 value（超长时只有 truncated），delete 只有 key；
+// 订阅方消费过慢丢弃了增量时推送 resync，需要整体重拉
+export interface ChangeEvent {
+  op: 'insert' | 'update' | 'delete' | 'resync'
+  kind: string
+  user_id: string
+  key?: string
+  value?: Record<string, any>
+  truncated?: boolean
+}
+
+// 订阅当前用户记忆的变更增量（SSE），返回 EventSource 以便在组件卸载时关闭
+export const subscribeChanges = (kinds: string[], onChange: (change: ChangeEvent) => void) => {
+  const source = new EventSource(
+    `${API_BASE_URL}/api/changes/${currentUserId.value}?kinds=${kinds.join(',')}`
+  )
+  const listener = (event: MessageEvent) => onChange(JSON.parse(event.data))
+  kinds.forEach(kind => source.addEventListener(kind, listener as EventListener))
+  return source
+}
+
 // ==================== Utility Functions ====================
 
 // 获取不同状态的css